@@ -0,0 +1,155 @@
+import time
+from collections import Counter
+from enum import StrEnum
+
+
+class Rejection(StrEnum):
+    handshake_busy = "handshake_busy"
+    handshake_rate = "handshake_rate"
+    thread_full = "thread_full"
+    user_rate = "user_rate"
+    thread_rate = "thread_rate"
+
+
+REJECTION_REASONS = {
+    Rejection.handshake_busy: "The server is busy accepting other connections; try again shortly.",
+    Rejection.handshake_rate: "Too many connection attempts; try again shortly.",
+    Rejection.thread_full: "This thread has reached its connection limit.",
+    Rejection.user_rate: "You are sending messages too quickly; this one was dropped.",
+    Rejection.thread_rate: "This thread is receiving too many messages; yours was dropped.",
+}
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, and bursts of up to `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+
+class KeyedBuckets:
+    """A token bucket per key, created on first use.
+
+    A bucket that has refilled completely is indistinguishable from a new
+    one, so every `sweep_every` calls those are dropped to bound memory.
+    """
+
+    def __init__(self, rate: float, burst: float, sweep_every: int = 4096):
+        self.rate = rate
+        self.burst = burst
+        self.sweep_every = sweep_every
+        self.buckets: dict[str, TokenBucket] = {}
+        self._calls = 0
+
+    def bucket(self, key: str, now: float) -> TokenBucket:
+        self._calls += 1
+        if self._calls >= self.sweep_every:
+            self._calls = 0
+            self.buckets = {
+                k: b for k, b in self.buckets.items() if b.refill(now) < b.burst
+            }
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+
+class AdmissionController:
+    """Decides, cheaply and without waiting, whether to let work in at the edge.
+
+    Connections are refused while `max_handshakes` are already in progress,
+    beyond `handshake_rate` per second, or when their thread already has
+    `max_connections_per_thread` on this worker. Chat messages are dropped
+    beyond `user_rate` per user or `thread_rate` per thread. A rate or
+    limit of 0 disables that check. Rejections are counted by reason.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_thread: int = 0,
+        max_handshakes: int = 0,
+        handshake_rate: float = 0.0,
+        handshake_burst: float = 0.0,
+        user_rate: float = 0.0,
+        user_burst: float = 0.0,
+        thread_rate: float = 0.0,
+        thread_burst: float = 0.0,
+    ):
+        self.max_connections_per_thread = max_connections_per_thread
+        self.max_handshakes = max_handshakes
+        now = time.monotonic()
+        self.handshake_bucket = (
+            TokenBucket(handshake_rate, max(handshake_burst, 1), now)
+            if handshake_rate
+            else None
+        )
+        self.user_buckets = (
+            KeyedBuckets(user_rate, max(user_burst, 1)) if user_rate else None
+        )
+        self.thread_buckets = (
+            KeyedBuckets(thread_rate, max(thread_burst, 1)) if thread_rate else None
+        )
+        self.handshakes = 0
+        self.rejections: Counter[Rejection] = Counter()
+
+    def _reject(self, reason: Rejection) -> Rejection:
+        self.rejections[reason] += 1
+        return reason
+
+    def begin_handshake(self) -> Rejection | None:
+        """Admit a new connection's handshake; pair with `end_handshake` if admitted."""
+        if self.max_handshakes and self.handshakes >= self.max_handshakes:
+            return self._reject(Rejection.handshake_busy)
+        if self.handshake_bucket is not None:
+            if self.handshake_bucket.refill(time.monotonic()) < 1:
+                return self._reject(Rejection.handshake_rate)
+            self.handshake_bucket.tokens -= 1
+        self.handshakes += 1
+        return None
+
+    def end_handshake(self):
+        self.handshakes -= 1
+
+    def admit_connection(
+        self, connections: dict[str, object], username: str
+    ) -> Rejection | None:
+        """Check a thread's local connections (by username) before adding `username`."""
+        if (
+            self.max_connections_per_thread
+            and username not in connections  # a reconnect replaces its old connection
+            and len(connections) >= self.max_connections_per_thread
+        ):
+            return self._reject(Rejection.thread_full)
+        return None
+
+    def admit_message(
+        self, thread_id: str, username: str, thread_wide: bool = True
+    ) -> Rejection | None:
+        """Take a token from the user's bucket and, if `thread_wide`, the thread's.
+
+        Neither is taken unless both are available.
+        """
+        now = time.monotonic()
+        user = None
+        if self.user_buckets is not None:
+            user = self.user_buckets.bucket(f"{thread_id}\x00{username}", now)
+            if user.refill(now) < 1:
+                return self._reject(Rejection.user_rate)
+        if thread_wide and self.thread_buckets is not None:
+            thread = self.thread_buckets.bucket(thread_id, now)
+            if thread.refill(now) < 1:
+                return self._reject(Rejection.thread_rate)
+            thread.tokens -= 1
+        if user is not None:
+            user.tokens -= 1
+        return None
@@ -0,0 +1,391 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import time
+from collections import Counter
+from typing import Callable, Protocol
+
+from lg_st_ws.common.models import PresenceMessage
+
+# thread_id, seq (None if published unsequenced), unstamped frame, coalesce key
+Deliver = Callable[[str, int | None, str, str | None], None]
+
+
+class Backplane(Protocol):
+    """Orders and distributes a thread's broadcasts and presence across workers.
+
+    Every frame published for a thread is assigned the thread's next sequence
+    number and delivered, in that order, to every worker subscribed to the
+    thread (including the publisher). Frames published with `sequenced`
+    false keep their place in that order but take no number. Joins and
+    leaves are turned into batched `PresenceMessage` deltas, delivered the
+    same way.
+    """
+
+    async def start(self, deliver: Deliver) -> None: ...
+
+    async def close(self) -> None: ...
+
+    async def subscribe(self, thread_id: str) -> None: ...
+
+    async def unsubscribe(self, thread_id: str) -> None: ...
+
+    async def publish(
+        self,
+        thread_id: str,
+        frame: str,
+        coalesce_key: str | None,
+        sequenced: bool = True,
+    ) -> None: ...
+
+    async def join(self, thread_id: str, username: str) -> None: ...
+
+    async def leave(self, thread_id: str, username: str) -> None: ...
+
+    async def presence(self, thread_id: str) -> tuple[list[str], int]:
+        """Users in the thread as of its latest presence delta, and that delta's version."""
+        ...
+
+
+class Sequencer:
+    """Per-thread sequence numbers, seeded from the clock in microseconds.
+
+    Seeding from the clock keeps numbers increasing across process restarts
+    and lets idle threads be forgotten without ever reusing a number.
+    """
+
+    def __init__(self):
+        self._next: dict[str, int] = {}
+
+    def next(self, thread_id: str) -> int:
+        seq = self._next.get(thread_id) or time.time_ns() // 1000
+        self._next[thread_id] = seq + 1
+        return seq
+
+    def forget(self, thread_id: str):
+        self._next.pop(thread_id, None)
+
+
+class Presence:
+    """Connection counts per user per thread, with changes batched into deltas.
+
+    A user is present while they have at least one connection. Arrivals and
+    departures are collected for `window` seconds, then `publish` is called
+    with one `PresenceMessage` frame listing who was added and removed. A
+    user who comes and goes within one window produces nothing. Each delta
+    bumps the thread's presence version, seeded from the clock like
+    `Sequencer`, so versions keep increasing after an empty thread is
+    forgotten.
+    """
+
+    def __init__(
+        self,
+        window: float = 0.25,
+        publish: Callable[[str, str, str | None], None] | None = None,
+    ):
+        self.window = window
+        self.publish = publish
+        self.threads: dict[str, Counter[str]] = {}
+        self.versions: dict[str, int] = {}
+        # thread_id -> username -> whether they were present at the last delta
+        self._changes: dict[str, dict[str, bool]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+
+    def join(self, thread_id: str, username: str):
+        users = self.threads.setdefault(thread_id, Counter())
+        users[username] += 1
+        if users[username] == 1:
+            self._changed(thread_id, username, was_present=False)
+
+    def leave(self, thread_id: str, username: str):
+        users = self.threads.get(thread_id)
+        if users is None or users[username] <= 0:
+            return
+        users[username] -= 1
+        if users[username] == 0:
+            del users[username]
+            self._changed(thread_id, username, was_present=True)
+        if not users:
+            del self.threads[thread_id]
+
+    def snapshot(self, thread_id: str) -> tuple[list[str], int]:
+        """Members as of the thread's latest delta, and its version.
+
+        Changes still waiting for the window are left out; they arrive as
+        the next delta.
+        """
+        current = self.threads.get(thread_id, {})
+        changes = self._changes.get(thread_id, {})
+        users = [u for u in current if changes.get(u, True)]
+        users += [
+            u for u, was_present in changes.items() if was_present and u not in current
+        ]
+        return users, self.versions.get(thread_id, 0)
+
+    def _changed(self, thread_id: str, username: str, was_present: bool):
+        if self.publish is None:
+            return
+        self._changes.setdefault(thread_id, {}).setdefault(username, was_present)
+        if thread_id not in self._timers:
+            self._timers[thread_id] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, thread_id
+            )
+
+    def _flush(self, thread_id: str):
+        del self._timers[thread_id]
+        changes = self._changes.pop(thread_id, {})
+        current = self.threads.get(thread_id, {})
+        added = [
+            u for u, was_present in changes.items() if not was_present and u in current
+        ]
+        removed = [
+            u for u, was_present in changes.items() if was_present and u not in current
+        ]
+        if added or removed:
+            version = (self.versions.get(thread_id) or time.time_ns() // 1000) + 1
+            self.versions[thread_id] = version
+            msg = PresenceMessage(
+                thread_id=thread_id, added=added, removed=removed, version=version
+            )
+            self.publish(thread_id, msg.unstamped_frame, msg.coalesce_key())
+        if not current:
+            self.versions.pop(thread_id, None)
+
+    def close(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._changes.clear()
+
+
+class InProcessBackplane:
+    """Single-process backplane: delivers straight back to the local ThreadManager."""
+
+    def __init__(self, presence_window: float = 0.25):
+        self.sequencer = Sequencer()
+        self.presence_state = Presence(presence_window, self._publish)
+        self.subscribed: set[str] = set()
+        self._deliver: Deliver | None = None
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    async def close(self) -> None:
+        self.presence_state.close()
+        self._deliver = None
+
+    async def subscribe(self, thread_id: str) -> None:
+        self.subscribed.add(thread_id)
+
+    async def unsubscribe(self, thread_id: str) -> None:
+        self.subscribed.discard(thread_id)
+        self.sequencer.forget(thread_id)
+
+    async def publish(
+        self,
+        thread_id: str,
+        frame: str,
+        coalesce_key: str | None,
+        sequenced: bool = True,
+    ) -> None:
+        self._publish(thread_id, frame, coalesce_key, sequenced)
+
+    def _publish(
+        self,
+        thread_id: str,
+        frame: str,
+        coalesce_key: str | None = None,
+        sequenced: bool = True,
+    ):
+        if thread_id in self.subscribed and self._deliver is not None:
+            seq = self.sequencer.next(thread_id) if sequenced else None
+            self._deliver(thread_id, seq, frame, coalesce_key)
+
+    async def join(self, thread_id: str, username: str) -> None:
+        self.presence_state.join(thread_id, username)
+
+    async def leave(self, thread_id: str, username: str) -> None:
+        self.presence_state.leave(thread_id, username)
+
+    async def presence(self, thread_id: str) -> tuple[list[str], int]:
+        return self.presence_state.snapshot(thread_id)
+
+
+# --- Unix socket broker protocol ---
+#
+# One message per line: a JSON header array, a tab, then the frame (if any).
+# Encoded frames never contain raw newlines, so no further escaping is needed.
+
+
+def encode_line(header: list, frame: str = "") -> bytes:
+    return f"{json.dumps(header)}\t{frame}\n".encode()
+
+
+def decode_line(line: bytes) -> tuple[list, str]:
+    header, _, frame = line.decode().rstrip("\n").partition("\t")
+    return json.loads(header), frame
+
+
+class UnixSocketBackplane:
+    """Cross-process backplane that talks to `lg_st_ws.backend.broker` over a Unix socket.
+
+    If the broker goes away, pending presence requests fail, and so do
+    publishes until the connection is back. Reconnection is retried with
+    backoff, and the subscriptions and joins the broker dropped with the
+    old connection are sent again. Frames published meanwhile are lost;
+    clients catch up as they would after a gap in the replay buffer.
+    """
+
+    def __init__(
+        self, path: str, reconnect_delay: float = 0.1, max_reconnect_delay: float = 5.0
+    ):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._read_task: asyncio.Task | None = None
+        self._deliver: Deliver | None = None
+        self._request_ids = itertools.count()
+        self._requests: dict[int, asyncio.Future] = {}
+        self._subscriptions: set[str] = set()
+        self._joined: Counter[tuple[str, str]] = Counter()
+
+    async def start(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+        await self._connect()
+        self._read_task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._read_task is not None:
+            self._read_task.cancel()
+        self._disconnect(ConnectionError("Backplane closed"))
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(
+            self.path, limit=2**24
+        )
+        # A new connection starts with nothing; restore what this worker had
+        for thread_id in self._subscriptions:
+            self._writer.write(encode_line(["sub", thread_id]))
+        for (thread_id, username), count in self._joined.items():
+            for _ in range(count):
+                self._writer.write(encode_line(["join", thread_id, username]))
+        await self._writer.drain()
+
+    def _disconnect(self, error: Exception):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        for future in self._requests.values():
+            if not future.done():
+                future.set_exception(error)
+        self._requests.clear()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await self._read_loop()
+                error: Exception = ConnectionError("The broker closed the connection")
+            except OSError as e:
+                error = e
+            self._disconnect(error)
+            loop.call_exception_handler(
+                {
+                    "message": "Lost the backplane broker; reconnecting",
+                    "exception": error,
+                }
+            )
+            delay = self.reconnect_delay
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    await self._connect()
+                    break
+                except OSError:
+                    delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _send(self, header: list, frame: str = ""):
+        if self._writer is None:
+            raise ConnectionError("Not connected to the backplane broker")
+        self._writer.write(encode_line(header, frame))
+        await self._writer.drain()
+
+    async def _send_state(self, header: list):
+        """Send a change that is sent again on reconnect if it doesn't get through."""
+        with contextlib.suppress(ConnectionError):
+            await self._send(header)
+
+    async def _read_loop(self):
+        while line := await self._reader.readline():
+            try:
+                header, frame = decode_line(line)
+                op = header[0]
+                if op == "msg":
+                    _, thread_id, seq, coalesce_key = header
+                    self._deliver(thread_id, seq, frame, coalesce_key)
+                elif op == "presence":
+                    _, request_id, users, version = header
+                    future = self._requests.pop(request_id, None)
+                    if future is not None and not future.done():
+                        future.set_result((users, version))
+            except Exception as e:
+                # One bad frame or delivery must not stop the others
+                asyncio.get_running_loop().call_exception_handler(
+                    {"message": "Failed to handle a backplane frame", "exception": e}
+                )
+
+    async def subscribe(self, thread_id: str) -> None:
+        self._subscriptions.add(thread_id)
+        await self._send_state(["sub", thread_id])
+
+    async def unsubscribe(self, thread_id: str) -> None:
+        self._subscriptions.discard(thread_id)
+        await self._send_state(["unsub", thread_id])
+
+    async def publish(
+        self,
+        thread_id: str,
+        frame: str,
+        coalesce_key: str | None,
+        sequenced: bool = True,
+    ) -> None:
+        await self._send(["pub", thread_id, coalesce_key, sequenced], frame)
+
+    async def join(self, thread_id: str, username: str) -> None:
+        self._joined[thread_id, username] += 1
+        await self._send_state(["join", thread_id, username])
+
+    async def leave(self, thread_id: str, username: str) -> None:
+        if self._joined[thread_id, username] <= 0:
+            return
+        self._joined[thread_id, username] -= 1
+        if not self._joined[thread_id, username]:
+            del self._joined[thread_id, username]
+        await self._send_state(["leave", thread_id, username])
+
+    async def presence(self, thread_id: str) -> tuple[list[str], int]:
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = future
+        try:
+            await self._send(["presence", thread_id, request_id])
+        except ConnectionError:
+            self._requests.pop(request_id, None)
+            raise
+        return await future
+
+
+def get_backplane(kind: str, path: str, presence_window: float = 0.25) -> Backplane:
+    """Build the backplane selected by `BACKPLANE` in config.
+
+    With the Unix socket backplane, presence is batched by the broker, which
+    takes its own `--presence-window`.
+    """
+    if kind == "memory":
+        return InProcessBackplane(presence_window)
+    if kind == "unix":
+        return UnixSocketBackplane(path)
+    raise ValueError(f"Unknown backplane: {kind}")
@@ -0,0 +1,167 @@
+"""Local pub/sub broker for running the backend with several workers.
+
+    python -m lg_st_ws.backend.broker --path /tmp/lg_st_ws.sock
+
+Workers connect through `UnixSocketBackplane` (BACKPLANE=unix). The broker
+sequences every thread's broadcasts, relays them to the workers subscribed
+to that thread, and tracks presence across all workers, publishing batched
+presence deltas to each thread.
+
+Each worker's relayed frames go through its own bounded queue, so a worker
+that falls behind only delays itself. When that queue is full,
+`--slow-consumer-policy` decides what gives, as it does for websocket
+clients.
+"""
+
+import argparse
+import asyncio
+import os
+
+from lg_st_ws.backend.backplane import Presence, Sequencer, decode_line, encode_line
+from lg_st_ws.backend.fanout import MERGES, ConnectionWriter, Frame, SlowConsumerPolicy
+from lg_st_ws.common.config import SLOW_CONSUMER_POLICY
+
+
+class WorkerStream:
+    """A worker's connection, as the socket a `ConnectionWriter` drains into."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def send_bytes(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def close(self, code: int | None = None):
+        self.writer.close()
+
+
+class Broker:
+    def __init__(
+        self,
+        presence_window: float = 0.25,
+        max_queue: int = 8192,
+        policy: SlowConsumerPolicy = SlowConsumerPolicy.drop_oldest,
+    ):
+        self.sequencer = Sequencer()
+        self.presence = Presence(presence_window, self.publish)
+        self.max_queue = max_queue
+        self.policy = policy
+        self.subscribers: dict[str, set[ConnectionWriter]] = {}
+
+    def publish(
+        self,
+        thread_id: str,
+        frame: str,
+        coalesce_key: str | None = None,
+        sequenced: bool = True,
+    ):
+        seq = self.sequencer.next(thread_id) if sequenced else None
+        # One worker's queue carries many threads. Deltas would have to be
+        # decoded to be merged, so they are left for the worker to coalesce.
+        key = None
+        if coalesce_key is not None and coalesce_key not in MERGES:
+            key = (thread_id, coalesce_key)
+        out = Frame(
+            encode_line(["msg", thread_id, seq, coalesce_key], frame),  # type: ignore[arg-type]
+            seq,
+            key,  # type: ignore[arg-type]
+        )
+        for subscriber in self.subscribers.get(thread_id, ()):
+            subscriber.enqueue(out)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscriptions: set[str] = set()
+        joined: list[tuple[str, str]] = []
+        # The disconnect policy closes the stream, which ends the read loop below
+        out = ConnectionWriter(WorkerStream(writer), self.max_queue, self.policy)  # type: ignore[arg-type]
+        out.start()
+        try:
+            while line := await reader.readline():
+                header, frame = decode_line(line)
+                op, thread_id = header[0], header[1]
+                if op == "pub":
+                    self.publish(thread_id, frame, header[2], header[3])
+                elif op == "sub":
+                    subscriptions.add(thread_id)
+                    self.subscribers.setdefault(thread_id, set()).add(out)
+                elif op == "unsub":
+                    subscriptions.discard(thread_id)
+                    self._unsubscribe(thread_id, out)
+                elif op == "join":
+                    self.presence.join(thread_id, header[2])
+                    joined.append((thread_id, header[2]))
+                elif op == "leave":
+                    if (thread_id, header[2]) in joined:
+                        joined.remove((thread_id, header[2]))
+                        self.presence.leave(thread_id, header[2])
+                elif op == "presence":
+                    # A reply, not a relayed frame: never queued, so never dropped
+                    users, version = self.presence.snapshot(thread_id)
+                    writer.write(encode_line(["presence", header[2], users, version]))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            # A worker that goes away takes its subscriptions and users with it
+            for thread_id in subscriptions:
+                self._unsubscribe(thread_id, out)
+            for thread_id, username in joined:
+                self.presence.leave(thread_id, username)
+            out.close()
+            writer.close()
+
+    def _unsubscribe(self, thread_id: str, out: ConnectionWriter):
+        subscribers = self.subscribers.get(thread_id)
+        if subscribers is None:
+            return
+        subscribers.discard(out)
+        if not subscribers:
+            del self.subscribers[thread_id]
+            self.sequencer.forget(thread_id)
+
+
+async def serve(
+    path: str,
+    presence_window: float = 0.25,
+    max_queue: int = 8192,
+    policy: SlowConsumerPolicy = SlowConsumerPolicy.drop_oldest,
+):
+    if os.path.exists(path):
+        os.remove(path)
+    broker = Broker(presence_window, max_queue, policy)
+    server = await asyncio.start_unix_server(broker.handle, path, limit=2**24)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default="/tmp/lg_st_ws.sock")
+    parser.add_argument(
+        "--presence-window",
+        type=float,
+        default=0.25,
+        help="seconds to batch joins and leaves",
+    )
+    parser.add_argument(
+        "--max-queue", type=int, default=8192, help="frames queued per worker"
+    )
+    parser.add_argument(
+        "--slow-consumer-policy",
+        choices=[p.value for p in SlowConsumerPolicy],
+        default=SLOW_CONSUMER_POLICY,
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        serve(
+            args.path,
+            args.presence_window,
+            args.max_queue,
+            SlowConsumerPolicy(args.slow_consumer_policy),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
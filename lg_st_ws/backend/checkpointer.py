@@ -0,0 +1,912 @@
+import asyncio
+import atexit
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator, Sequence
+from typing import Any
+
+import ormsgpack
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from lg_st_ws.backend.metrics import CHECKPOINT_READ_SECONDS, CHECKPOINT_WRITE_SECONDS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS latest (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB NOT NULL,
+    base_version TEXT,
+    depth INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+_INSERT_CHECKPOINT = (
+    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_UPSERT_LATEST = (
+    "INSERT INTO latest VALUES (?, ?, ?) "
+    "ON CONFLICT (thread_id, checkpoint_ns) DO UPDATE SET checkpoint_id = excluded.checkpoint_id "
+    "WHERE excluded.checkpoint_id > latest.checkpoint_id"
+)
+_INSERT_BLOB = "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+_INSERT_WRITE = "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_REPLACE_WRITE = "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+# No stored value: unlike None, which is a channel value in its own right
+_MISSING = object()
+
+
+class SQLiteSaver(BaseCheckpointSaver[int]):
+    """Durable checkpointer on a local SQLite database in WAL mode.
+
+    Storage is append-only. List channels such as `messages` are written as
+    deltas: when a new value extends the previously saved one, only the
+    appended tail is serialized, with a full snapshot every `snapshot_every`
+    versions to bound the replay chain.
+
+    Writes are buffered and committed in batches by a background thread, at
+    most `flush_interval` seconds or `batch_size` statements apart; reads
+    flush first, so they always see earlier writes. The latest value of
+    recently used channels is kept deserialized in an LRU cache, so loading
+    a hot thread's state does not touch the database or re-decode history.
+
+    Call `close` to commit what is still buffered; it also runs at
+    interpreter exit if nothing called it before.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        serde: SerializerProtocol | None = None,
+        batch_size: int = 256,
+        flush_interval: float = 0.05,
+        snapshot_every: int = 256,
+        cache_size: int = 1024,
+    ):
+        super().__init__(serde=serde)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.snapshot_every = snapshot_every
+        self.cache_size = cache_size
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._pending: list[tuple[str, tuple]] = []
+        # (thread_id, checkpoint_ns, channel) -> (version, value, delta depth)
+        self._values: OrderedDict[tuple[str, str, str], tuple[Any, Any, int]] = (
+            OrderedDict()
+        )
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # --- batching ---
+
+    def _enqueue(self, sql: str, params: tuple):
+        self._pending.append((sql, params))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            self.conn.execute("BEGIN")
+            try:
+                for sql, params in pending:
+                    self.conn.execute(sql, params)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                self._pending[:0] = pending
+                raise
+
+    def close(self):
+        if self._closed:
+            return
+        atexit.unregister(self.close)
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        self.conn.close()
+
+    # --- channel values ---
+
+    def _cache_value(self, key: tuple[str, str, str], version, value, depth: int):
+        self._values[key] = (version, value, depth)
+        self._values.move_to_end(key)
+        if len(self._values) > self.cache_size:
+            self._values.popitem(last=False)
+
+    def _load_value(self, thread_id: str, checkpoint_ns: str, channel: str, version):
+        key = (thread_id, checkpoint_ns, channel)
+        cached = self._values.get(key)
+        if cached is not None and cached[0] == version:
+            self._values.move_to_end(key)
+            value = cached[1]
+            return list(value) if isinstance(value, list) else value
+        # Walk the delta chain back to its snapshot, then replay forwards
+        chain = []
+        ver = version
+        while ver is not None:
+            row = self.conn.execute(
+                "SELECT type, blob, base_version, depth FROM blobs "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                (thread_id, checkpoint_ns, channel, str(ver)),
+            ).fetchone()
+            if row is None:
+                return _MISSING
+            chain.append(row)
+            ver = row[2]
+        type_, blob, _, depth = chain.pop()
+        if type_ == "empty":
+            return _MISSING
+        value = self.serde.loads_typed((type_, blob))
+        while chain:
+            type_, blob, _, depth = chain.pop()
+            value = value + self.serde.loads_typed((type_, blob))
+        self._cache_value(key, version, value, depth)
+        return list(value) if isinstance(value, list) else value
+
+    def _put_value(
+        self, thread_id: str, checkpoint_ns: str, channel: str, version, value
+    ):
+        key = (thread_id, checkpoint_ns, channel)
+        cached = self._values.get(key)
+        base_version, depth, payload = None, 0, value
+        if isinstance(value, list) and cached is not None:
+            prev_version, prev, prev_depth = cached
+            if (
+                isinstance(prev, list)
+                and prev_depth + 1 < self.snapshot_every
+                and len(value) >= len(prev)
+                and all(a is b for a, b in zip(prev, value))
+            ):
+                base_version, depth, payload = (
+                    prev_version,
+                    prev_depth + 1,
+                    value[len(prev) :],
+                )
+        type_, blob = self.serde.dumps_typed(payload)
+        self._enqueue(
+            _INSERT_BLOB,
+            (
+                thread_id,
+                checkpoint_ns,
+                channel,
+                str(version),
+                type_,
+                blob,
+                None if base_version is None else str(base_version),
+                depth,
+            ),
+        )
+        self._cache_value(
+            key, version, list(value) if isinstance(value, list) else value, depth
+        )
+
+    # --- BaseCheckpointSaver ---
+
+    def _row_to_tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, type_, ckpt, md_type, md = row
+        checkpoint: Checkpoint = self.serde.loads_typed((type_, ckpt))
+        channel_values = {}
+        for channel, version in checkpoint["channel_versions"].items():
+            value = self._load_value(thread_id, checkpoint_ns, channel, version)
+            if value is not _MISSING:
+                channel_values[channel] = value
+        writes = self.conn.execute(
+            "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        writes.sort(key=lambda w: writes_sort_key(w[5], w[0], w[1]))
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=self.serde.loads_typed((md_type, md)),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((t, v)))
+                for task_id, _, channel, t, v, _ in writes
+            ],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            self.flush()
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    "SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                    "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT c.checkpoint_id, c.parent_checkpoint_id, c.type, c.checkpoint, c.metadata_type, c.metadata "
+                    "FROM latest l JOIN checkpoints c USING (thread_id, checkpoint_ns, checkpoint_id) "
+                    "WHERE l.thread_id = ? AND l.checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._row_to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (
+                checkpoint_ns := config["configurable"].get("checkpoint_ns")
+            ) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            self.flush()
+            rows = self.conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                f"metadata_type, metadata FROM checkpoints {where} ORDER BY checkpoint_id DESC",
+                params,
+            ).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed((row[4], row[5]))
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                results.append(self._row_to_tuple(thread_id, checkpoint_ns, row))
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        values: dict[str, Any] = c.pop("channel_values")  # type: ignore[misc]
+        with self._lock:
+            for channel, version in new_versions.items():
+                if channel in values:
+                    self._put_value(
+                        thread_id, checkpoint_ns, channel, version, values[channel]
+                    )
+                else:
+                    self._enqueue(
+                        _INSERT_BLOB,
+                        (
+                            thread_id,
+                            checkpoint_ns,
+                            channel,
+                            str(version),
+                            "empty",
+                            b"",
+                            None,
+                            0,
+                        ),
+                    )
+                    self._values.pop((thread_id, checkpoint_ns, channel), None)
+            type_, ckpt = self.serde.dumps_typed(c)
+            md_type, md = self.serde.dumps_typed(
+                get_checkpoint_metadata(config, metadata)
+            )
+            self._enqueue(
+                _INSERT_CHECKPOINT,
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    ckpt,
+                    md_type,
+                    md,
+                ),
+            )
+            self._enqueue(_UPSERT_LATEST, (thread_id, checkpoint_ns, checkpoint["id"]))
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            for idx, (channel, value) in enumerate(writes):
+                idx = WRITES_IDX_MAP.get(channel, idx)
+                type_, blob = self.serde.dumps_typed(value)
+                self._enqueue(
+                    _INSERT_WRITE if idx >= 0 else _REPLACE_WRITE,
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint_id,
+                        task_id,
+                        idx,
+                        channel,
+                        type_,
+                        blob,
+                        task_path,
+                    ),
+                )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self.flush()
+            self.conn.execute("BEGIN")
+            for table in ("checkpoints", "latest", "blobs", "writes"):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)
+                )
+            self.conn.execute("COMMIT")
+            for key in [k for k in self._values if k[0] == thread_id]:
+                del self._values[key]
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in results:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(
+            self.put_writes, config, writes, task_id, task_path
+        )
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+def _running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # someone else's
+    return True
+
+
+def _write_spill(path: str, record: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(zlib.compress(ormsgpack.packb(record), 1))
+    os.replace(path + ".tmp", path)
+
+
+def _read_spill(path: str) -> dict:
+    with open(path, "rb") as f:
+        return ormsgpack.unpackb(zlib.decompress(f.read()))
+
+
+class SpillingSaver(InMemorySaver):
+    """In-memory checkpointer that can move idle threads out to local files.
+
+    `evict` writes everything stored for a thread to one msgpack file,
+    deflated, under `spill_dir`, and drops it from memory. The next read or
+    write for that thread loads it back first, so eviction is invisible to
+    callers. Which threads to evict, and when, is up to `ThreadEvictor`.
+
+    The async methods, which are what a graph uses, encode and decode spill
+    files in a worker thread (`aevict`, and loads on first use), so the
+    event loop only moves the thread's entries in and out of the dicts.
+
+    Serialized bytes held per thread are tallied as they are stored, and
+    `last_used` keeps resident threads in least recently used order.
+    Each process spills to its own subdirectory of `spill_root`, named by
+    its PID, so workers sharing the root never touch each other's files.
+    `clear_spill_dir` empties it, and removes those of processes that have
+    exited, since the rest of their state went with them.
+    """
+
+    def __init__(self, spill_root: str, *, serde: SerializerProtocol | None = None):
+        super().__init__(serde=serde)
+        self.spill_root = spill_root
+        self.sizes: dict[str, int] = {}
+        self.last_used: OrderedDict[str, float] = OrderedDict()
+        self.spilled: set[str] = set()
+        self.evictions = 0
+        self.reloads = 0
+        self._blob_keys: dict[str, set[tuple]] = {}
+        self._write_keys: dict[str, set[tuple]] = {}
+        # Threads taken out of memory whose file is still being written
+        self._spilling: dict[str, dict] = {}
+        self._loading: dict[str, asyncio.Task] = {}
+
+    @property
+    def spill_dir(self) -> str:
+        # Read per call, so a saver built before a fork spills per worker
+        return os.path.join(self.spill_root, str(os.getpid()))
+
+    def clear_spill_dir(self):
+        """Create an empty `spill_dir`; remove those left by exited processes."""
+        os.makedirs(self.spill_root, exist_ok=True)
+        for name in os.listdir(self.spill_root):
+            path = os.path.join(self.spill_root, name)
+            if name.isdigit() and os.path.isdir(path) and not _running(int(name)):
+                shutil.rmtree(path, ignore_errors=True)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        os.makedirs(self.spill_dir)
+
+    def resident_bytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def _path(self, thread_id: str) -> str:
+        name = hashlib.sha1(thread_id.encode()).hexdigest()
+        return os.path.join(self.spill_dir, f"{name}.spill")
+
+    def _touch(self, thread_id: str):
+        if thread_id in self._spilling:
+            # Not on disk yet: `aevict` sees it is back and drops the file
+            self._restore(thread_id, self._spilling.pop(thread_id))
+        elif thread_id in self.spilled:
+            self._restore(thread_id, _read_spill(self._path(thread_id)))
+            self._spilled_back(thread_id)
+        self.last_used[thread_id] = time.monotonic()
+        self.last_used.move_to_end(thread_id)
+
+    async def _atouch(self, thread_id: str):
+        if thread_id in self.spilled:
+            loading = self._loading.get(thread_id)
+            if loading is None:
+                loading = self._loading[thread_id] = asyncio.create_task(
+                    self._load(thread_id)
+                )
+            # Shared by every caller waiting on the thread; not theirs to cancel
+            await asyncio.shield(loading)
+        self._touch(thread_id)
+
+    async def _load(self, thread_id: str):
+        try:
+            record = await asyncio.to_thread(_read_spill, self._path(thread_id))
+        except FileNotFoundError:
+            if thread_id in self.spilled:
+                raise
+            return  # loaded by a sync call, or deleted, meanwhile
+        finally:
+            del self._loading[thread_id]
+        if thread_id in self.spilled:
+            self._restore(thread_id, record)
+            self._spilled_back(thread_id)
+
+    def _spilled_back(self, thread_id: str):
+        os.remove(self._path(thread_id))
+        self.spilled.discard(thread_id)
+        self.reloads += 1
+
+    def _grow(self, thread_id: str, size: int):
+        self.sizes[thread_id] = self.sizes.get(thread_id, 0) + size
+
+    # --- spilling ---
+
+    def evict(self, thread_id: str) -> int:
+        """Spill `thread_id` to disk; return the number of bytes it held in memory."""
+        if thread_id not in self.last_used:
+            return 0
+        size, record = self._take(thread_id)
+        _write_spill(self._path(thread_id), record)
+        self.spilled.add(thread_id)
+        self.evictions += 1
+        return size
+
+    async def aevict(self, thread_id: str) -> int:
+        """`evict`, writing the file in a worker thread.
+
+        The thread is out of memory from the start; if it is used before
+        the file is written, it is put straight back and the file dropped.
+        Calls must not overlap for the same thread.
+        """
+        if thread_id not in self.last_used:
+            return 0
+        size, record = self._take(thread_id)
+        self._spilling[thread_id] = record
+        path = self._path(thread_id)
+        try:
+            await asyncio.to_thread(_write_spill, path, record)
+        except BaseException:
+            if self._spilling.pop(thread_id, None) is record:
+                self._restore(thread_id, record)
+                self.last_used[thread_id] = time.monotonic()
+            raise
+        if self._spilling.pop(thread_id, None) is not record:
+            # Used or deleted while the file was written
+            os.remove(path)
+            return 0
+        self.spilled.add(thread_id)
+        self.evictions += 1
+        return size
+
+    def _take(self, thread_id: str) -> tuple[int, dict]:
+        """Remove `thread_id` from memory; return its size and a spill record."""
+        storage = self.storage.pop(thread_id, {})
+        blobs = [(k, self.blobs.pop(k)) for k in self._blob_keys.pop(thread_id, ())]
+        writes = [(k, self.writes.pop(k)) for k in self._write_keys.pop(thread_id, ())]
+        record = {
+            "storage": [
+                [ns, checkpoint_id, *checkpoint, *metadata, parent]
+                for ns, checkpoints in storage.items()
+                for checkpoint_id, (checkpoint, metadata, parent) in checkpoints.items()
+            ],
+            "blobs": [
+                [ns, channel, version, *value]
+                for (_, ns, channel, version), value in blobs
+            ],
+            "writes": [
+                [ns, checkpoint_id, task_id, idx, channel, *value, task_path]
+                for (_, ns, checkpoint_id), stored in writes
+                for (task_id, idx), (_, channel, value, task_path) in stored.items()
+            ],
+        }
+        del self.last_used[thread_id]
+        return self.sizes.pop(thread_id, 0), record
+
+    def _restore(self, thread_id: str, record: dict):
+        size = 0
+        for ns, checkpoint_id, c_type, c_blob, m_type, m_blob, parent in record[
+            "storage"
+        ]:
+            self.storage[thread_id][ns][checkpoint_id] = (
+                (c_type, c_blob),
+                (m_type, m_blob),
+                parent,
+            )
+            size += len(c_blob) + len(m_blob)
+        blob_keys = self._blob_keys.setdefault(thread_id, set())
+        for ns, channel, version, type_, blob in record["blobs"]:
+            key = (thread_id, ns, channel, version)
+            self.blobs[key] = (type_, blob)
+            blob_keys.add(key)
+            size += len(blob)
+        write_keys = self._write_keys.setdefault(thread_id, set())
+        for ns, checkpoint_id, task_id, idx, channel, type_, blob, task_path in record[
+            "writes"
+        ]:
+            key = (thread_id, ns, checkpoint_id)
+            self.writes[key][(task_id, idx)] = (
+                task_id,
+                channel,
+                (type_, blob),
+                task_path,
+            )
+            write_keys.add(key)
+            size += len(blob)
+        self._grow(thread_id, size)
+
+    # --- BaseCheckpointSaver ---
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        self._touch(config["configurable"]["thread_id"])
+        return super().get_tuple(config)
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        # Without a thread, only resident threads are listed
+        if config is not None:
+            self._touch(config["configurable"]["thread_id"])
+        return super().list(config, filter=filter, before=before, limit=limit)
+
+    def get_delta_channel_history(self, *, config: RunnableConfig, channels):
+        self._touch(config["configurable"]["thread_id"])
+        return super().get_delta_channel_history(config=config, channels=channels)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        self._touch(thread_id)
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        c_typed, m_typed, _ = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+        size = len(c_typed[1]) + len(m_typed[1])
+        blob_keys = self._blob_keys.setdefault(thread_id, set())
+        for channel, version in new_versions.items():
+            key = (thread_id, checkpoint_ns, channel, version)
+            blob_keys.add(key)
+            size += len(self.blobs[key][1])
+        self._grow(thread_id, size)
+        return saved
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        self._touch(thread_id)
+        key = (
+            thread_id,
+            config["configurable"].get("checkpoint_ns", ""),
+            config["configurable"]["checkpoint_id"],
+        )
+        before = sum(len(w[2][1]) for w in self.writes.get(key, {}).values())
+        super().put_writes(config, writes, task_id, task_path)
+        after = sum(len(w[2][1]) for w in self.writes.get(key, {}).values())
+        self._write_keys.setdefault(thread_id, set()).add(key)
+        self._grow(thread_id, after - before)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self._spilling.pop(thread_id, None)
+        if thread_id in self.spilled:
+            self.spilled.discard(thread_id)
+            os.remove(self._path(thread_id))
+        self.storage.pop(thread_id, None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+        for key in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        self.sizes.pop(thread_id, None)
+        self.last_used.pop(thread_id, None)
+
+    # The sync methods above find the thread already loaded by these
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        await self._atouch(config["configurable"]["thread_id"])
+        return await super().aget_tuple(config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        if config is not None:
+            await self._atouch(config["configurable"]["thread_id"])
+        async for item in super().alist(
+            config, filter=filter, before=before, limit=limit
+        ):
+            yield item
+
+    async def aget_delta_channel_history(self, *, config: RunnableConfig, channels):
+        await self._atouch(config["configurable"]["thread_id"])
+        return await super().aget_delta_channel_history(
+            config=config, channels=channels
+        )
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        await self._atouch(config["configurable"]["thread_id"])
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await self._atouch(config["configurable"]["thread_id"])
+        return await super().aput_writes(config, writes, task_id, task_path)
+
+
+class TimedSaver(BaseCheckpointSaver):
+    """Wraps a checkpointer to record read and write latency in /metrics."""
+
+    def __init__(self, saver: BaseCheckpointSaver):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+
+    def __getattr__(self, name: str):
+        return getattr(self.saver, name)
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        with CHECKPOINT_READ_SECONDS.time():
+            return self.saver.get_tuple(config)
+
+    def list(
+        self, config: RunnableConfig | None, **kwargs
+    ) -> Iterator[CheckpointTuple]:
+        return self.saver.list(config, **kwargs)
+
+    def put(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        with CHECKPOINT_WRITE_SECONDS.time():
+            return self.saver.put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path="") -> None:
+        with CHECKPOINT_WRITE_SECONDS.time():
+            return self.saver.put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        return self.saver.delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        with CHECKPOINT_READ_SECONDS.time():
+            return await self.saver.aget_tuple(config)
+
+    async def alist(
+        self, config: RunnableConfig | None, **kwargs
+    ) -> AsyncIterator[CheckpointTuple]:
+        async for item in self.saver.alist(config, **kwargs):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        with CHECKPOINT_WRITE_SECONDS.time():
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path="") -> None:
+        with CHECKPOINT_WRITE_SECONDS.time():
+            return await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self.saver.adelete_thread(thread_id)
+
+
+def get_checkpointer(
+    kind: str, path: str, spill_path: str | None = None
+) -> BaseCheckpointSaver:
+    """Build the checkpointer selected by `CHECKPOINTER` in config.
+
+    In memory, idle threads can be spilled under `spill_path` if it is set.
+    """
+    if kind == "memory":
+        return SpillingSaver(spill_path) if spill_path else InMemorySaver()
+    if kind == "sqlite":
+        return SQLiteSaver(path)
+    raise ValueError(f"Unknown checkpointer: {kind}")
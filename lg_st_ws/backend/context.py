@@ -0,0 +1,101 @@
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+
+def inject_username(msg: BaseMessage) -> BaseMessage:
+    """Prefix a message's content with its author and timestamp for the prompt."""
+    if isinstance(msg, HumanMessage):
+        username = msg.metadata["username"]
+        time_str = msg.metadata["timestamp"]
+        content = msg.content
+        new_content = f"**{username}** [{time_str}]: {content}"
+        msg = HumanMessage(content=new_content)
+    elif isinstance(msg, AIMessage):
+        username = msg.response_metadata["username"]
+        timestamp = msg.response_metadata["timestamp"]
+        content = msg.content
+        new_content = f"**{username}** [{timestamp}]: {content}"
+        msg = AIMessage(content=new_content)
+    return msg
+
+
+class ContextBuilder:
+    """Builds a token-bounded prompt window over a thread's messages.
+
+    Messages at or after `summarized_count` (kept in graph state) are the
+    live window; everything before it is represented by the rolling summary.
+    Once the live window grows past `max_tokens` the oldest part of it is
+    folded away, leaving roughly `keep_tokens` of recent messages verbatim.
+
+    Formatted messages and their token counts are cached by message id, so
+    each turn only formats what is new.
+    """
+
+    def __init__(self, max_tokens: int, keep_tokens: int, cache_size: int = 10_000):
+        self.max_tokens = max_tokens
+        self.keep_tokens = min(keep_tokens, max_tokens)
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, tuple[BaseMessage, int]] = OrderedDict()
+
+    def formatted(self, msg: BaseMessage) -> tuple[BaseMessage, int]:
+        key = msg.id
+        if key is not None and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        formatted = inject_username(msg)
+        entry = (formatted, count_tokens_approximately([formatted]))
+        if key is not None:
+            self._cache[key] = entry
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+    def _cut(self, messages: list[BaseMessage], start: int, budget: int) -> int:
+        """Index of the oldest message after `start` that fits, newest first, in `budget`.
+
+        The newest message is always kept, even if it alone exceeds the budget.
+        """
+        total = 0
+        i = len(messages)
+        while i > start:
+            _, tokens = self.formatted(messages[i - 1])
+            if total + tokens > budget and i < len(messages):
+                break
+            total += tokens
+            i -= 1
+        return i
+
+    def fold(
+        self, messages: list[BaseMessage], summarized_count: int
+    ) -> tuple[int, list[BaseMessage]]:
+        """Return the new summarized count and the formatted messages to fold into the summary.
+
+        Nothing is folded while the live window fits in `max_tokens`. Then
+        the oldest unsummarized messages are folded first, at most
+        `max_tokens` worth per call and never any of the newest
+        `keep_tokens`. A longer backlog, e.g. messages appended without a
+        graph run or a thread that predates summaries, is worked through one
+        chunk per run.
+        """
+        if self._cut(messages, summarized_count, self.max_tokens) <= summarized_count:
+            return summarized_count, []
+        keep_from = self._cut(messages, summarized_count, self.keep_tokens)
+        total = 0
+        fold_to = summarized_count
+        while fold_to < keep_from:
+            _, tokens = self.formatted(messages[fold_to])
+            if total + tokens > self.max_tokens and fold_to > summarized_count:
+                break
+            total += tokens
+            fold_to += 1
+        folded = [self.formatted(m)[0] for m in messages[summarized_count:fold_to]]
+        return fold_to, folded
+
+    def window(
+        self, messages: list[BaseMessage], summarized_count: int
+    ) -> list[BaseMessage]:
+        """Formatted live window, bounded by `max_tokens`."""
+        start = self._cut(messages, summarized_count, self.max_tokens)
+        return [self.formatted(m)[0] for m in messages[start:]]
@@ -0,0 +1,64 @@
+import asyncio
+import contextlib
+import time
+from typing import Callable
+
+from lg_st_ws.backend.checkpointer import SpillingSaver
+
+
+class ThreadEvictor:
+    """Keeps in-memory thread state within a budget by spilling idle threads.
+
+    Every `interval` seconds, threads unused for `idle_ttl` seconds are
+    spilled to disk, then the least recently used ones until what is left
+    fits in `memory_budget` bytes of serialized state. Threads for which
+    `is_busy` is true are passed over; they have work in flight and would
+    only be loaded straight back.
+    """
+
+    def __init__(
+        self,
+        saver: SpillingSaver,
+        is_busy: Callable[[str], bool],
+        memory_budget: int,
+        idle_ttl: float = 1800.0,
+        interval: float = 10.0,
+    ):
+        self.saver = saver
+        self.is_busy = is_busy
+        self.memory_budget = memory_budget
+        self.idle_ttl = idle_ttl
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sweep()
+
+    async def sweep(self) -> int:
+        """Spill what the TTL and budget call for; return how many threads went."""
+        saver = self.saver
+        resident = saver.resident_bytes()
+        evicted = 0
+        for thread_id in list(saver.last_used):
+            last_used = saver.last_used.get(thread_id)
+            if last_used is None:
+                continue  # deleted since the sweep began
+            idle = self.idle_ttl and time.monotonic() - last_used >= self.idle_ttl
+            if not idle and resident <= self.memory_budget:
+                break  # oldest first, so every later thread is newer still
+            if self.is_busy(thread_id):
+                continue
+            resident -= await saver.aevict(thread_id)
+            evicted += 1
+        return evicted
@@ -0,0 +1,156 @@
+import asyncio
+from collections import deque
+from enum import StrEnum
+from typing import Callable
+
+from fastapi import WebSocket
+from starlette.status import WS_1008_POLICY_VIOLATION
+
+from lg_st_ws.common.codec import Codec
+from lg_st_ws.common.models import JSONModel, MessageType, PresenceMessage
+
+
+class Frame:
+    """An encoded outbound frame, shared by every connection it is queued on.
+
+    `text` is the compact JSON form; other wire formats are transcoded on
+    first use and cached, so each is built once per frame, not per connection.
+    """
+
+    __slots__ = ("text", "seq", "coalesce_key", "_encoded")
+
+    def __init__(
+        self, text: str, seq: int | None = None, coalesce_key: str | None = None
+    ):
+        self.text = text
+        self.seq = seq
+        self.coalesce_key = coalesce_key
+        self._encoded: dict[tuple, str | bytes] | None = None
+
+    def encode(self, codec: Codec) -> str | bytes:
+        if codec.identity:
+            return self.text
+        if self._encoded is None:
+            self._encoded = {}
+        data = self._encoded.get(codec.key)
+        if data is None:
+            data = self._encoded[codec.key] = codec.encode(self.text)
+        return data
+
+    @classmethod
+    def from_model(cls, msg: JSONModel) -> "Frame":
+        return cls(msg.frame, None, msg.coalesce_key())
+
+
+def _merge_presence(older: Frame, newer: Frame) -> Frame:
+    merged = PresenceMessage.model_validate_json(older.text).merged(
+        PresenceMessage.model_validate_json(newer.text)
+    )
+    return Frame(merged.frame, older.seq, older.coalesce_key)
+
+
+# Keys of frames that are deltas: dropping one would corrupt the state the
+# client builds from them, so a newer one is folded into the one pending.
+MERGES: dict[str, Callable[[Frame, Frame], Frame]] = {
+    MessageType.presence: _merge_presence,
+}
+
+
+class SlowConsumerPolicy(StrEnum):
+    drop_oldest = "drop_oldest"
+    coalesce = "coalesce"
+    disconnect = "disconnect"
+
+
+class ConnectionWriter:
+    """Bounded outbound queue drained by a dedicated writer task.
+
+    Enqueueing never awaits the socket, so a stalled client only ever
+    delays its own frames. When the queue is full the configured
+    `SlowConsumerPolicy` decides what gives.
+    """
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        max_queue: int,
+        policy: SlowConsumerPolicy,
+        on_close: Callable[["ConnectionWriter"], None] | None = None,
+        codec: Codec | None = None,
+    ):
+        self.ws = ws
+        self.codec = codec or Codec()
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_close = on_close
+        self.dropped = 0
+        self.closed = False
+        self._queue: deque[Frame] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, frame: Frame) -> bool:
+        if self.closed:
+            return False
+        if len(self._queue) >= self.max_queue:
+            if self.policy == SlowConsumerPolicy.disconnect:
+                self.close(code=WS_1008_POLICY_VIOLATION)
+                return False
+            if self.policy == SlowConsumerPolicy.coalesce and self._replace(frame):
+                self.dropped += 1
+                return True
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(frame)
+        self._wakeup.set()
+        return True
+
+    def _replace(self, frame: Frame) -> bool:
+        """Overwrite a pending frame that `frame` supersedes, if any."""
+        key = frame.coalesce_key
+        if key is None:
+            return False
+        for i, pending in enumerate(self._queue):
+            if pending.coalesce_key == key:
+                merge = MERGES.get(key)
+                self._queue[i] = frame if merge is None else merge(pending, frame)
+                return True
+        return False
+
+    async def _run(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                data = self._queue.popleft().encode(self.codec)
+                if isinstance(data, str):
+                    await self.ws.send_text(data)
+                else:
+                    await self.ws.send_bytes(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The peer is gone or broken; stop writing and let the owner forget us.
+            self.close()
+
+    def close(self, code: int | None = None):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_ws(code))
+        if self.on_close is not None:
+            self.on_close(self)
+
+    async def _close_ws(self, code: int):
+        try:
+            await self.ws.close(code=code)
+        except Exception:
+            pass
@@ -0,0 +1,81 @@
+from collections import OrderedDict, deque
+
+from langchain_core.messages import BaseMessage
+
+
+class RecentThread:
+    """The newest written messages of a thread, and how many it has in all."""
+
+    __slots__ = ("messages", "total")
+
+    def __init__(self, messages: deque[BaseMessage], total: int):
+        self.messages = messages
+        self.total = total
+
+    @property
+    def first(self) -> int:
+        """Position in the thread of the oldest message held."""
+        return self.total - len(self.messages)
+
+
+class RecentMessages:
+    """The newest messages of recently used threads, to serve history from.
+
+    Each thread keeps its last `per_thread` messages; at most `max_threads`
+    threads are kept, the least recently used going first. A thread is
+    filled once from its full history, between `begin_fill` and `end_fill`,
+    then kept current by `extend` as messages are written, so joining it
+    again doesn't deserialize its whole state. A fill that a write overtook
+    is not kept, since the history it read is missing that write.
+    """
+
+    def __init__(self, per_thread: int = 200, max_threads: int = 1024):
+        self.per_thread = per_thread
+        self.max_threads = max_threads
+        self.threads: OrderedDict[str, RecentThread] = OrderedDict()
+        # thread_id -> [fills in flight, writes since the first began]
+        self._filling: dict[str, list[int]] = {}
+
+    def get(self, thread_id: str) -> RecentThread | None:
+        recent = self.threads.get(thread_id)
+        if recent is not None:
+            self.threads.move_to_end(thread_id)
+        return recent
+
+    def begin_fill(self, thread_id: str) -> int:
+        """Call before reading the thread's history; pass the result to `end_fill`."""
+        filling = self._filling.setdefault(thread_id, [0, 0])
+        filling[0] += 1
+        return filling[1]
+
+    def end_fill(
+        self, thread_id: str, writes: int, history: list[BaseMessage] | None
+    ) -> RecentThread | None:
+        """Keep the history read since `begin_fill`, or None if reading it failed."""
+        filling = self._filling[thread_id]
+        filling[0] -= 1
+        if not filling[0]:
+            del self._filling[thread_id]
+        if history is None:
+            return None
+        recent = RecentThread(deque(history, maxlen=self.per_thread), len(history))
+        if filling[1] == writes and thread_id not in self.threads:
+            self.threads[thread_id] = recent
+            if len(self.threads) > self.max_threads:
+                self.threads.popitem(last=False)
+        return recent
+
+    def extend(self, thread_id: str, messages: list[BaseMessage]):
+        """Record messages just written to the end of the thread."""
+        recent = self.threads.get(thread_id)
+        if recent is not None:
+            recent.messages.extend(messages)
+            recent.total += len(messages)
+        elif thread_id in self._filling:
+            self._filling[thread_id][1] += 1
+
+    def discard(self, thread_id: str):
+        """Forget the thread, e.g. after a write that may or may not have landed."""
+        self.threads.pop(thread_id, None)
+        if thread_id in self._filling:
+            self._filling[thread_id][1] += 1
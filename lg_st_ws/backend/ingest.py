@@ -0,0 +1,105 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from langchain_core.messages import BaseMessage
+
+from lg_st_ws.backend.run_queue import ThreadRunQueue
+
+# thread_id, batch of messages to append to the thread's state
+WriteBatch = Callable[[str, list[BaseMessage]], Awaitable[None]]
+
+
+class WriteBehindBuffer:
+    """Batches messages that only need appending to a thread's state.
+
+    Messages collect in the thread's open batch until `delay` seconds pass
+    or `max_batch` of them arrive. The batch is then written by a job on the
+    thread's run queue, so it lands in order with the thread's graph runs.
+    A graph run `claim`s the open batch instead, so that batch is written
+    together with the run's own input.
+
+    Until its write completes, every accepted message is listed by `pending`,
+    so readers of the thread see it too.
+    """
+
+    def __init__(
+        self,
+        run_queue: ThreadRunQueue,
+        delay: float = 0.05,
+        max_batch: int = 256,
+    ):
+        self.run_queue = run_queue
+        self.delay = delay
+        self.max_batch = max_batch
+        self._open: dict[str, list[BaseMessage]] = {}
+        self._writers: dict[str, WriteBatch] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._unwritten: dict[str, list[list[BaseMessage]]] = {}
+
+    def add(self, thread_id: str, messages: list[BaseMessage], write: WriteBatch):
+        """Queue `messages` for appending; `write` will write the batch they join."""
+        batch = self._open.get(thread_id)
+        if batch is None:
+            batch = self._open[thread_id] = []
+            self._writers[thread_id] = write
+            self._unwritten.setdefault(thread_id, []).append(batch)
+            self._timers[thread_id] = asyncio.get_running_loop().call_later(
+                self.delay, self._seal, thread_id
+            )
+        batch.extend(messages)
+        if len(batch) >= self.max_batch:
+            self._seal(thread_id)
+
+    def claim(self, thread_id: str, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """Close the open batch, add `messages`, and hand it to the caller to write.
+
+        The batch stays listed by `pending` until the caller passes it to `release`.
+        """
+        if thread_id in self._open:
+            batch = self._close(thread_id)
+        else:
+            batch = []
+            self._unwritten.setdefault(thread_id, []).append(batch)
+        batch.extend(messages)
+        return batch
+
+    def release(self, thread_id: str, batch: list[BaseMessage]):
+        """Stop listing a batch once it has been written (or has failed to be).
+
+        A batch's `write` may release it as soon as it is written; the
+        release that follows the write is then a no-op.
+        """
+        batches = self._unwritten.get(thread_id, [])
+        for i, listed in enumerate(batches):
+            if listed is batch:
+                del batches[i]
+                if not batches:
+                    del self._unwritten[thread_id]
+                return
+
+    def pending(self, thread_id: str) -> list[BaseMessage]:
+        """Accepted messages not yet written, oldest first."""
+        return [m for batch in self._unwritten.get(thread_id, ()) for m in batch]
+
+    def seal_all(self):
+        """Queue every open batch for writing now, e.g. before shutdown."""
+        for thread_id in list(self._open):
+            self._seal(thread_id)
+
+    def _close(self, thread_id: str) -> list[BaseMessage]:
+        """Stop accepting messages into the thread's open batch."""
+        self._timers.pop(thread_id).cancel()
+        self._writers.pop(thread_id)
+        return self._open.pop(thread_id)
+
+    def _seal(self, thread_id: str):
+        write = self._writers[thread_id]
+        batch = self._close(thread_id)
+
+        async def job():
+            try:
+                await write(thread_id, batch)
+            finally:
+                self.release(thread_id, batch)
+
+        self.run_queue.submit(thread_id, job)
@@ -1,19 +1,40 @@
+import asyncio
+import contextlib
 import datetime
-from typing import Literal
+import threading
+from typing import Callable, Literal
 
-from langchain_core.messages import HumanMessage, SystemMessage, BaseMessage, AIMessage
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    message_chunk_to_message,
+)
 from langchain_core.runnables import RunnableConfig
-from langchain_openai import ChatOpenAI
 from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 
+from lg_st_ws.backend.context import ContextBuilder
+from lg_st_ws.backend.history import RecentMessages, RecentThread
+from lg_st_ws.backend.ingest import WriteBehindBuffer
+from lg_st_ws.backend.llm_client import build_http_client
+from lg_st_ws.backend.llm_scheduler import LLMScheduler
+from lg_st_ws.backend.metrics import HISTORY_SECONDS, SEARCH_SECONDS
+from lg_st_ws.backend.run_queue import ThreadRunQueue
+from lg_st_ws.backend.search import SearchIndex
 from lg_st_ws.backend.thread_manager import ThreadManager
 from lg_st_ws.common.models import (
     GraphState,
     MessageHistory,
+    SearchResults,
     ChatMessage,
+    ChatChunkMessage,
+    SystemEventMessage,
+    SystemEvent,
 )
 from lg_st_ws.common.util import serialize_history
 
@@ -25,17 +46,77 @@ class LangGraphOrchestrator:
         custom_instructions: str,
         model_name: str,
         checkpointer: BaseCheckpointSaver | None = None,
+        stream_tokens: bool = True,
+        max_context_tokens: int = 8000,
+        keep_context_tokens: int = 4000,
+        history_page_size: int = 50,
+        history_cache_messages: int = 200,
+        history_cache_threads: int = 1024,
+        write_behind_delay: float = 0.05,
+        write_behind_batch: int = 256,
+        llm_max_concurrency: int = 8,
+        llm_max_retries: int = 5,
+        http_client: httpx.AsyncClient | None = None,
+        search_index: SearchIndex | None = None,
+        search_page_size: int = 20,
+        llm_factory: Callable[[], BaseChatModel] | None = None,
     ):
-        self.llm = ChatOpenAI(model=model_name)
+        self.http_client = http_client or build_http_client()
+        self.model_name = model_name
+        self.llm_factory = llm_factory or self._build_llm
+        self._llm: BaseChatModel | None = None
+        self._llm_lock = threading.Lock()
+        self.llm_scheduler = LLMScheduler(
+            max_concurrency=llm_max_concurrency, max_retries=llm_max_retries
+        )
         self.bot_name = bot_name
         self.custom_instructions = custom_instructions
+        self.stream_tokens = stream_tokens
+        self.history_page_size = history_page_size
+        self.recent = RecentMessages(
+            max(history_cache_messages, history_page_size), history_cache_threads
+        )
+        self.context = ContextBuilder(max_context_tokens, keep_context_tokens)
         self.checkpointer = checkpointer or InMemorySaver()
         self.graph = self._build_graph()
+        self.run_queue = ThreadRunQueue()
+        self.write_behind = WriteBehindBuffer(
+            self.run_queue, delay=write_behind_delay, max_batch=write_behind_batch
+        )
+        self.search_index = search_index or SearchIndex()
+        self.search_page_size = search_page_size
+        # Per thread, the input of the queued graph run that hasn't started yet
+        self._next_run: dict[str, list[BaseMessage]] = {}
+        # Per thread, the search index catching up with its history
+        self._catching_up: dict[str, asyncio.Task] = {}
+
+    def get_llm(self) -> BaseChatModel:
+        """The chat model, built on first use; see `prepare`.
+
+        A method rather than a property: compiling the graph reads the
+        attributes its nodes use, which would build the model right away.
+        """
+        if self._llm is None:
+            with self._llm_lock:
+                if self._llm is None:
+                    self._llm = self.llm_factory()
+        return self._llm
+
+    def _build_llm(self) -> BaseChatModel:
+        # Imported here: the OpenAI client takes about as long to import as the rest of the server
+        from langchain_openai import ChatOpenAI
+
+        # Retries are left to the scheduler, which backs off across all threads
+        return ChatOpenAI(
+            model=self.model_name, max_retries=0, http_async_client=self.http_client
+        )
 
     def _build_graph(self):
         async def should_respond(
             state: GraphState, config: RunnableConfig
         ) -> Literal["yes", "no"]:
+            if config["configurable"].get("respond"):
+                return "yes"  # a coalesced batch that mentions the bot somewhere
             most_recent_message: HumanMessage = state["messages"][-1]
             bot_name: str = config["configurable"]["bot_name"]
             human_addressing_bot: bool = "@" + bot_name in str(
@@ -43,6 +124,37 @@ class LangGraphOrchestrator:
             )
             return "yes" if human_addressing_bot else "no"
 
+        async def summarize(state: GraphState, config: RunnableConfig) -> GraphState:
+            summarized_count, folded = self.context.fold(
+                state["messages"], state.get("summarized_count", 0)
+            )
+            if not folded:
+                return {}
+            transcript = "\n".join(str(msg.content) for msg in folded)
+            previous = state.get("summary", "")
+            prompt = (
+                f"Existing summary:\n{previous}\n\n" if previous else ""
+            ) + f"New messages:\n{transcript}"
+            messages = [
+                SystemMessage(
+                    content=(
+                        "Maintain a concise running summary of a multi-user chat. "
+                        "Merge the new messages into the existing summary, keeping "
+                        "who said what, open questions, and decisions. "
+                        "Reply with the updated summary only."
+                    )
+                ),
+                HumanMessage(content=prompt),
+            ]
+            response = await self.llm_scheduler.call(
+                config["configurable"]["thread_id"],
+                lambda: self.get_llm().ainvoke(messages),
+            )
+            return {
+                "summary": str(response.content),
+                "summarized_count": summarized_count,
+            }
+
         async def respond(state: GraphState, config: RunnableConfig) -> GraphState:
             bot_name = config["configurable"]["bot_name"]
             custom_instructions = config["configurable"].get("custom_instructions", "")
@@ -58,23 +170,27 @@ class LangGraphOrchestrator:
 
             sysmsg = SystemMessage(content=_sysmsg)
 
-            def inject_username(msg: BaseMessage) -> BaseMessage:
-                if isinstance(msg, HumanMessage):
-                    username = msg.metadata["username"]
-                    time_str = msg.metadata["timestamp"]
-                    content = msg.content
-                    new_content = f"**{username}** [{time_str}]: {content}"
-                    msg = HumanMessage(content=new_content)
-                elif isinstance(msg, AIMessage):
-                    username = msg.response_metadata["username"]
-                    timestamp = msg.response_metadata["timestamp"]
-                    content = msg.content
-                    new_content = f"**{username}** [{timestamp}]: {content}"
-                    msg = AIMessage(content=new_content)
-                return msg
-
-            msgs = [inject_username(msg) for msg in state["messages"]]
-            response: BaseMessage = await self.llm.ainvoke([sysmsg] + msgs)
+            summary = state.get("summary", "")
+            if summary:
+                sysmsg = SystemMessage(
+                    content=f"{_sysmsg}\n\nSummary of the earlier conversation:\n{summary}"
+                )
+            msgs = [sysmsg] + self.context.window(
+                state["messages"], state.get("summarized_count", 0)
+            )
+            thread_id = config["configurable"]["thread_id"]
+            if self.stream_tokens:
+                # astream lets LangGraph's "messages" stream mode see each token
+                chunks = None
+                async for chunk in self.llm_scheduler.stream(
+                    thread_id, lambda: self.get_llm().astream(msgs)
+                ):
+                    chunks = chunk if chunks is None else chunks + chunk
+                response = message_chunk_to_message(chunks)
+            else:
+                response = await self.llm_scheduler.call(
+                    thread_id, lambda: self.get_llm().ainvoke(msgs)
+                )
             response.response_metadata["username"] = self.bot_name
             response.response_metadata["timestamp"] = datetime.datetime.now(
                 datetime.UTC
@@ -82,14 +198,25 @@ class LangGraphOrchestrator:
             return {"messages": [response]}
 
         graph_builder = StateGraph(state_schema=GraphState)  # type: ignore
+        graph_builder.add_node("summarize", summarize)  # type: ignore
         graph_builder.add_node("respond", respond)  # type: ignore
         graph_builder.add_conditional_edges(
             START,
             should_respond,
-            {"yes": "respond", "no": END},
+            {"yes": "summarize", "no": END},
         )
+        graph_builder.add_edge("summarize", "respond")
         return graph_builder.compile(checkpointer=self.checkpointer)
 
+    def addresses_bot(self, msg: BaseMessage) -> bool:
+        return "@" + self.bot_name in str(msg.content)
+
+    def is_busy(self, thread_id: str) -> bool:
+        """Whether the thread has graph work queued or messages not yet written."""
+        return self.run_queue.busy(thread_id) or bool(
+            self.write_behind.pending(thread_id)
+        )
+
     def get_graph_config(self, thread_id: str) -> RunnableConfig:
         return RunnableConfig(
             configurable={
@@ -99,30 +226,129 @@ class LangGraphOrchestrator:
             }
         )
 
-    async def get_message_history(self, thread_id: str) -> MessageHistory:
-        graph_config = self.get_graph_config(thread_id)
-        state_snapshot = await self.graph.aget_state(graph_config)
-        state_values = state_snapshot.values
-        raw_history = state_values.get("messages", [])
-        history_msg = MessageHistory(
-            thread_id=thread_id,
-            messages=serialize_history(raw_history),
-            timestamp=datetime.datetime.now(datetime.UTC),
-        )
-        return history_msg
+    async def get_message_history(
+        self, thread_id: str, before: int | None = None, limit: int | None = None
+    ) -> MessageHistory:
+        """Return the page of up to `limit` messages preceding index `before`.
+
+        With `before` unset this is the newest page, as sent on handshake.
+        Pages within the thread's recent messages are served from
+        `self.recent`; only older ones read the thread's full state.
+        """
+        with HISTORY_SECONDS.time():
+            recent = self.recent.get(thread_id) or await self._fill_recent(thread_id)
+            pending = self.write_behind.pending(thread_id)
+            length = recent.total + len(pending)
+            limit = min(limit or self.history_page_size, self.history_page_size)
+            end = length if before is None else max(0, min(before, length))
+            start = max(0, end - limit)
+            if start >= recent.first:
+                newest = list(recent.messages) + pending
+                page = newest[start - recent.first : end - recent.first]
+            else:
+                state_snapshot = await self.graph.aget_state(
+                    self.get_graph_config(thread_id)
+                )
+                page = state_snapshot.values.get("messages", [])[start:end]
+            return MessageHistory(
+                thread_id=thread_id,
+                messages=serialize_history(page),
+                cursor=start,
+                has_more=start > 0,
+                before=before,
+                timestamp=datetime.datetime.now(datetime.UTC),
+            )
+
+    async def _fill_recent(self, thread_id: str) -> RecentThread:
+        """Read the thread's full state once, to cache its newest messages."""
+        writes = self.recent.begin_fill(thread_id)
+        history = None
+        try:
+            state_snapshot = await self.graph.aget_state(
+                self.get_graph_config(thread_id)
+            )
+            history = state_snapshot.values.get("messages", [])
+        finally:
+            recent = self.recent.end_fill(thread_id, writes, history)
+        self._catch_up(thread_id, history)
+        return recent
+
+    def _catch_up(self, thread_id: str, history: list[BaseMessage]) -> asyncio.Task:
+        """Bring the thread's search index up to date in the background.
+
+        A handshake only starts it, from the history it read anyway, so
+        joining a long thread for the first time doesn't wait on indexing.
+        """
+        task = self._catching_up.get(thread_id)
+        if task is None:
+            task = asyncio.create_task(self.search_index.catch_up(thread_id, history))
+            self._catching_up[thread_id] = task
+            task.add_done_callback(lambda _: self._catching_up.pop(thread_id, None))
+        return task
+
+    async def search(
+        self, thread_id: str, query: str, offset: int = 0, limit: int | None = None
+    ) -> SearchResults:
+        """Return a page of the thread's messages best matching `query`."""
+        with SEARCH_SECONDS.time():
+            if not self.search_index.synced(thread_id):
+                task = self._catching_up.get(thread_id)
+                if task is None:
+                    state_snapshot = await self.graph.aget_state(
+                        self.get_graph_config(thread_id)
+                    )
+                    task = self._catch_up(
+                        thread_id, state_snapshot.values.get("messages", [])
+                    )
+                # Shared with other searches and the handshake that started it
+                await asyncio.shield(task)
+            offset = max(offset, 0)
+            limit = min(limit or self.search_page_size, self.search_page_size)
+            hits, has_more = await self.search_index.search(
+                thread_id, query, offset, limit
+            )
+            return SearchResults(
+                thread_id=thread_id,
+                query=query,
+                hits=hits,
+                offset=offset,
+                has_more=has_more,
+                timestamp=datetime.datetime.now(datetime.UTC),
+            )
 
     async def broadcast_stream(
         self,
         thread_id: str,
-        input_state: GraphState,
+        input_state: GraphState | None,
         config: RunnableConfig,
         thread_manager: ThreadManager,
     ):
-        async for update in self.graph.astream(
+        stream_mode = ["updates", "messages"] if self.stream_tokens else ["updates"]
+        started_at: dict[str, datetime.datetime] = {}
+        async for mode, update in self.graph.astream(
             input_state,
             config,
-            stream_mode="updates",
+            stream_mode=stream_mode,
         ):
+            if mode == "messages":
+                msg_chunk, metadata = update
+                if metadata.get("langgraph_node") != "respond":
+                    continue
+                if not isinstance(msg_chunk.content, str) or not msg_chunk.content:
+                    continue
+                chunk_msg = ChatChunkMessage(
+                    thread_id=thread_id,
+                    message_id=msg_chunk.id,
+                    username=self.bot_name,
+                    delta=msg_chunk.content,
+                    timestamp=started_at.setdefault(
+                        msg_chunk.id, datetime.datetime.now(datetime.UTC)
+                    ),
+                )
+                await thread_manager.broadcast(thread_id, chunk_msg)
+                continue
+            if "respond" not in update:
+                continue
             ai_msg = update["respond"]["messages"][0]
             if not hasattr(ai_msg, "metadata") or not ai_msg.metadata:
                 ai_msg.metadata = {}
@@ -130,5 +356,145 @@ class LangGraphOrchestrator:
             ai_msg.metadata["timestamp"] = datetime.datetime.now(
                 datetime.UTC
             ).isoformat()
+            self.recent.extend(thread_id, [ai_msg])
             chat_msg = ChatMessage.from_lc_message(thread_id, ai_msg)
             await thread_manager.broadcast(thread_id, chat_msg)
+            await self.search_index.add(thread_id, [ai_msg])
+
+    async def append(
+        self, thread_id: str, messages: list[BaseMessage], respond: bool = False
+    ):
+        """Write `messages` to the thread's state without running any nodes.
+
+        The update is applied as graph input, so a run is left pending (and
+        resumed by `broadcast_stream(input_state=None)`) if `respond` is set
+        or the last message addresses the bot.
+        """
+        config = self.get_graph_config(thread_id)
+        if respond:
+            config["configurable"]["respond"] = True
+        try:
+            await self.graph.aupdate_state(
+                config, {"messages": messages}, as_node=START
+            )
+        except BaseException:
+            # Whether it was written or not, the cached tail can't tell
+            self.recent.discard(thread_id)
+            raise
+        self.recent.extend(thread_id, messages)
+
+    async def _broadcast_error(
+        self, thread_id: str, thread_manager: ThreadManager, content: str
+    ):
+        error_msg = SystemEventMessage(
+            event=SystemEvent.error,
+            thread_id=thread_id,
+            username=self.bot_name,
+            content=content,
+            timestamp=datetime.datetime.now(datetime.UTC),
+        )
+        await thread_manager.broadcast(thread_id, error_msg)
+
+    def submit(
+        self,
+        thread_id: str,
+        input_state: GraphState,
+        config: RunnableConfig,
+        thread_manager: ThreadManager,
+    ):
+        """Add the input's messages to the thread, running the graph only for the bot.
+
+        Messages that don't address the bot are appended in batches by the
+        write-behind buffer. One that does claims the pending batch and queues
+        a graph run, which starts at once on an idle thread and otherwise
+        waits for the thread's earlier work. Until it starts, every new
+        message joins its input, so mentions made while the bot is still
+        answering get one reply that covers them all.
+        """
+        messages = input_state["messages"]
+        next_run = self._next_run.get(thread_id)
+        if next_run is not None:
+            next_run.extend(messages)
+            return
+        if not self.addresses_bot(messages[-1]):
+
+            async def write(thread_id: str, batch: list[BaseMessage]):
+                try:
+                    await self.append(thread_id, batch)
+                except Exception as e:
+                    await self._broadcast_error(
+                        thread_id, thread_manager, f"Failed to save messages: {e}"
+                    )
+                else:
+                    # Listed by `recent` from now on, so no longer by `pending`
+                    self.write_behind.release(thread_id, batch)
+                    await self.search_index.add(thread_id, batch)
+
+            self.write_behind.add(thread_id, messages, write)
+            return
+        batch = self._next_run[thread_id] = self.write_behind.claim(thread_id, messages)
+
+        async def job():
+            del self._next_run[thread_id]
+            try:
+                try:
+                    await self.append(thread_id, batch, respond=True)
+                finally:
+                    self.write_behind.release(thread_id, batch)
+                await self.search_index.add(thread_id, batch)
+                await self.broadcast_stream(
+                    thread_id=thread_id,
+                    input_state=None,
+                    config=config,
+                    thread_manager=thread_manager,
+                )
+            except Exception as e:
+                await self._broadcast_error(
+                    thread_id, thread_manager, f"{self.bot_name} failed to respond: {e}"
+                )
+
+        self.run_queue.submit(thread_id, job)
+
+    async def prepare(self, warmup_connections: int = 0):
+        """Build the model in a worker thread, then warm up to `warmup_connections`.
+
+        Run in the background once the server accepts connections, so neither
+        startup nor the first reply waits on it. Errors are left for the first
+        real request to report.
+        """
+        with contextlib.suppress(Exception):
+            await asyncio.to_thread(self.get_llm)
+            if warmup_connections:
+                await self.warm_up(warmup_connections)
+
+    async def warm_up(self, connections: int = 1, timeout: float = 5.0):
+        """Open pooled connections to the model API ahead of the first real request.
+
+        Failures are ignored: warm-up only saves the first caller DNS, TCP and
+        TLS setup, and the API may not allow listing models.
+        """
+        import openai
+
+        client = self.get_llm().root_async_client.with_options(
+            max_retries=0, timeout=timeout
+        )
+
+        async def ping():
+            try:
+                await client.models.list()
+            except openai.OpenAIError:
+                pass
+
+        await asyncio.gather(*(ping() for _ in range(connections)))
+
+    async def aclose(self):
+        """Write every pending batch, wait for the threads' queued work, stop
+        any indexing catch-up, then close the model client's connections and
+        the search index."""
+        self.write_behind.seal_all()
+        await self.run_queue.join()
+        for task in list(self._catching_up.values()):
+            task.cancel()
+        await asyncio.gather(*self._catching_up.values(), return_exceptions=True)
+        await self.http_client.aclose()
+        self.search_index.close()
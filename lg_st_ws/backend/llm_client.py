@@ -0,0 +1,25 @@
+import importlib.util
+
+import httpx
+
+
+def build_http_client(
+    max_connections: int = 100,
+    max_keepalive_connections: int = 20,
+    keepalive_expiry: float = 60.0,
+    http2: bool = True,
+) -> httpx.AsyncClient:
+    """Pooled transport shared by every call the model client makes.
+
+    HTTP/2 is used only if requested and the optional `h2` package is
+    installed; otherwise connections fall back to HTTP/1.1 keep-alive.
+    Timeouts are left to the OpenAI client, which sets them per request.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        http2=http2 and importlib.util.find_spec("h2") is not None,
+    )
@@ -0,0 +1,193 @@
+import asyncio
+import itertools
+import random
+import sys
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, TypeVar
+
+from lg_st_ws.backend.metrics import (
+    LLM_FIRST_TOKEN_SECONDS,
+    LLM_QUEUE_SECONDS,
+    LLM_TOTAL_SECONDS,
+)
+
+T = TypeVar("T")
+
+
+def retryable(error: Exception) -> bool:
+    """Worth another attempt after a pause; anything else is raised straight away.
+
+    `openai` is slow to import, so it is looked up rather than imported: its
+    errors can't have been raised before something else imported it.
+    """
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(
+        error,
+        (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError),
+    )
+
+
+class LLMScheduler:
+    """Caps concurrent LLM calls across all threads and shares them out fairly.
+
+    Waiting calls are queued per thread and dispatched round-robin across
+    threads, so a busy thread can't starve a quiet one. A retryable error
+    backs off exponentially (or for the server's `retry-after`); a rate
+    limit also pauses dispatch for every thread, so the whole process slows
+    down instead of piling more requests onto the limit.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        wait_samples: int = 1024,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.in_flight = 0
+        self._waiters: dict[str, deque[asyncio.Future]] = {}
+        self._turns: deque[str] = deque()  # threads with waiters, next turn first
+        self._paused_until = 0.0
+        self._wakeup: asyncio.TimerHandle | None = None
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.wait_total = 0.0
+        self._waits: deque[float] = deque(maxlen=wait_samples)
+
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._waiters.values())
+
+    def stats(self) -> dict[str, float]:
+        waits = sorted(self._waits)
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth(),
+            "queued_threads": len(self._turns),
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "wait_avg_s": self.wait_total / self.calls if self.calls else 0.0,
+            "wait_p50_s": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p95_s": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max_s": waits[-1] if waits else 0.0,
+        }
+
+    # --- Slots ---
+
+    @asynccontextmanager
+    async def slot(self, thread_id: str):
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        await self._acquire(thread_id)
+        wait = loop.time() - queued_at
+        self.calls += 1
+        self.wait_total += wait
+        self._waits.append(wait)
+        LLM_QUEUE_SECONDS.observe(wait)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._dispatch()
+
+    async def _acquire(self, thread_id: str):
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.get(thread_id)
+        if waiters is None:
+            waiters = self._waiters[thread_id] = deque()
+            self._turns.append(thread_id)
+        waiters.append(future)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as we were cancelled; hand it on
+                self.in_flight -= 1
+                self._dispatch()
+            raise
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        if loop.time() < self._paused_until:
+            if self._wakeup is None:
+                self._wakeup = loop.call_at(self._paused_until, self._resume)
+            return
+        while self.in_flight < self.max_concurrency and self._turns:
+            thread_id = self._turns.popleft()
+            waiters = self._waiters[thread_id]
+            future = waiters.popleft()
+            if waiters:
+                self._turns.append(thread_id)
+            else:
+                del self._waiters[thread_id]
+            if future.done():
+                continue  # cancelled while queued
+            self.in_flight += 1
+            future.set_result(None)
+
+    def _resume(self):
+        self._wakeup = None
+        self._dispatch()
+
+    # --- Retries ---
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        delay *= random.uniform(0.5, 1.0)
+        if isinstance(error, sys.modules["openai"].RateLimitError):
+            self.rate_limited += 1
+            retry_after = error.response.headers.get("retry-after")
+            try:
+                delay = max(delay, float(retry_after))
+            except (TypeError, ValueError):
+                pass
+            loop = asyncio.get_running_loop()
+            self._paused_until = max(self._paused_until, loop.time() + delay)
+        self.retries += 1
+        return delay
+
+    async def call(self, thread_id: str, request: Callable[[], Awaitable[T]]) -> T:
+        """Await `request()` in a slot, retrying retryable errors."""
+        for attempt in itertools.count():
+            async with self.slot(thread_id):
+                try:
+                    with LLM_TOTAL_SECONDS.time():
+                        return await request()
+                except Exception as e:
+                    if not retryable(e) or attempt >= self.max_retries:
+                        raise
+                    delay = self._retry_delay(e, attempt)
+            await asyncio.sleep(delay)
+
+    async def stream(
+        self, thread_id: str, request: Callable[[], AsyncIterator[T]]
+    ) -> AsyncIterator[T]:
+        """Iterate `request()` in a slot, retrying if it fails before the first item."""
+        for attempt in itertools.count():
+            async with self.slot(thread_id):
+                started = False
+                try:
+                    with LLM_TOTAL_SECONDS.time():
+                        sent_at = time.perf_counter()
+                        async for item in request():
+                            if not started:
+                                started = True
+                                LLM_FIRST_TOKEN_SECONDS.observe(
+                                    time.perf_counter() - sent_at
+                                )
+                            yield item
+                    return
+                except Exception as e:
+                    if not retryable(e) or started or attempt >= self.max_retries:
+                        raise
+                    delay = self._retry_delay(e, attempt)
+            await asyncio.sleep(delay)
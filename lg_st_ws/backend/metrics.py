@@ -0,0 +1,181 @@
+"""Process metrics in the Prometheus text exposition format, served at /metrics.
+
+Histograms are plain counters updated in place on the event loop, so
+observing one costs a bisect and a few additions. Gauges and counters
+that mirror state kept elsewhere are read from callbacks when scraped.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Mapping
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(text: str, quote: bool = True) -> str:
+    """Escape a label value (or, without `quote`, HELP text) for the text format."""
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quote else text
+
+
+class Sampled:
+    """A gauge or counter whose value is read from a callback at scrape time.
+
+    With `label`, the callback returns a mapping from label value to value.
+    A counter is exposed as `<name>_total`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], float | Mapping[str, float]],
+        type: str,
+        label: str | None = None,
+    ):
+        self.name = f"{name}_total" if type == "counter" else name
+        self.help = help
+        self.read = read
+        self.type = type
+        self.label = label
+
+    def samples(self) -> list[str]:
+        if self.label is None:
+            return [f"{self.name} {_format(self.read())}"]
+        return [
+            f'{self.name}{{{self.label}="{_escape(str(key))}"}} {_format(value)}'
+            for key, value in self.read().items()
+        ]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Sampled | Histogram] = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        help: str,
+        read: Callable[[], float | Mapping[str, float]],
+        label: str | None = None,
+    ) -> Sampled:
+        return self.register(Sampled(name, help, read, "counter", label))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Sampled:
+        return self.register(Sampled(name, help, read, "gauge"))
+
+    def histogram(
+        self, name: str, help: str, buckets: tuple = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.help, quote=False)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDSHAKE_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_handshake_seconds",
+    "Time to register a connection and send its first frames.",
+)
+HISTORY_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_message_history_seconds", "Time to load one page of a thread's history."
+)
+SEARCH_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_search_seconds", "Time to answer one full-text search of a thread."
+)
+FANOUT_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_broadcast_fanout_seconds",
+    "Time to stamp a broadcast and queue it for a worker's local connections.",
+)
+FANOUT_BYTES = REGISTRY.histogram(
+    "lg_st_ws_broadcast_payload_bytes",
+    "Length of broadcast frames as compact JSON text.",
+    SIZE_BUCKETS,
+)
+CHECKPOINT_READ_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_checkpoint_read_seconds", "Checkpointer get_tuple latency."
+)
+CHECKPOINT_WRITE_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_checkpoint_write_seconds", "Checkpointer put and put_writes latency."
+)
+LLM_QUEUE_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_llm_queue_seconds", "Time an LLM call waited for a scheduler slot."
+)
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_llm_first_token_seconds",
+    "Time from starting an LLM request to its first token.",
+    LLM_BUCKETS,
+)
+LLM_TOTAL_SECONDS = REGISTRY.histogram(
+    "lg_st_ws_llm_total_seconds", "Duration of LLM requests.", LLM_BUCKETS
+)
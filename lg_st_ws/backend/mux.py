@@ -0,0 +1,192 @@
+import asyncio
+import contextlib
+from typing import Any, Awaitable, Callable
+
+from fastapi import WebSocket
+from pydantic_core import from_json
+from starlette.status import (
+    WS_1000_NORMAL_CLOSURE,
+    WS_1007_INVALID_FRAME_PAYLOAD_DATA,
+    WS_1011_INTERNAL_ERROR,
+)
+from starlette.websockets import WebSocketDisconnect
+
+from lg_st_ws.backend.fanout import ConnectionWriter, SlowConsumerPolicy
+from lg_st_ws.common.codec import Codec, route, unroute
+from lg_st_ws.common.models import MessageType
+
+
+class RoutedFrame:
+    """Data for one or more channels of a `MuxConnection`, already in their format."""
+
+    __slots__ = ("channels", "data", "coalesce_key")
+
+    def __init__(self, channel: int, data: str | bytes):
+        self.channels = [channel]
+        self.data = data
+        self.coalesce_key = None
+
+    def encode(self, codec: Codec) -> str | bytes:
+        return route(self.channels, self.data)
+
+
+class MuxWriter(ConnectionWriter):
+    """The send queue of a multiplexed connection, shared by all its channels.
+
+    Each channel's `ConnectionWriter` hands it the frame it would have sent.
+    A broadcast reaches the channels one writer at a time with the very same
+    encoded object, so data identical to the last frame still queued just
+    adds its channel to that frame, and is sent once for all of them.
+    """
+
+    def route(self, channel: int, data: str | bytes) -> bool:
+        if self._queue and not self.closed:
+            tail = self._queue[-1]
+            if tail.data is data and channel not in tail.channels:
+                tail.channels.append(channel)
+                return True
+        return self.enqueue(RoutedFrame(channel, data))  # type: ignore[arg-type]
+
+
+class ChannelSocket:
+    """One session on a `MuxConnection`, standing in for its `WebSocket`.
+
+    It supports what `WebSocketSession` and `ConnectionWriter` use: frames
+    the client sent on the channel are read with `receive_json`, and frames
+    sent to it join the connection's queue. Once either side closes the
+    channel, or the connection drops, `receive_json` raises
+    `WebSocketDisconnect`.
+    """
+
+    def __init__(self, mux: "MuxConnection", channel: int):
+        self.mux = mux
+        self.channel = channel
+        self.closed = False
+        self._inbox: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+
+    def feed(self, data: dict[str, Any] | None):
+        """Queue a frame from the client; None once the channel is gone."""
+        if data is None:
+            self.closed = True
+        self._inbox.put_nowait(data)
+
+    async def receive_json(self) -> dict[str, Any]:
+        data = await self._inbox.get()
+        if data is None:
+            self._inbox.put_nowait(None)
+            raise WebSocketDisconnect(WS_1000_NORMAL_CLOSURE)
+        return data
+
+    async def send_text(self, data: str):
+        if self.closed or not self.mux.writer.route(self.channel, data):
+            raise WebSocketDisconnect(WS_1000_NORMAL_CLOSURE)
+
+    async def send_bytes(self, data: bytes):
+        if self.closed or not self.mux.writer.route(self.channel, data):
+            raise WebSocketDisconnect(WS_1000_NORMAL_CLOSURE)
+
+    async def close(
+        self, code: int = WS_1000_NORMAL_CLOSURE, reason: str | None = None
+    ):
+        # The client learns the reason, if any, from the frames sent before
+        if not self.closed:
+            self.feed(None)
+            self.mux.writer.route(self.channel, "")
+
+
+class MuxConnection:
+    """Many sessions, each in any thread, over one client websocket.
+
+    A client opens a channel by sending a `HandshakeMessage` with its
+    `thread_id` on a channel number it has not used before on this
+    connection. The channel is then served by `serve`, exactly as a
+    connection to that thread's own endpoint would be. Frames on a channel
+    that is closed, or that don't open one, are ignored.
+
+    Channels fail alone: a frame that isn't JSON closes its channel, and a
+    session that raises closes only its own. Neither takes down the
+    connection or the other channels on it.
+    """
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        serve: Callable[[ChannelSocket, str], Awaitable[None]],
+        max_queue: int,
+        policy: SlowConsumerPolicy,
+        idle_timeout: float | None = None,
+    ):
+        self.ws = ws
+        self.serve = serve
+        self.idle_timeout = idle_timeout
+        self.writer = MuxWriter(ws, max_queue, policy)
+        self.channels: dict[int, ChannelSocket] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def run(self):
+        self.writer.start()
+        try:
+            while not self.writer.closed:
+                # An idle connection without channels isn't being pinged
+                async with asyncio.timeout(
+                    self.idle_timeout if self.channels else None
+                ):
+                    message = await self.ws.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("text")
+                if data is None:
+                    data = message.get("bytes") or b""
+                try:
+                    channels, payload = unroute(data)
+                except ValueError:
+                    continue  # no channel to speak of, so none to open
+                await self.dispatch(channels[0], payload)
+        except TimeoutError:
+            pass
+        finally:
+            for socket in self.channels.values():
+                socket.feed(None)
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self.writer.close()
+            with contextlib.suppress(Exception):
+                await self.ws.close()
+
+    async def dispatch(self, channel: int, payload: str | bytes):
+        socket = self.channels.get(channel)
+        if not payload:
+            if socket is not None:
+                socket.feed(None)
+            return
+        try:
+            data = from_json(payload)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            if socket is not None:
+                await socket.close(code=WS_1007_INVALID_FRAME_PAYLOAD_DATA)
+            return
+        if socket is not None:
+            socket.feed(data)
+        elif data.get("type") == MessageType.handshake and data.get("thread_id"):
+            socket = self.channels[channel] = ChannelSocket(self, channel)
+            socket.feed(data)
+            task = asyncio.create_task(self._serve(socket, data["thread_id"]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _serve(self, socket: ChannelSocket, thread_id: str):
+        try:
+            await self.serve(socket, thread_id)
+        except Exception as e:
+            await socket.close(code=WS_1011_INTERNAL_ERROR)
+            asyncio.get_running_loop().call_exception_handler(
+                {
+                    "message": f"Session on channel {socket.channel} failed",
+                    "exception": e,
+                    "task": asyncio.current_task(),
+                }
+            )
+        finally:
+            await socket.close()
+            self.channels.pop(socket.channel, None)
@@ -0,0 +1,25 @@
+from collections import deque
+
+from lg_st_ws.backend.fanout import Frame
+
+
+class ReplayBuffer:
+    """Ring buffer of the most recent sequenced frames delivered to a thread."""
+
+    def __init__(self, size: int):
+        self.last_seq: int | None = None
+        self.frames: deque[Frame] = deque(maxlen=size)
+
+    def append(self, frame: Frame):
+        self.last_seq = frame.seq
+        self.frames.append(frame)
+
+    def since(self, last_seen_seq: int) -> list[Frame] | None:
+        """Frames after `last_seen_seq`, or None if the gap can't be replayed."""
+        if self.last_seq is None or last_seen_seq > self.last_seq:
+            return None
+        if last_seen_seq == self.last_seq:
+            return []
+        if self.frames[0].seq > last_seen_seq + 1:
+            return None
+        return [frame for frame in self.frames if frame.seq > last_seen_seq]
@@ -0,0 +1,56 @@
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+Job = Callable[[], Awaitable[None]]
+
+
+class ThreadRunQueue:
+    """Ordered, per-thread job queue.
+
+    Jobs submitted for the same thread run one at a time in submission order,
+    so graph runs never overlap on a checkpoint. Different threads run
+    concurrently. A thread's worker task exists only while it has work. A job
+    that raises is reported to the event loop's exception handler, and the
+    thread's remaining jobs still run.
+    """
+
+    def __init__(self):
+        self._jobs: dict[str, deque[Job]] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+
+    def submit(self, thread_id: str, job: Job):
+        self._jobs.setdefault(thread_id, deque()).append(job)
+        if thread_id not in self._workers:
+            self._workers[thread_id] = asyncio.create_task(self._work(thread_id))
+
+    def pending(self, thread_id: str) -> int:
+        return len(self._jobs.get(thread_id, ()))
+
+    def busy(self, thread_id: str) -> bool:
+        """Whether a job for `thread_id` is running or waiting to."""
+        return thread_id in self._workers
+
+    async def _work(self, thread_id: str):
+        jobs = self._jobs[thread_id]
+        try:
+            while jobs:
+                try:
+                    await jobs.popleft()()
+                except Exception as e:
+                    asyncio.get_running_loop().call_exception_handler(
+                        {
+                            "message": f"Job for thread {thread_id!r} failed",
+                            "exception": e,
+                            "task": asyncio.current_task(),
+                        }
+                    )
+        finally:
+            del self._workers[thread_id]
+            if not jobs:
+                del self._jobs[thread_id]
+
+    async def join(self):
+        """Wait until every thread's queue has drained."""
+        while self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
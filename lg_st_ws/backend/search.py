@@ -0,0 +1,300 @@
+import asyncio
+import re
+import sqlite3
+import threading
+
+from langchain_core.messages import BaseMessage
+
+from lg_st_ws.common.models import SearchHit
+
+# A message's rowid is its thread's number in the high 32 bits and its
+# position in the thread's history in the low 32, so each thread's messages
+# are one rowid range, which FTS5 can seek to directly
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_threads (
+    num INTEGER PRIMARY KEY,
+    thread_id TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS indexed_messages (
+    rowid INTEGER PRIMARY KEY,
+    message_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS indexed_messages_id ON indexed_messages (message_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS message_text USING fts5(
+    content,
+    content='indexed_messages',
+    content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='3'
+);
+CREATE TRIGGER IF NOT EXISTS indexed_messages_ai AFTER INSERT ON indexed_messages BEGIN
+    INSERT INTO message_text (rowid, content) VALUES (new.rowid, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS indexed_messages_ad AFTER DELETE ON indexed_messages BEGIN
+    INSERT INTO message_text (message_text, rowid, content)
+    VALUES ('delete', old.rowid, old.content);
+END;
+"""
+
+POSITION_BITS = 32
+
+_WORD = re.compile(r"\w+")
+
+
+def match_expression(query: str) -> str | None:
+    """Turn free text into an FTS5 query matching messages with every word.
+
+    Words are quoted, so user input can't be read as FTS5 syntax. The last
+    one also matches as a prefix, for search-as-you-type, once it is long
+    enough not to expand into a large part of the vocabulary.
+    """
+    words = _WORD.findall(query)
+    if not words:
+        return None
+    terms = " ".join(f'"{w}"' for w in words)
+    if len(words[-1]) >= 3:
+        terms += "*"
+    return terms
+
+
+def message_text(msg: BaseMessage) -> str:
+    if isinstance(msg.content, str):
+        return msg.content
+    return " ".join(
+        part if isinstance(part, str) else str(part.get("text", ""))
+        for part in msg.content
+    )
+
+
+class SearchIndex:
+    """Full-text index of every thread's messages, on SQLite FTS5.
+
+    Messages are recorded with their position in the thread's history, so a
+    hit can be opened in context with a `HistoryRequestMessage`. A thread is
+    first brought up to date by `catch_up`, from its full written history,
+    which covers threads that predate the index (or an index that outlived
+    an in-memory checkpointer). After that, `add` indexes messages as they
+    are written; until then it holds them for `catch_up` to index after the
+    history. A message is only ever indexed once, by id.
+
+    Hits are ranked by BM25 among the newest `max_candidates` matches, so
+    a query for a word in most of a long thread's messages costs no more
+    than one for a rare word. With `path` ":memory:" the index lasts as long
+    as the process, like the in-memory checkpointer.
+
+    Queries and inserts run in worker threads, one at a time.
+    """
+
+    def __init__(
+        self, path: str = ":memory:", max_candidates: int = 10000, chunk_size: int = 256
+    ):
+        self.max_candidates = max_candidates
+        self.chunk_size = chunk_size
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        self._nums: dict[str, int] = dict(
+            self.conn.execute("SELECT thread_id, num FROM indexed_threads")
+        )
+        # thread_id -> position of the next message to index
+        self._counts: dict[str, int] = {}
+        self._synced: set[str] = set()
+        self._syncing: set[str] = set()
+        self._held: dict[str, list[BaseMessage]] = {}
+
+    def _range(self, thread_id: str) -> tuple[int, int] | None:
+        """The thread's first and last possible rowid, if it has a number yet."""
+        num = self._nums.get(thread_id)
+        if num is None:
+            return None
+        return num << POSITION_BITS, ((num + 1) << POSITION_BITS) - 1
+
+    def count(self, thread_id: str) -> int:
+        with self._lock:
+            return self._count(thread_id)
+
+    def _count(self, thread_id: str) -> int:
+        count = self._counts.get(thread_id)
+        if count is None:
+            bounds = self._range(thread_id)
+            count = 0
+            if bounds is not None:
+                (last,) = self.conn.execute(
+                    "SELECT max(rowid) FROM indexed_messages WHERE rowid BETWEEN ? AND ?",
+                    bounds,
+                ).fetchone()
+                if last is not None:
+                    count = (last - bounds[0]) + 1
+            self._counts[thread_id] = count
+        return count
+
+    def synced(self, thread_id: str) -> bool:
+        return thread_id in self._synced
+
+    async def add(self, thread_id: str, messages: list[BaseMessage]):
+        """Index messages just appended to the end of a thread's history.
+
+        Calls for one thread must not overlap, or their order may not hold.
+        """
+        if thread_id in self._synced:
+            await asyncio.to_thread(self._insert, thread_id, None, messages)
+        else:
+            self._held.setdefault(thread_id, []).extend(messages)
+
+    async def catch_up(self, thread_id: str, history: list[BaseMessage]):
+        """Index a thread's full written history, then what was added since it was read.
+
+        Long histories are indexed a chunk at a time, so other threads'
+        inserts and queries can run in between.
+        """
+        if thread_id in self._synced or thread_id in self._syncing:
+            return
+        self._syncing.add(thread_id)
+        try:
+            count = await asyncio.to_thread(self.count, thread_id)
+            if count > len(history):
+                # Indexed from a history that is gone, e.g. before a restart
+                await asyncio.to_thread(self.delete_thread, thread_id)
+                count = 0
+            for start in range(count, len(history), self.chunk_size):
+                chunk = history[start : start + self.chunk_size]
+                await asyncio.to_thread(self._insert, thread_id, start, chunk)
+            # Until it is marked synced, `add` holds what arrives meanwhile
+            while held := self._held.pop(thread_id, None):
+                await asyncio.to_thread(self._insert, thread_id, None, held)
+            self._synced.add(thread_id)
+        finally:
+            self._syncing.discard(thread_id)
+
+    def _insert(
+        self, thread_id: str, position: int | None, messages: list[BaseMessage]
+    ):
+        """Index `messages` from `position` on, or with None after the last one."""
+        if not messages:
+            return
+        with self._lock:
+            if position is None:
+                position = self._count(thread_id)
+            self._insert_at(thread_id, position, messages)
+
+    def _insert_at(self, thread_id: str, position: int, messages: list[BaseMessage]):
+        self.conn.execute("BEGIN")
+        try:
+            if thread_id not in self._nums:
+                self._nums[thread_id] = self.conn.execute(
+                    "INSERT INTO indexed_threads (thread_id) VALUES (?)", (thread_id,)
+                ).lastrowid
+            lo, hi = self._range(thread_id)
+            for msg in messages:
+                if msg.id is not None:
+                    if self.conn.execute(
+                        "SELECT 1 FROM indexed_messages"
+                        " WHERE message_id = ? AND rowid BETWEEN ? AND ?",
+                        (msg.id, lo, hi),
+                    ).fetchone():
+                        continue  # indexed by a concurrent catch_up
+                    md = getattr(msg, "metadata", None) or msg.response_metadata
+                    self.conn.execute(
+                        "INSERT INTO indexed_messages"
+                        " (rowid, message_id, username, timestamp, content)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        (
+                            lo + position,
+                            msg.id,
+                            md.get("username", ""),
+                            md.get("timestamp", ""),
+                            message_text(msg),
+                        ),
+                    )
+                position += 1
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            self._nums = dict(
+                self.conn.execute("SELECT thread_id, num FROM indexed_threads")
+            )
+            self._counts.pop(thread_id, None)
+            raise
+        self._counts[thread_id] = position
+
+    async def search(
+        self, thread_id: str, query: str, offset: int = 0, limit: int = 20
+    ) -> tuple[list[SearchHit], bool]:
+        """Return a page of the thread's best matches, and whether more follow."""
+        return await asyncio.to_thread(self._search, thread_id, query, offset, limit)
+
+    def _search(
+        self, thread_id: str, query: str, offset: int, limit: int
+    ) -> tuple[list[SearchHit], bool]:
+        with self._lock:
+            return self._search_locked(thread_id, query, offset, limit)
+
+    def _search_locked(
+        self, thread_id: str, query: str, offset: int, limit: int
+    ) -> tuple[list[SearchHit], bool]:
+        expression = match_expression(query)
+        bounds = self._range(thread_id)
+        if expression is None or bounds is None:
+            return [], False
+        # Walking the thread's matches newest first stops after max_candidates;
+        # only the page's rows are then joined and given a snippet
+        ranked = self.conn.execute(
+            "SELECT rowid, score FROM ("
+            "  SELECT rowid, bm25(message_text) AS score FROM message_text"
+            "  WHERE message_text MATCH ? AND rowid BETWEEN ? AND ?"
+            "  ORDER BY rowid DESC LIMIT ?"
+            ") ORDER BY score, rowid DESC LIMIT ? OFFSET ?",
+            (expression, *bounds, self.max_candidates, limit + 1, offset),
+        ).fetchall()
+        page = ranked[:limit]
+        if not page:
+            return [], False
+        rowids = [rowid for rowid, _ in page]
+        rows = {
+            row[0]: row[1:]
+            for row in self.conn.execute(
+                "SELECT m.rowid, m.message_id, m.username, m.timestamp,"
+                " snippet(message_text, 0, '**', '**', '…', 16)"
+                " FROM message_text JOIN indexed_messages AS m ON m.rowid = message_text.rowid"
+                " WHERE message_text MATCH ? AND message_text.rowid IN"
+                f" ({','.join('?' * len(rowids))})",
+                (expression, *rowids),
+            )
+        }
+        hits = []
+        for rowid, score in page:
+            message_id, username, timestamp, snippet = rows[rowid]
+            hits.append(
+                SearchHit(
+                    message_id=message_id,
+                    position=rowid - bounds[0],
+                    username=username,
+                    timestamp=timestamp,
+                    snippet=snippet,
+                    score=-score,
+                )
+            )
+        return hits, len(ranked) > limit
+
+    def delete_thread(self, thread_id: str):
+        with self._lock:
+            self._delete_thread(thread_id)
+
+    def _delete_thread(self, thread_id: str):
+        bounds = self._range(thread_id)
+        if bounds is not None:
+            self.conn.execute(
+                "DELETE FROM indexed_messages WHERE rowid BETWEEN ? AND ?", bounds
+            )
+        self._counts.pop(thread_id, None)
+        self._synced.discard(thread_id)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
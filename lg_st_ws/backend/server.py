@@ -1,41 +1,349 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Callable
+
 from fastapi import FastAPI, WebSocket
+from fastapi.responses import PlainTextResponse
+from langchain_core.language_models import BaseChatModel
 from starlette.websockets import WebSocketDisconnect
 
+from lg_st_ws.backend.admission import AdmissionController
+from lg_st_ws.backend.backplane import get_backplane
+from lg_st_ws.backend.checkpointer import (
+    SpillingSaver,
+    SQLiteSaver,
+    TimedSaver,
+    get_checkpointer,
+)
+from lg_st_ws.backend.eviction import ThreadEvictor
+from lg_st_ws.backend.fanout import SlowConsumerPolicy
 from lg_st_ws.backend.langgraph_orchestrator import LangGraphOrchestrator
+from lg_st_ws.backend.llm_client import build_http_client
+from lg_st_ws.backend.metrics import REGISTRY
+from lg_st_ws.backend.mux import ChannelSocket, MuxConnection
+from lg_st_ws.backend.search import SearchIndex
 from lg_st_ws.backend.thread_manager import ThreadManager
 from lg_st_ws.backend.ws import WebSocketSession
+from lg_st_ws.common.codec import Codec
 from lg_st_ws.common.config import (
     BOT_NAME,
     CUSTOM_INSTRUCTIONS,
     MODEL_NAME,
+    FANOUT_QUEUE_SIZE,
+    SLOW_CONSUMER_POLICY,
+    STREAM_TOKENS,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_KEEP_TOKENS,
+    CHECKPOINTER,
+    CHECKPOINT_PATH,
+    HISTORY_PAGE_SIZE,
+    HISTORY_CACHE_MESSAGES,
+    HISTORY_CACHE_THREADS,
+    REPLAY_BUFFER_SIZE,
+    REPLAY_GRACE,
+    BACKPLANE,
+    BACKPLANE_PATH,
+    WRITE_BEHIND_DELAY,
+    WRITE_BEHIND_BATCH,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_KEEPALIVE,
+    LLM_KEEPALIVE_EXPIRY,
+    LLM_HTTP2,
+    LLM_WARMUP_CONNECTIONS,
+    THREAD_SPILL_PATH,
+    THREAD_MEMORY_BUDGET_MB,
+    THREAD_IDLE_TTL,
+    THREAD_SWEEP_INTERVAL,
+    PRESENCE_WINDOW,
+    HEARTBEAT_INTERVAL,
+    HEARTBEAT_TIMEOUT,
+    HANDSHAKE_TIMEOUT,
+    MAX_CONNECTIONS_PER_THREAD,
+    MAX_CONCURRENT_HANDSHAKES,
+    HANDSHAKE_RATE,
+    HANDSHAKE_BURST,
+    USER_MESSAGE_RATE,
+    USER_MESSAGE_BURST,
+    THREAD_MESSAGE_RATE,
+    THREAD_MESSAGE_BURST,
+    SEARCH_INDEX_PATH,
+    SEARCH_PAGE_SIZE,
+    SEARCH_MAX_CANDIDATES,
+    MUX_QUEUE_SIZE,
 )
 from lg_st_ws.common.models import (
     HandshakeMessage,
+    SearchResults,
 )
 
-app = FastAPI()
-thread_manager = ThreadManager()
-orchestrator = LangGraphOrchestrator(
-    bot_name=BOT_NAME,
-    custom_instructions=CUSTOM_INSTRUCTIONS,
-    model_name=MODEL_NAME,
+thread_manager = ThreadManager(
+    max_queue=FANOUT_QUEUE_SIZE,
+    slow_consumer_policy=SlowConsumerPolicy(SLOW_CONSUMER_POLICY),
+    replay_size=REPLAY_BUFFER_SIZE,
+    replay_grace=REPLAY_GRACE,
+    backplane=get_backplane(BACKPLANE, BACKPLANE_PATH, PRESENCE_WINDOW),
+    heartbeat_interval=HEARTBEAT_INTERVAL,
+)
+checkpointer = get_checkpointer(CHECKPOINTER, CHECKPOINT_PATH, THREAD_SPILL_PATH)
+admission = AdmissionController(
+    max_connections_per_thread=MAX_CONNECTIONS_PER_THREAD,
+    max_handshakes=MAX_CONCURRENT_HANDSHAKES,
+    handshake_rate=HANDSHAKE_RATE,
+    handshake_burst=HANDSHAKE_BURST,
+    user_rate=USER_MESSAGE_RATE,
+    user_burst=USER_MESSAGE_BURST,
+    thread_rate=THREAD_MESSAGE_RATE,
+    thread_burst=THREAD_MESSAGE_BURST,
 )
-ws_session = WebSocketSession(thread_manager, orchestrator)
+# Built by the lifespan, so importing this module stays cheap and the model
+# client's connection pool belongs to the serving event loop
+orchestrator: LangGraphOrchestrator = None  # type: ignore[assignment]
+ws_session: WebSocketSession = None  # type: ignore[assignment]
+evictor: ThreadEvictor | None = None
+mux_connections: set[MuxConnection] = set()
+IDLE_TIMEOUT = (
+    HEARTBEAT_INTERVAL + HEARTBEAT_TIMEOUT if HEARTBEAT_INTERVAL > 0 else None
+)
+# Overrides the OpenAI model, e.g. with a stand-in for benchmarks
+llm_factory: Callable[[], BaseChatModel] | None = None
 
 
-@app.websocket("/thread/{thread_id}/ws")
-async def websocket_endpoint(ws: WebSocket, thread_id: str):
-    await ws.accept()
-    graph_config = orchestrator.get_graph_config(thread_id)
-    handshake_data = await ws.receive_json()
+def build_orchestrator() -> LangGraphOrchestrator:
+    return LangGraphOrchestrator(
+        bot_name=BOT_NAME,
+        custom_instructions=CUSTOM_INSTRUCTIONS,
+        model_name=MODEL_NAME,
+        checkpointer=TimedSaver(checkpointer),
+        stream_tokens=STREAM_TOKENS,
+        max_context_tokens=CONTEXT_MAX_TOKENS,
+        keep_context_tokens=CONTEXT_KEEP_TOKENS,
+        history_page_size=HISTORY_PAGE_SIZE,
+        history_cache_messages=HISTORY_CACHE_MESSAGES,
+        history_cache_threads=HISTORY_CACHE_THREADS,
+        write_behind_delay=WRITE_BEHIND_DELAY,
+        write_behind_batch=WRITE_BEHIND_BATCH,
+        llm_max_concurrency=LLM_MAX_CONCURRENCY,
+        llm_max_retries=LLM_MAX_RETRIES,
+        http_client=build_http_client(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            http2=LLM_HTTP2,
+        ),
+        search_index=SearchIndex(
+            SEARCH_INDEX_PATH, max_candidates=SEARCH_MAX_CANDIDATES
+        ),
+        search_page_size=SEARCH_PAGE_SIZE,
+        llm_factory=llm_factory,
+    )
+
+
+if isinstance(checkpointer, SpillingSaver):
+    REGISTRY.gauge(
+        "lg_st_ws_threads_resident",
+        "Threads whose checkpointed state is in memory.",
+        lambda: len(checkpointer.last_used),
+    )
+    REGISTRY.gauge(
+        "lg_st_ws_threads_evicted",
+        "Threads whose checkpointed state is spilled to disk.",
+        lambda: len(checkpointer.spilled),
+    )
+    REGISTRY.gauge(
+        "lg_st_ws_thread_state_bytes",
+        "Serialized checkpoint bytes held in memory.",
+        checkpointer.resident_bytes,
+    )
+    REGISTRY.counter(
+        "lg_st_ws_thread_evictions",
+        "Threads spilled to disk.",
+        lambda: checkpointer.evictions,
+    )
+    REGISTRY.counter(
+        "lg_st_ws_thread_reloads",
+        "Spilled threads loaded back into memory.",
+        lambda: checkpointer.reloads,
+    )
+
+REGISTRY.gauge(
+    "lg_st_ws_threads",
+    "Threads with connections on this worker.",
+    lambda: len(thread_manager.thread_users),
+)
+REGISTRY.gauge(
+    "lg_st_ws_connections",
+    "Open connections on this worker.",
+    lambda: sum(len(users) for users in thread_manager.thread_users.values()),
+)
+REGISTRY.gauge(
+    "lg_st_ws_mux_connections",
+    "Open multiplexed connections on this worker.",
+    lambda: len(mux_connections),
+)
+REGISTRY.gauge(
+    "lg_st_ws_mux_channels",
+    "Sessions served over multiplexed connections on this worker.",
+    lambda: sum(len(mux.channels) for mux in mux_connections),
+)
+REGISTRY.counter(
+    "lg_st_ws_connections_reaped",
+    "Connections closed for not answering pings.",
+    lambda: ws_session.reaped,
+)
+REGISTRY.counter(
+    "lg_st_ws_admission_rejections",
+    "Connections refused and messages dropped by admission control.",
+    lambda: admission.rejections,
+    label="reason",
+)
+REGISTRY.gauge(
+    "lg_st_ws_llm_in_flight",
+    "LLM requests holding a scheduler slot.",
+    lambda: orchestrator.llm_scheduler.in_flight,
+)
+REGISTRY.gauge(
+    "lg_st_ws_llm_queue_depth",
+    "LLM requests waiting for a scheduler slot.",
+    lambda: orchestrator.llm_scheduler.queue_depth(),
+)
+REGISTRY.counter(
+    "lg_st_ws_llm_retries",
+    "Retried LLM requests.",
+    lambda: orchestrator.llm_scheduler.retries,
+)
+REGISTRY.counter(
+    "lg_st_ws_llm_rate_limited",
+    "LLM requests rejected by a rate limit.",
+    lambda: orchestrator.llm_scheduler.rate_limited,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global orchestrator, ws_session, evictor
+    orchestrator = build_orchestrator()
+    ws_session = WebSocketSession(
+        thread_manager,
+        orchestrator,
+        idle_timeout=IDLE_TIMEOUT,
+        admission=admission,
+    )
+    if isinstance(checkpointer, SpillingSaver):
+        await asyncio.to_thread(checkpointer.clear_spill_dir)
+        evictor = ThreadEvictor(
+            checkpointer,
+            is_busy=orchestrator.is_busy,
+            memory_budget=THREAD_MEMORY_BUDGET_MB * 1024 * 1024,
+            idle_ttl=THREAD_IDLE_TTL,
+            interval=THREAD_SWEEP_INTERVAL,
+        )
+        evictor.start()
+    await thread_manager.start()
+    preparing = asyncio.create_task(orchestrator.prepare(LLM_WARMUP_CONNECTIONS))
+    yield
+    preparing.cancel()
+    if evictor is not None:
+        await evictor.close()
+    await orchestrator.aclose()
+    if isinstance(checkpointer, SQLiteSaver):
+        # Commit the checkpoints of the batches aclose just wrote
+        await asyncio.to_thread(checkpointer.close)
+    await thread_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/thread/{thread_id}/search")
+async def search(
+    thread_id: str, q: str, offset: int = 0, limit: int | None = None
+) -> SearchResults:
+    return await orchestrator.search(thread_id, q, offset=offset, limit=limit)
+
+
+async def receive_handshake(
+    ws: WebSocket | ChannelSocket, thread_id: str
+) -> HandshakeMessage | None:
+    """Read and admit the first frame; on any failure the connection is closed."""
     try:
+        async with asyncio.timeout(HANDSHAKE_TIMEOUT):
+            handshake_data = await ws.receive_json()
         handshake = HandshakeMessage(**handshake_data)
+    except WebSocketDisconnect:
+        return None
     except Exception:
         await ws.close(code=4000)
+        return None
+    rejection = admission.admit_connection(
+        thread_manager.thread_users.get(thread_id, {}), handshake.username
+    )
+    if rejection is not None:
+        await ws_session.reject(ws, thread_id, rejection)
+        return None
+    return handshake
+
+
+@app.websocket("/thread/{thread_id}/ws")
+async def websocket_endpoint(ws: WebSocket, thread_id: str):
+    await ws.accept()
+    await serve_connection(ws, thread_id)
+
+
+@app.websocket("/mux/ws")
+async def mux_endpoint(ws: WebSocket):
+    await ws.accept()
+    mux = MuxConnection(
+        ws,
+        serve_connection,
+        max_queue=MUX_QUEUE_SIZE,
+        policy=SlowConsumerPolicy(SLOW_CONSUMER_POLICY),
+        idle_timeout=IDLE_TIMEOUT,
+    )
+    mux_connections.add(mux)
+    try:
+        await mux.run()
+    finally:
+        mux_connections.discard(mux)
+
+
+async def serve_connection(ws: WebSocket | ChannelSocket, thread_id: str):
+    """Serve one user in a thread, on its own connection or a multiplexed channel."""
+    rejection = admission.begin_handshake()
+    if rejection is not None:
+        await ws_session.reject(ws, thread_id, rejection)
         return
-    username = handshake.username
-    await ws_session.shake_hands(ws, thread_id, username)
+    graph_config = orchestrator.get_graph_config(thread_id)
+    try:
+        handshake = await receive_handshake(ws, thread_id)
+        if handshake is None:
+            return
+        username = handshake.username
+        try:
+            await ws_session.shake_hands(
+                ws,
+                thread_id,
+                username,
+                last_seen_seq=handshake.last_seen_seq,
+                codec=Codec(handshake.encoding, handshake.compress),
+            )
+        except BaseException:
+            await ws_session.thread_manager.remove_user(thread_id, username, ws)
+            raise
+    finally:
+        admission.end_handshake()
+    # However the connection ends, the user must not outlive it
     try:
-        await ws_session.ongoing_loop(ws, thread_id, graph_config)
+        await ws_session.ongoing_loop(ws, thread_id, username, graph_config)
     except WebSocketDisconnect:
-        await ws_session.thread_manager.remove_user(thread_id, username)
+        pass
+    finally:
+        await ws_session.thread_manager.remove_user(thread_id, username, ws)
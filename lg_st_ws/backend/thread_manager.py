@@ -1,54 +1,199 @@
-import datetime
+import asyncio
+import contextlib
+import time
 
 from fastapi import WebSocket
 
-from lg_st_ws.common.models import (
-    SystemEventMessage,
-    MessageType,
-    SystemEvent,
-    JSONModel,
-)
+from lg_st_ws.backend.backplane import Backplane, InProcessBackplane
+from lg_st_ws.backend.fanout import ConnectionWriter, Frame, SlowConsumerPolicy
+from lg_st_ws.backend.metrics import FANOUT_BYTES, FANOUT_SECONDS
+from lg_st_ws.backend.replay import ReplayBuffer
+from lg_st_ws.common.codec import Codec
+from lg_st_ws.common.models import JSONModel, PingMessage, SequencedModel
 
 
 class ThreadManager:
-    def __init__(self):
-        self.thread_users: dict[str, dict[str, WebSocket]] = {}
+    def __init__(
+        self,
+        max_queue: int = 256,
+        slow_consumer_policy: SlowConsumerPolicy = SlowConsumerPolicy.drop_oldest,
+        replay_size: int = 1024,
+        backplane: Backplane | None = None,
+        heartbeat_interval: float = 20.0,
+        replay_grace: float = 30.0,
+    ):
+        self.thread_users: dict[str, dict[str, ConnectionWriter]] = {}
+        self.replay: dict[str, ReplayBuffer] = {}
+        # Threads with no local users left, still buffering for a reconnect
+        self._releasing: dict[str, asyncio.Task] = {}
+        self.backplane = backplane or InProcessBackplane()
+        self.max_queue = max_queue
+        self.slow_consumer_policy = slow_consumer_policy
+        self.replay_size = replay_size
+        self.heartbeat_interval = heartbeat_interval
+        self.replay_grace = replay_grace
+        self._heartbeat: asyncio.Task | None = None
+
+    async def start(self):
+        await self.backplane.start(self._deliver)
+        if self.heartbeat_interval > 0:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def close(self):
+        for task in self._releasing.values():
+            task.cancel()
+        self._releasing.clear()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._heartbeat
+        await self.backplane.close()
+
+    async def _heartbeat_loop(self):
+        """Ping every local connection; one frame, encoded once, shared by all."""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            frame = Frame.from_model(PingMessage())
+            for writers in list(self.thread_users.values()):
+                for writer in list(writers.values()):
+                    writer.enqueue(frame)
 
     def get_usernames(self, thread_id: str) -> list[str]:
+        """Users connected to `thread_id` through this worker."""
         return list(self.thread_users.get(thread_id, {}).keys())
 
+    async def presence(self, thread_id: str) -> tuple[list[str], int]:
+        """Users connected to `thread_id` through any worker, and the presence version."""
+        return await self.backplane.presence(thread_id)
+
     def get_connections(self, thread_id: str) -> list[WebSocket]:
-        return list(self.thread_users.get(thread_id, {}).values())
+        return [w.ws for w in self.thread_users.get(thread_id, {}).values()]
+
+    def _discard(self, thread_id: str, username: str, writer: ConnectionWriter):
+        """Forget `writer` if it is still the registered connection for `username`."""
+        users = self.thread_users.get(thread_id)
+        if users is not None and users.get(username) is writer:
+            del users[username]
+            if not users:
+                del self.thread_users[thread_id]
+
+    def _replay_buffer(self, thread_id: str) -> ReplayBuffer:
+        if thread_id not in self.replay:
+            self.replay[thread_id] = ReplayBuffer(self.replay_size)
+        return self.replay[thread_id]
+
+    async def add_user(
+        self,
+        thread_id: str,
+        username: str,
+        websocket: WebSocket,
+        last_seen_seq: int | None = None,
+        codec: Codec | None = None,
+    ) -> bool:
+        """Register a connection and mark the user present in the thread.
 
-    async def add_user(self, thread_id: str, username: str, websocket: WebSocket):
+        The thread hears of the arrival in the backplane's next presence
+        delta. If `last_seen_seq` is still covered by the replay buffer, the
+        frames the user missed are queued and True is returned; otherwise
+        the caller must send a history snapshot.
+        """
         if thread_id not in self.thread_users:
             self.thread_users[thread_id] = {}
-        self.thread_users[thread_id][username] = websocket
-        join_msg = SystemEventMessage(
-            type=MessageType.system_event,
-            event=SystemEvent.user_joined,
-            thread_id=thread_id,
-            username=username,
-            content=f"{username} has connected to thread {thread_id}.",
-            timestamp=datetime.datetime.now(datetime.UTC),
+            releasing = self._releasing.pop(thread_id, None)
+            if releasing is not None:
+                releasing.cancel()
+            else:
+                await self.backplane.subscribe(thread_id)
+        previous = self.thread_users[thread_id].get(username)
+        if previous is not None:
+            # Replaced, not gone: keep the thread (and its subscription) even
+            # if this was its only connection. Presence counts connections,
+            # so the old one's own `remove_user` still balances its join.
+            previous.on_close = None
+            previous.close()
+        writer = ConnectionWriter(
+            websocket,
+            max_queue=self.max_queue,
+            policy=self.slow_consumer_policy,
+            on_close=lambda w: self._discard(thread_id, username, w),
+            codec=codec,
         )
-        await self.broadcast(thread_id, join_msg)
+        self.thread_users[thread_id][username] = writer
+        writer.start()
+        missed = None
+        if last_seen_seq is not None and thread_id in self.replay:
+            missed = self.replay[thread_id].since(last_seen_seq)
+            for frame in missed or ():
+                writer.enqueue(frame)
+        await self.backplane.join(thread_id, username)
+        return missed is not None
 
-    async def remove_user(self, thread_id: str, username: str):
-        if thread_id in self.thread_users and username in self.thread_users[thread_id]:
-            del self.thread_users[thread_id][username]
-            if not self.thread_users[thread_id]:
-                del self.thread_users[thread_id]
-        leave_msg = SystemEventMessage(
-            type=MessageType.system_event,
-            event=SystemEvent.user_left,
-            thread_id=thread_id,
-            username=username,
-            content=f"{username} has disconnected from thread {thread_id}.",
-            timestamp=datetime.datetime.now(datetime.UTC),
-        )
-        await self.broadcast(thread_id, leave_msg)
+    async def remove_user(
+        self, thread_id: str, username: str, websocket: WebSocket | None = None
+    ):
+        """Drop a user's connection; with `websocket`, only if it is still the current one."""
+        writer = self.thread_users.get(thread_id, {}).get(username)
+        if writer is not None and (websocket is None or writer.ws is websocket):
+            writer.close()
+        await self.backplane.leave(thread_id, username)
+        if thread_id not in self.thread_users and thread_id not in self._releasing:
+            if self.replay_grace > 0:
+                self._releasing[thread_id] = asyncio.create_task(
+                    self._release(thread_id)
+                )
+            else:
+                await self._unsubscribe(thread_id)
+
+    async def _release(self, thread_id: str):
+        """Stay subscribed to an emptied thread for `replay_grace` seconds.
+
+        Broadcasts keep filling its replay buffer meanwhile, so a user whose
+        network dropped can resume instead of reloading history.
+        """
+        await asyncio.sleep(self.replay_grace)
+        del self._releasing[thread_id]
+        await self._unsubscribe(thread_id)
+
+    async def _unsubscribe(self, thread_id: str):
+        self.replay.pop(thread_id, None)
+        await self.backplane.unsubscribe(thread_id)
+
+    async def send(self, thread_id: str, username: str, msg: JSONModel):
+        """Queue `msg` for a single user, behind anything already broadcast to them."""
+        writer = self.thread_users.get(thread_id, {}).get(username)
+        if writer is not None:
+            writer.enqueue(Frame.from_model(msg))
 
     async def broadcast(self, thread_id: str, msg: JSONModel):
-        for ws in self.get_connections(thread_id):
-            await ws.send_json(msg.jsonable_dump())
+        # Encoded once here; the backplane sequences it and hands it back to
+        # every worker with users in the thread, this one included.
+        if isinstance(msg, SequencedModel):
+            await self.backplane.publish(
+                thread_id, msg.unstamped_frame, msg.coalesce_key()
+            )
+        else:
+            # Transient, like reply chunks: kept in order, but never replayed
+            await self.backplane.publish(
+                thread_id, msg.frame, msg.coalesce_key(), sequenced=False
+            )
+
+    def _deliver(
+        self,
+        thread_id: str,
+        seq: int | None,
+        unstamped_frame: str,
+        coalesce_key: str | None,
+    ):
+        writers = self.thread_users.get(thread_id)
+        if writers is None and thread_id not in self._releasing:
+            return
+        started = time.perf_counter()
+        if seq is None:
+            frame = Frame(unstamped_frame, None, coalesce_key)
+        else:
+            frame = Frame(SequencedModel.stamp(unstamped_frame, seq), seq, coalesce_key)
+            self._replay_buffer(thread_id).append(frame)
+        for writer in list((writers or {}).values()):
+            writer.enqueue(frame)
+        FANOUT_SECONDS.observe(time.perf_counter() - started)
+        FANOUT_BYTES.observe(len(frame.text))
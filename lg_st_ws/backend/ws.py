@@ -1,52 +1,163 @@
+import asyncio
+import contextlib
 import datetime
 
 from langchain_core.runnables import RunnableConfig
+from starlette.status import WS_1001_GOING_AWAY, WS_1013_TRY_AGAIN_LATER
 from starlette.websockets import WebSocket
 
+from lg_st_ws.backend.admission import REJECTION_REASONS, AdmissionController, Rejection
 from lg_st_ws.backend.langgraph_orchestrator import LangGraphOrchestrator
+from lg_st_ws.backend.metrics import HANDSHAKE_SECONDS
 from lg_st_ws.backend.thread_manager import ThreadManager
+from lg_st_ws.common.codec import Codec
 from lg_st_ws.common.models import (
     UserListMessage,
     MessageType,
     ChatMessage,
     GraphState,
+    HistoryRequestMessage,
+    SearchRequestMessage,
+    SystemEvent,
+    SystemEventMessage,
 )
 
 
 class WebSocketSession:
     def __init__(
-        self, thread_manager: ThreadManager, orchestrator: LangGraphOrchestrator
+        self,
+        thread_manager: ThreadManager,
+        orchestrator: LangGraphOrchestrator,
+        idle_timeout: float | None = None,
+        admission: AdmissionController | None = None,
     ):
         self.thread_manager = thread_manager
         self.orchestrator = orchestrator
+        self.admission = admission or AdmissionController()
+        # A connection that sends nothing for this long, not even a pong, is dead
+        self.idle_timeout = idle_timeout
+        self.reaped = 0
 
-    async def shake_hands(self, ws: WebSocket, thread_id: str, username: str):
-        await self.thread_manager.add_user(thread_id, username, ws)
-        history_msg = await self.orchestrator.get_message_history(thread_id)
-        await ws.send_json(history_msg.jsonable_dump())
+    async def shake_hands(
+        self,
+        ws: WebSocket,
+        thread_id: str,
+        username: str,
+        last_seen_seq: int | None = None,
+        codec: Codec | None = None,
+    ):
+        with HANDSHAKE_SECONDS.time():
+            await self._shake_hands(ws, thread_id, username, last_seen_seq, codec)
+
+    async def _shake_hands(
+        self,
+        ws: WebSocket,
+        thread_id: str,
+        username: str,
+        last_seen_seq: int | None,
+        codec: Codec | None,
+    ):
+        resumed = await self.thread_manager.add_user(
+            thread_id, username, ws, last_seen_seq=last_seen_seq, codec=codec
+        )
+        if not resumed:
+            history_msg = await self.orchestrator.get_message_history(thread_id)
+            await self.thread_manager.send(thread_id, username, history_msg)
+        users, version = await self.thread_manager.presence(thread_id)
         user_list_msg = UserListMessage(
             type=MessageType.user_list,
             thread_id=thread_id,
-            users=self.thread_manager.get_usernames(thread_id),
+            users=users,
+            version=version,
             timestamp=datetime.datetime.now(datetime.UTC),
         )
-        await ws.send_json(user_list_msg.jsonable_dump())
+        await self.thread_manager.send(thread_id, username, user_list_msg)
 
     async def ongoing_loop(
-        self, ws: WebSocket, thread_id: str, graph_config: RunnableConfig
+        self,
+        ws: WebSocket,
+        thread_id: str,
+        username: str,
+        graph_config: RunnableConfig,
     ):
         while True:
-            data = await ws.receive_json()
+            try:
+                async with asyncio.timeout(self.idle_timeout):
+                    data = await ws.receive_json()
+            except TimeoutError:
+                await self.reap(ws)
+                return
             if data.get("type") == MessageType.chat:
+                rejection = self.admission.admit_message(thread_id, username)
+                if rejection is not None:
+                    await self.notify_rejection(thread_id, username, rejection)
+                    continue
                 chat_msg = ChatMessage(**data)
                 lc_msg = chat_msg.to_lc_message()
                 input_state = GraphState(messages=[lc_msg])
                 await self.thread_manager.broadcast(thread_id, chat_msg)
-                await self.orchestrator.broadcast_stream(
+                self.orchestrator.submit(
                     thread_id=thread_id,
                     input_state=input_state,
                     config=graph_config,
                     thread_manager=self.thread_manager,
                 )
+            elif data.get("type") == MessageType.history_request:
+                rejection = self.admission.admit_message(
+                    thread_id, username, thread_wide=False
+                )
+                if rejection is not None:
+                    await self.notify_rejection(thread_id, username, rejection)
+                    continue
+                request = HistoryRequestMessage(**data)
+                history_msg = await self.orchestrator.get_message_history(
+                    thread_id, before=request.before, limit=request.limit
+                )
+                await self.thread_manager.send(thread_id, username, history_msg)
+            elif data.get("type") == MessageType.search_request:
+                rejection = self.admission.admit_message(
+                    thread_id, username, thread_wide=False
+                )
+                if rejection is not None:
+                    await self.notify_rejection(thread_id, username, rejection)
+                    continue
+                request = SearchRequestMessage(**data)
+                results = await self.orchestrator.search(
+                    thread_id, request.query, offset=request.offset, limit=request.limit
+                )
+                await self.thread_manager.send(thread_id, username, results)
             else:
-                continue
+                continue  # pongs, and anything else, only prove the peer is alive
+
+    async def notify_rejection(
+        self, thread_id: str, username: str, rejection: Rejection
+    ):
+        """Tell a user their message was dropped by admission control."""
+        await self.thread_manager.send(
+            thread_id,
+            username,
+            SystemEventMessage(
+                event=SystemEvent.rate_limited,
+                thread_id=thread_id,
+                username=username,
+                content=REJECTION_REASONS[rejection],
+            ),
+        )
+
+    async def reject(self, ws: WebSocket, thread_id: str, rejection: Rejection):
+        """Turn away a connection before it is registered, saying why, then close it."""
+        event = SystemEventMessage(
+            event=SystemEvent.rejected,
+            thread_id=thread_id,
+            username="system",
+            content=REJECTION_REASONS[rejection],
+        )
+        with contextlib.suppress(Exception):
+            await ws.send_text(event.frame)
+            await ws.close(code=WS_1013_TRY_AGAIN_LATER, reason=rejection)
+
+    async def reap(self, ws: WebSocket):
+        """Close a connection that has stopped answering pings."""
+        self.reaped += 1
+        with contextlib.suppress(Exception):
+            await ws.close(code=WS_1001_GOING_AWAY)
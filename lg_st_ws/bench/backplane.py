@@ -0,0 +1,148 @@
+"""Broadcast throughput across worker processes sharing a backplane.
+
+    python -m lg_st_ws.bench.backplane --workers 1 2 4
+
+For each worker count, starts the Unix socket broker and that many worker
+processes. A fixed audience (threads x users) is split evenly across the
+workers, and every worker publishes its share of a fixed number of chat
+messages. Each run reports delivered frames per second. Results are
+printed as JSON.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage
+
+from lg_st_ws.backend.backplane import UnixSocketBackplane
+from lg_st_ws.backend.broker import serve
+from lg_st_ws.backend.thread_manager import ThreadManager
+from lg_st_ws.common.models import ChatMessage
+
+
+class CountingSocket:
+    """Stands in for a websocket: counts chat frames and signals when all have arrived."""
+
+    def __init__(self, expected: int, done: asyncio.Event, pending: list[int]):
+        self.expected = expected
+        self.received = 0
+        self.done = done
+        self.pending = pending
+
+    async def send_text(self, data: str):
+        if '"type":"chat"' not in data:
+            return
+        self.received += 1
+        if self.received == self.expected:
+            self.pending[0] -= 1
+            if self.pending[0] == 0:
+                self.done.set()
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def run_worker(
+    index: int,
+    workers: int,
+    path: str,
+    threads: int,
+    users: int,
+    messages: int,
+    barrier,
+    results,
+):
+    thread_manager = ThreadManager(
+        max_queue=messages + 16, backplane=UnixSocketBackplane(path)
+    )
+    await thread_manager.start()
+    per_thread = messages // threads
+    done = asyncio.Event()
+    local_users = [u for u in range(users) if u % workers == index]
+    pending = [threads * len(local_users)]
+    for t in range(threads):
+        for u in local_users:
+            socket = CountingSocket(per_thread, done, pending)
+            await thread_manager.add_user(f"thread-{t}", f"user-{u}", socket)
+    await asyncio.sleep(0.2)  # let every worker's subscriptions reach the broker
+    await asyncio.to_thread(barrier.wait)
+    start = time.perf_counter()
+    for i in range(index, messages, workers):
+        thread_id = f"thread-{i % threads}"
+        msg = HumanMessage(
+            content=f"benchmark message {i}",
+            metadata={
+                "username": f"user-{index}",
+                "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+            },
+        )
+        await thread_manager.broadcast(
+            thread_id, ChatMessage.from_lc_message(thread_id, msg)
+        )
+    if pending[0]:
+        await done.wait()
+    results.put(time.perf_counter() - start)
+    await thread_manager.close()
+
+
+def worker_main(*args):
+    asyncio.run(run_worker(*args))
+
+
+def broker_main(path: str):
+    asyncio.run(serve(path))
+
+
+def run(workers: int, threads: int, users: int, messages: int) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "broker.sock")
+        broker = ctx.Process(target=broker_main, args=(path,), daemon=True)
+        broker.start()
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        barrier = ctx.Barrier(workers)
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(
+                target=worker_main,
+                args=(i, workers, path, threads, users, messages, barrier, results),
+            )
+            for i in range(workers)
+        ]
+        for proc in procs:
+            proc.start()
+        elapsed = max(results.get() for _ in procs)
+        for proc in procs:
+            proc.join()
+        broker.terminate()
+    delivered = (messages // threads) * threads * users
+    return {
+        "workers": workers,
+        "threads": threads,
+        "users_per_thread": users,
+        "messages": messages,
+        "elapsed_s": elapsed,
+        "delivered_frames_per_s": delivered / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="users per thread")
+    parser.add_argument("--messages", type=int, default=4_000)
+    args = parser.parse_args()
+    results = [run(n, args.threads, args.users, args.messages) for n in args.workers]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Checkpointer write throughput and `aget_state` latency.
+
+    python -m lg_st_ws.bench.checkpointer --checkpointer sqlite --messages 10000
+
+Messages are appended one graph run at a time, the same way unaddressed
+chat messages reach the orchestrator's graph. Results are printed as JSON.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from langchain_core.messages import HumanMessage
+from langgraph.constants import START, END
+from langgraph.graph import StateGraph
+
+from lg_st_ws.backend.checkpointer import get_checkpointer
+from lg_st_ws.common.models import GraphState
+
+
+def build_graph(checkpointer):
+    graph_builder = StateGraph(state_schema=GraphState)  # type: ignore
+    graph_builder.add_node("noop", lambda state: {})  # type: ignore
+    graph_builder.add_edge(START, "noop")
+    graph_builder.add_edge("noop", END)
+    return graph_builder.compile(checkpointer=checkpointer)
+
+
+def make_message(i: int) -> HumanMessage:
+    return HumanMessage(
+        content=f"benchmark message {i} " + "lorem ipsum " * 8,
+        metadata={
+            "username": f"user{i % 50}",
+            "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+        },
+    )
+
+
+async def time_get_state(graph, config, samples: int) -> dict[str, float]:
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        await graph.aget_state(config)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": statistics.median(latencies),
+        "max_ms": max(latencies),
+    }
+
+
+async def run(kind: str, path: str, messages: int, report_every: int) -> dict:
+    checkpointer = get_checkpointer(kind, path)
+    graph = build_graph(checkpointer)
+    config = {"configurable": {"thread_id": "bench"}}
+    windows = []
+    start = window_start = time.perf_counter()
+    for i in range(1, messages + 1):
+        await graph.ainvoke({"messages": [make_message(i)]}, config)
+        if i % report_every == 0:
+            now = time.perf_counter()
+            windows.append(
+                {"messages": i, "msgs_per_s": report_every / (now - window_start)}
+            )
+            window_start = now
+    elapsed = time.perf_counter() - start
+    results = {
+        "checkpointer": kind,
+        "messages": messages,
+        "write_msgs_per_s": messages / elapsed,
+        "write_windows": windows,
+        "get_state_warm": await time_get_state(graph, config, samples=20),
+    }
+    if hasattr(checkpointer, "close"):
+        checkpointer.close()
+        reopened = get_checkpointer(kind, path)
+        results["get_state_cold"] = await time_get_state(
+            build_graph(reopened), config, samples=1
+        )
+        reopened.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--checkpointer", default="sqlite", choices=["memory", "sqlite"]
+    )
+    parser.add_argument("--path", default=None, help="SQLite file (default: temp dir)")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--report-every", type=int, default=1_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path or os.path.join(tmp, "bench.sqlite")
+        results = asyncio.run(
+            run(args.checkpointer, path, args.messages, args.report_every)
+        )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Deterministic in-process chat model for benchmarks.
+
+Swapped in for `ChatOpenAI` so a benchmark measures the server, not a
+model provider: every call waits `first_token` seconds, then produces the
+same reply one word at a time, `token_delay` seconds apart.
+"""
+
+import asyncio
+import time
+from collections.abc import AsyncIterator, Iterator
+from typing import Any
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from lg_st_ws.bench.fake_openai import REPLY
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    reply: str = REPLY
+    first_token: float = 0.05  # seconds
+    token_delay: float = 0.01  # seconds
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def _words(self) -> list[str]:
+        words = self.reply.split(" ")
+        return [words[0]] + [" " + word for word in words[1:]]
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.calls += 1
+        time.sleep(self.first_token + self.token_delay * (len(self._words()) - 1))
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=self.reply))]
+        )
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.calls += 1
+        await asyncio.sleep(
+            self.first_token + self.token_delay * (len(self._words()) - 1)
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=self.reply))]
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        self.calls += 1
+        time.sleep(self.first_token)
+        for i, word in enumerate(self._words()):
+            if i:
+                time.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        await asyncio.sleep(self.first_token)
+        for i, word in enumerate(self._words()):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
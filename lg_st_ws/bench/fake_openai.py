@@ -0,0 +1,121 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+    python -m lg_st_ws.bench.fake_openai --port 8001 --delay 0.02
+    OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=fake ...
+
+Replies are deterministic: every completion is the same canned text,
+streamed one word per chunk with `--delay` seconds between chunks after
+`--first-token` seconds of simulated queueing. The server counts requests
+and TCP connections, so it can show whether clients reuse connections.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY = "This is a deterministic reply from the stand-in model."
+
+
+class Stats:
+    def __init__(self):
+        self.requests = 0
+        self.connections: set[tuple] = set()
+
+
+def create_app(
+    reply: str = REPLY, first_token: float = 0.05, delay: float = 0.01
+) -> FastAPI:
+    app = FastAPI()
+    stats = app.state.stats = Stats()
+    words = reply.split(" ")
+
+    @app.middleware("http")
+    async def count(request: Request, call_next):
+        stats.requests += 1
+        if request.client is not None:
+            stats.connections.add((request.client.host, request.client.port))
+        return await call_next(request)
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "fake", "object": "model"}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"requests": stats.requests, "connections": len(stats.connections)}
+
+    @app.post("/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "fake")
+        await asyncio.sleep(first_token)
+        if not body.get("stream"):
+            await asyncio.sleep(delay * len(words))
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": reply},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 1,
+                        "completion_tokens": len(words),
+                        "total_tokens": 1 + len(words),
+                    },
+                }
+            )
+
+        def chunk(delta: dict, finish_reason: str | None = None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def events():
+            yield chunk({"role": "assistant", "content": ""})
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(delay)
+                yield chunk({"content": word if i == 0 else " " + word})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token", type=float, default=0.05)
+    parser.add_argument("--delay", type=float, default=0.01)
+    args = parser.parse_args()
+    app = create_app(first_token=args.first_token, delay=args.delay)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
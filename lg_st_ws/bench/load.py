@@ -0,0 +1,341 @@
+"""End-to-end websocket load test against the real server.
+
+    python -m lg_st_ws.bench.load --threads 10 --users 20 --rate 0.5 --duration 30
+    python -m lg_st_ws.bench.load --output new.json --baseline last-release.json
+
+Starts `lg_st_ws.backend.server:app` under uvicorn in a child process,
+with a deterministic streaming model in place of `ChatOpenAI`. Server
+settings come from the environment as usual. `threads x users` simulated
+users then connect over real websockets. Each user sends chat messages as
+a Poisson process at `--rate` messages per second. A `--mention-ratio`
+share of those messages address the bot.
+
+Reported latencies, in milliseconds:
+    handshake        connect until the user list arrives
+    delivery         a chat message is sent until each member receives it
+    bot_first_token  a mention is sent until the first chunk of the next
+                     bot reply that starts after it
+    bot_reply        a mention is sent until that reply is complete
+
+Results are printed as JSON, and written to `--output` if given. With
+`--baseline`, each p95 latency and the throughput are compared with an
+earlier result file. The exit status is 1 if any of them is worse by more
+than `--tolerance`.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+import httpx
+from langchain_core.messages import HumanMessage
+from websockets.asyncio.client import connect
+
+from lg_st_ws.common.models import ChatMessage, MessageType
+
+SERVER_DEFAULTS = {
+    "BOT_NAME": "Bot",
+    "WS_HOST": "127.0.0.1",
+    "WS_PORT": "8765",
+    "MODEL_NAME": "fake",
+    "OPENAI_API_KEY": "fake",
+}
+
+
+def serve(port: int, first_token: float, token_delay: float):
+    """Child process: run the real app with the fake model swapped in."""
+    import functools
+
+    import uvicorn
+
+    from lg_st_ws.backend import server
+    from lg_st_ws.bench.fake_llm import FakeStreamingChatModel
+
+    server.llm_factory = functools.partial(
+        FakeStreamingChatModel, first_token=first_token, token_delay=token_delay
+    )
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+class Recorder:
+    def __init__(self):
+        self.handshake: list[float] = []
+        self.delivery: list[float] = []
+        self.bot_first_token: list[float] = []
+        self.bot_reply: list[float] = []
+        self.sent: dict[str, float] = {}  # message tag -> send time
+        self.mentions = 0
+        self.delivered = 0
+        self.last_delivery = 0.0
+
+
+class SimulatedUser:
+    def __init__(
+        self,
+        url: str,
+        thread_id: str,
+        username: str,
+        bot_name: str,
+        recorder: Recorder,
+        rng: random.Random,
+    ):
+        self.url = url
+        self.thread_id = thread_id
+        self.username = username
+        self.bot_name = bot_name
+        self.recorder = recorder
+        self.rng = rng
+        self.ws = None
+        self.joined = asyncio.Event()
+        # Mentions not yet answered, and those waiting on a reply in progress
+        self.mentions: list[float] = []
+        self.answering: dict[str, list[float]] = {}
+
+    async def connect(self):
+        started = time.perf_counter()
+        self.ws = await connect(self.url, max_size=None)
+        await self.ws.send(json.dumps({"type": "handshake", "username": self.username}))
+        self.receiver = asyncio.create_task(self.receive())
+        await self.joined.wait()
+        self.recorder.handshake.append(time.perf_counter() - started)
+
+    async def receive(self):
+        recorder = self.recorder
+        async for raw in self.ws:
+            now = time.perf_counter()
+            data = json.loads(raw)
+            kind = data.get("type")
+            if kind == MessageType.ping:
+                await self.ws.send(json.dumps({"type": MessageType.pong}))
+            elif kind == MessageType.user_list:
+                self.joined.set()
+            elif kind == MessageType.chat_chunk:
+                if data["message_id"] not in self.answering and self.mentions:
+                    for sent_at in self.mentions:
+                        recorder.bot_first_token.append(now - sent_at)
+                    self.answering[data["message_id"]] = self.mentions
+                    self.mentions = []
+            elif kind == MessageType.chat:
+                message = data["message"]
+                if message["type"] == "ai":
+                    answered = self.answering.pop(message["data"].get("id"), None)
+                    if answered is None:  # not streamed
+                        answered, self.mentions = self.mentions, []
+                        recorder.bot_first_token.extend(now - t for t in answered)
+                    recorder.bot_reply.extend(now - t for t in answered)
+                    continue
+                sent_at = recorder.sent.get(message["data"]["content"].split(" ", 1)[0])
+                if sent_at is not None:
+                    recorder.delivery.append(now - sent_at)
+                    recorder.delivered += 1
+                    recorder.last_delivery = now
+
+    async def chat(self, rate: float, mention_ratio: float, until: float):
+        count = 0
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if time.perf_counter() >= until:
+                return
+            count += 1
+            tag = f"{self.thread_id}/{self.username}/{count}"
+            content = f"{tag} load test message"
+            mention = self.rng.random() < mention_ratio
+            if mention:
+                content += f" @{self.bot_name}"
+            msg = HumanMessage(
+                content=content,
+                metadata={
+                    "username": self.username,
+                    "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+                },
+            )
+            frame = ChatMessage.from_lc_message(
+                self.thread_id, msg
+            ).jsonable_dump_json()
+            sent_at = time.perf_counter()
+            self.recorder.sent[tag] = sent_at
+            if mention:
+                self.recorder.mentions += 1
+                self.mentions.append(sent_at)
+            await self.ws.send(frame)
+
+    async def close(self):
+        await self.ws.close()
+        await self.receiver
+
+
+def percentiles(samples: list[float]) -> dict[str, float | int]:
+    if not samples:
+        return {"count": 0}
+    ms = sorted(s * 1000 for s in samples)
+    if len(ms) == 1:
+        ms = ms * 2
+    cuts = statistics.quantiles(ms, n=100, method="inclusive")
+    return {
+        "count": len(samples),
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+async def drive(args: argparse.Namespace, url: str, bot_name: str) -> dict:
+    recorder = Recorder()
+    users = [
+        SimulatedUser(
+            url.format(thread_id=f"bench-{t}"),
+            f"bench-{t}",
+            f"user-{u}",
+            bot_name,
+            recorder,
+            random.Random(f"{args.seed}/{t}/{u}"),
+        )
+        for t in range(args.threads)
+        for u in range(args.users)
+    ]
+    connecting = asyncio.Semaphore(args.connect_concurrency)
+
+    async def join(user: SimulatedUser):
+        async with connecting:
+            await user.connect()
+
+    await asyncio.gather(*(join(user) for user in users))
+
+    started = time.perf_counter()
+    until = started + args.duration
+    await asyncio.gather(
+        *(user.chat(args.rate, args.mention_ratio, until) for user in users)
+    )
+    expected = len(recorder.sent) * args.users
+    deadline = time.perf_counter() + args.drain
+    while time.perf_counter() < deadline and (
+        recorder.delivered < expected or any(u.mentions or u.answering for u in users)
+    ):
+        await asyncio.sleep(0.05)
+    await asyncio.gather(*(user.close() for user in users))
+
+    elapsed = max(recorder.last_delivery, until) - started
+    return {
+        "sent": len(recorder.sent),
+        "mentions": recorder.mentions,
+        "delivered": recorder.delivered,
+        "undelivered": expected - recorder.delivered,
+        "unanswered_mentions": recorder.mentions - len(recorder.bot_reply),
+        "elapsed_s": round(elapsed, 3),
+        "sent_per_s": round(len(recorder.sent) / args.duration, 3),
+        "delivered_per_s": round(recorder.delivered / elapsed, 3),
+        "latency": {
+            "handshake": percentiles(recorder.handshake),
+            "delivery": percentiles(recorder.delivery),
+            "bot_first_token": percentiles(recorder.bot_first_token),
+            "bot_reply": percentiles(recorder.bot_reply),
+        },
+    }
+
+
+def wait_for_server(port: int, server: multiprocessing.Process, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not server.is_alive():
+            raise RuntimeError("server exited during startup")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=1)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise TimeoutError("server did not start")
+
+
+def run(args: argparse.Namespace) -> dict:
+    for key, value in SERVER_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    os.environ["WS_PORT"] = str(args.port)
+    url = f"ws://127.0.0.1:{args.port}/thread" + "/{thread_id}/ws"
+    ctx = multiprocessing.get_context("spawn")
+    server = ctx.Process(
+        target=serve, args=(args.port, args.first_token, args.token_delay), daemon=True
+    )
+    server.start()
+    try:
+        wait_for_server(args.port, server)
+        results = asyncio.run(drive(args, url, os.environ["BOT_NAME"]))
+    finally:
+        server.terminate()
+        server.join()
+    return {
+        "benchmark": "load",
+        "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+        "python": platform.python_version(),
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline", "tolerance", "port")
+        },
+        "results": results,
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Describe every p95 latency or throughput worse than `baseline` by more than `tolerance`."""
+    found = []
+    for name, current in result["results"]["latency"].items():
+        previous = baseline["results"]["latency"].get(name, {})
+        if "p95_ms" in current and previous.get("p95_ms"):
+            if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                found.append(
+                    f"{name} p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms"
+                )
+    current = result["results"]["delivered_per_s"]
+    previous = baseline["results"].get("delivered_per_s")
+    if previous and current < previous * (1 - tolerance):
+        found.append(f"delivered_per_s {previous} -> {current}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=10)
+    parser.add_argument("--users", type=int, default=10, help="users per thread")
+    parser.add_argument(
+        "--rate", type=float, default=0.5, help="messages per second per user"
+    )
+    parser.add_argument("--mention-ratio", type=float, default=0.05)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument(
+        "--drain", type=float, default=10.0, help="seconds to wait for stragglers"
+    )
+    parser.add_argument("--connect-concurrency", type=int, default=100)
+    parser.add_argument("--first-token", type=float, default=0.05)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--seed", default="0")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(result, json.load(f), args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Cold-start benchmark: import times and time to the first accepted websocket.
+
+    python -m lg_st_ws.bench.startup --runs 5
+    python -m lg_st_ws.bench.startup --output new.json --baseline last-release.json
+
+Every measurement runs in a fresh interpreter, so nothing is already in
+`sys.modules`. Server settings come from the environment as usual, and
+the OpenAI client is never called. Reported times, in milliseconds, are the
+median and maximum over `--runs`:
+    import:<module>  importing the module. Frontend modules are timed after
+                     importing streamlit and websocket-client, which the
+                     Streamlit process has loaded already
+    first_accept     spawning `uvicorn lg_st_ws.backend.server:app` until it
+                     accepts a websocket connection
+    first_user_list  spawning it until the handshake on that connection
+                     is answered with the user list
+
+Results are printed as JSON, and written to `--output` if given. With
+`--baseline`, each median is compared with an earlier result file. The exit
+status is 1 if any of them is slower by more than `--tolerance`.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from websockets.asyncio.client import connect
+
+from lg_st_ws.bench.load import SERVER_DEFAULTS
+
+BACKEND_MODULES = ["lg_st_ws.common.models", "lg_st_ws.backend.server"]
+FRONTEND_MODULES = ["lg_st_ws.frontend.ws_impl"]
+FRONTEND_PRELOADED = "import streamlit, websocket"
+
+IMPORT_TIMER = """
+import time
+{preload}
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+
+def time_import(module: str, preload: str = "") -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_TIMER.format(module=module, preload=preload)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+async def time_first_connection(port: int, timeout: float = 60) -> tuple[float, float]:
+    """Spawn the server; return seconds until it accepts a websocket, and until the handshake is answered."""
+    url = f"ws://127.0.0.1:{port}/thread/bench-startup/ws"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "lg_st_ws.backend.server:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ]
+    )
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError("server did not start")
+            try:
+                ws = await connect(url)
+                break
+            except OSError:
+                await asyncio.sleep(0.005)
+        accepted = time.perf_counter() - started
+        async with ws:
+            await ws.send(json.dumps({"type": "handshake", "username": "bench"}))
+            async for raw in ws:
+                if json.loads(raw).get("type") == "user_list":
+                    break
+        answered = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    return accepted, answered
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    for key, value in SERVER_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+    samples: dict[str, list[float]] = {}
+    for _ in range(args.runs):
+        for module in BACKEND_MODULES:
+            samples.setdefault(f"import:{module}", []).append(time_import(module))
+        for module in FRONTEND_MODULES:
+            samples.setdefault(f"import:{module}", []).append(
+                time_import(module, FRONTEND_PRELOADED)
+            )
+        accepted, answered = asyncio.run(time_first_connection(args.port))
+        samples.setdefault("first_accept", []).append(accepted)
+        samples.setdefault("first_user_list", []).append(answered)
+    return {
+        "benchmark": "startup",
+        "timestamp": datetime.datetime.now(datetime.UTC).isoformat(),
+        "python": platform.python_version(),
+        "parameters": {"runs": args.runs},
+        "results": {name: summarize(values) for name, values in samples.items()},
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Describe every median slower than `baseline` by more than `tolerance`."""
+    found = []
+    for name, current in result["results"].items():
+        previous = baseline["results"].get(name, {}).get("median_ms")
+        if previous and current["median_ms"] > previous * (1 + tolerance):
+            found.append(f"{name} {previous}ms -> {current['median_ms']}ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(result, json.load(f), args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Wire encoding shared by the backend and the Streamlit client.
+
+Every frame is built once in the compact JSON schema (see `compact`). That
+text is what the backplane carries and what a plain JSON connection
+receives. A connection that negotiated other options in its handshake gets
+the frame transcoded by its `Codec`:
+
+- `Encoding.msgpack` packs the same compact schema as MessagePack.
+- `compress` deflates frames of at least `COMPRESS_MIN_SIZE` bytes.
+
+Anything other than a plain JSON frame goes out as a binary websocket
+frame, led by a flags byte that says how to decode the rest. That way the
+client can decode whatever the server settled on.
+"""
+
+import datetime
+import zlib
+from enum import IntFlag, StrEnum
+from typing import Any
+
+import ormsgpack
+from pydantic import BaseModel
+from pydantic_core import from_json, to_json
+
+COMPRESS_MIN_SIZE = 512
+
+
+class Encoding(StrEnum):
+    json = "json"
+    msgpack = "msgpack"
+
+
+class FrameFlags(IntFlag):
+    none = 0
+    msgpack = 1
+    deflate = 2
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value is False or value == {} or value == []
+
+
+def compact_lc_message(message: dict[str, Any]) -> dict[str, Any]:
+    """Drop the empty fields `message_to_dict` emits; `messages_from_dict` restores them."""
+    data = message["data"]
+    return {
+        "type": message["type"],
+        "data": {
+            k: v
+            for k, v in data.items()
+            if k in ("content", "type") or not _is_empty(v)
+        },
+    }
+
+
+def compact(msg: BaseModel, exclude: set[str] | None = None) -> dict[str, Any]:
+    """The compact schema for an envelope model.
+
+    Fields left at their defaults are omitted, except `type`. Timestamps
+    become epoch milliseconds. Serialized LangChain messages lose their
+    empty fields. Pydantic fills in every omitted value when the frame is
+    validated again, so any reader of the full schema can also read this one.
+    """
+    data = {"type": msg.type}
+    for key, value in msg.model_dump(exclude_defaults=True, exclude=exclude).items():
+        if isinstance(value, datetime.datetime):
+            value = round(value.timestamp() * 1000)
+        elif key == "message":
+            value = compact_lc_message(value)
+        elif key == "messages":
+            value = [compact_lc_message(m) for m in value]
+        data[key] = value
+    return data
+
+
+def dumps(data: dict[str, Any]) -> str:
+    return to_json(data).decode()
+
+
+class Codec:
+    """Transcodes compact JSON frames into one connection's negotiated wire format."""
+
+    def __init__(
+        self,
+        encoding: Encoding = Encoding.json,
+        compress: bool = False,
+        compress_min_size: int = COMPRESS_MIN_SIZE,
+    ):
+        self.encoding = encoding
+        self.compress = compress
+        self.compress_min_size = compress_min_size
+        # Frames cache their encoded form under this key, shared by equal codecs
+        self.key = (encoding, compress)
+
+    @property
+    def identity(self) -> bool:
+        return self.encoding == Encoding.json and not self.compress
+
+    def encode(self, frame: str) -> str | bytes:
+        if self.identity:
+            return frame
+        flags = FrameFlags.none
+        if self.encoding == Encoding.msgpack:
+            payload = ormsgpack.packb(from_json(frame))
+            flags |= FrameFlags.msgpack
+        else:
+            payload = frame.encode()
+        if self.compress and len(payload) >= self.compress_min_size:
+            payload = zlib.compress(payload, 1)
+            flags |= FrameFlags.deflate
+        return bytes((flags,)) + payload
+
+    @staticmethod
+    def decode(data: str | bytes) -> dict[str, Any]:
+        """Decode a frame in any format a `Codec` can produce."""
+        if isinstance(data, str):
+            return from_json(data)
+        flags = FrameFlags(data[0])
+        payload = data[1:]
+        if flags & FrameFlags.deflate:
+            payload = zlib.decompress(payload)
+        if flags & FrameFlags.msgpack:
+            return ormsgpack.unpackb(payload)
+        return from_json(payload)
+
+
+# A multiplexed connection carries many sessions, each on a numbered channel.
+# Every websocket frame on it is led by the channels it is for, a newline,
+# then the session's own frame in that session's format. A frame sent
+# identically to several channels goes out once. An empty session frame
+# closes the channel.
+
+
+def route(channels: list[int], data: str | bytes) -> str | bytes:
+    header = ",".join(map(str, channels))
+    if isinstance(data, str):
+        return f"{header}\n{data}"
+    return header.encode() + b"\n" + data
+
+
+def unroute(data: str | bytes) -> tuple[list[int], str | bytes]:
+    if isinstance(data, str):
+        header, _, payload = data.partition("\n")
+        return [int(c) for c in header.split(",")], payload
+    header, _, payload = data.partition(b"\n")
+    return [int(c) for c in header.split(b",")], payload
@@ -1,9 +1,63 @@
 from os import environ
 
-BOT_NAME = environ["BOT_NAME"]
-WS_HOST = environ["WS_HOST"]
-WS_PORT = environ["WS_PORT"]
+BOT_NAME = environ.get("BOT_NAME", "Bot")
+WS_HOST = environ.get("WS_HOST", "localhost")
+WS_PORT = environ.get("WS_PORT", "8000")
 WS_URL = f"ws://{WS_HOST}:{WS_PORT}/thread" + "/{thread_id}/ws"
 CUSTOM_INSTRUCTIONS = environ.get("CUSTOM_INSTRUCTIONS", "")
 MODEL_NAME = environ.get("MODEL_NAME")
 STRFTIME_FORMAT = "%Y-%m-%d %I:%M:%S %p %Z"
+FANOUT_QUEUE_SIZE = int(environ.get("FANOUT_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_POLICY = environ.get("SLOW_CONSUMER_POLICY", "drop_oldest")
+STREAM_TOKENS = environ.get("STREAM_TOKENS", "true").lower() == "true"
+CONTEXT_MAX_TOKENS = int(environ.get("CONTEXT_MAX_TOKENS", "8000"))
+CONTEXT_KEEP_TOKENS = int(environ.get("CONTEXT_KEEP_TOKENS", "4000"))
+CHECKPOINTER = environ.get("CHECKPOINTER", "memory")  # "memory" or "sqlite"
+CHECKPOINT_PATH = environ.get("CHECKPOINT_PATH", "checkpoints.sqlite")
+HISTORY_PAGE_SIZE = int(environ.get("HISTORY_PAGE_SIZE", "50"))
+HISTORY_CACHE_MESSAGES = int(environ.get("HISTORY_CACHE_MESSAGES", "200"))  # per thread
+HISTORY_CACHE_THREADS = int(environ.get("HISTORY_CACHE_THREADS", "1024"))
+REPLAY_BUFFER_SIZE = int(environ.get("REPLAY_BUFFER_SIZE", "1024"))
+REPLAY_GRACE = float(environ.get("REPLAY_GRACE", "30"))  # seconds, 0 disables
+BACKPLANE = environ.get("BACKPLANE", "memory")  # "memory" or "unix"
+BACKPLANE_PATH = environ.get("BACKPLANE_PATH", "/tmp/lg_st_ws.sock")
+WRITE_BEHIND_DELAY = float(environ.get("WRITE_BEHIND_DELAY", "0.05"))  # seconds
+WRITE_BEHIND_BATCH = int(environ.get("WRITE_BEHIND_BATCH", "256"))
+LLM_MAX_CONCURRENCY = int(environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(environ.get("LLM_MAX_RETRIES", "5"))
+LLM_MAX_CONNECTIONS = int(environ.get("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE = int(environ.get("LLM_MAX_KEEPALIVE", "20"))
+LLM_KEEPALIVE_EXPIRY = float(environ.get("LLM_KEEPALIVE_EXPIRY", "60"))  # seconds
+LLM_HTTP2 = environ.get("LLM_HTTP2", "true").lower() == "true"  # needs the h2 package
+LLM_WARMUP_CONNECTIONS = int(environ.get("LLM_WARMUP_CONNECTIONS", "0"))  # 0 disables
+RENDER_WINDOW = int(environ.get("RENDER_WINDOW", "50"))
+WIRE_ENCODING = environ.get("WIRE_ENCODING", "json")  # "json" or "msgpack"
+WIRE_COMPRESS = environ.get("WIRE_COMPRESS", "false").lower() == "true"
+THREAD_SPILL_PATH = environ.get("THREAD_SPILL_PATH", "thread_spill")  # "" disables
+THREAD_MEMORY_BUDGET_MB = int(environ.get("THREAD_MEMORY_BUDGET_MB", "512"))
+THREAD_IDLE_TTL = float(environ.get("THREAD_IDLE_TTL", "1800"))  # seconds, 0 disables
+THREAD_SWEEP_INTERVAL = float(environ.get("THREAD_SWEEP_INTERVAL", "10"))  # seconds
+PRESENCE_WINDOW = float(environ.get("PRESENCE_WINDOW", "0.25"))  # seconds
+# seconds, 0 disables
+HEARTBEAT_INTERVAL = float(environ.get("HEARTBEAT_INTERVAL", "20"))
+HEARTBEAT_TIMEOUT = float(environ.get("HEARTBEAT_TIMEOUT", "20"))  # seconds
+HANDSHAKE_TIMEOUT = float(environ.get("HANDSHAKE_TIMEOUT", "10"))  # seconds
+# 0 disables
+MAX_CONNECTIONS_PER_THREAD = int(environ.get("MAX_CONNECTIONS_PER_THREAD", "0"))
+# 0 disables
+MAX_CONCURRENT_HANDSHAKES = int(environ.get("MAX_CONCURRENT_HANDSHAKES", "0"))
+HANDSHAKE_RATE = float(environ.get("HANDSHAKE_RATE", "0"))  # per second, 0 disables
+HANDSHAKE_BURST = float(environ.get("HANDSHAKE_BURST", "50"))
+# per second, 0 disables
+USER_MESSAGE_RATE = float(environ.get("USER_MESSAGE_RATE", "0"))
+USER_MESSAGE_BURST = float(environ.get("USER_MESSAGE_BURST", "10"))
+# per second, 0 disables
+THREAD_MESSAGE_RATE = float(environ.get("THREAD_MESSAGE_RATE", "0"))
+THREAD_MESSAGE_BURST = float(environ.get("THREAD_MESSAGE_BURST", "100"))
+SEARCH_INDEX_PATH = environ.get("SEARCH_INDEX_PATH", ":memory:")
+SEARCH_PAGE_SIZE = int(environ.get("SEARCH_PAGE_SIZE", "20"))
+SEARCH_MAX_CANDIDATES = int(environ.get("SEARCH_MAX_CANDIDATES", "10000"))
+MUX_QUEUE_SIZE = int(environ.get("MUX_QUEUE_SIZE", "4096"))
+WS_MUX_URL = f"ws://{WS_HOST}:{WS_PORT}/mux/ws"
+WS_MULTIPLEX = environ.get("WS_MULTIPLEX", "true").lower() == "true"
+WS_MUX_POOL_SIZE = int(environ.get("WS_MUX_POOL_SIZE", "4"))
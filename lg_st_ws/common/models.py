@@ -1,22 +1,53 @@
 import json
 import datetime
+import uuid
 from enum import StrEnum
+from functools import cached_property
 from typing import Any, Annotated
 
-from fastapi.encoders import jsonable_encoder
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.messages import (
     BaseMessage,
+    BaseMessageChunk,
     messages_from_dict,
     message_to_dict,
 )
-from langgraph.graph import add_messages
 from pydantic import BaseModel, Field
-from typing_extensions import TypedDict
+from typing_extensions import NotRequired, TypedDict
+
+from lg_st_ws.common.codec import Encoding, compact, dumps
+
+
+def append_messages(
+    left: list[BaseMessage], right: list[BaseMessage]
+) -> list[BaseMessage]:
+    """`add_messages`, with a fast path for plain appends.
+
+    A message without an id can't replace one already in the thread, so a
+    batch made only of those is appended without `add_messages`' pass over
+    the whole history. LangGraph is only imported for the slow path, as this
+    module is also loaded by the frontend.
+    """
+    if isinstance(left, list) and isinstance(right, list):
+        if all(
+            isinstance(m, BaseMessage)
+            and not isinstance(m, BaseMessageChunk)
+            and m.id is None
+            for m in right
+        ):
+            for m in right:
+                m.id = str(uuid.uuid4())
+            return left + right
+    from langgraph.graph import add_messages
+
+    return add_messages(left, right)
 
 
 class GraphState(TypedDict):
-    messages: Annotated[list[HumanMessage | AIMessage | BaseMessage], add_messages]
+    messages: Annotated[list[HumanMessage | AIMessage | BaseMessage], append_messages]
+    # Rolling summary of messages[:summarized_count], which have left the prompt window
+    summary: NotRequired[str]
+    summarized_count: NotRequired[int]
 
 
 # --- Protocol enums ---
@@ -30,10 +61,17 @@ class RoleType(StrEnum):
 
 class MessageType(StrEnum):
     chat = "chat"
+    chat_chunk = "chat_chunk"
     handshake = "handshake"
     system_event = "system_event"
     user_list = "user_list"
+    presence = "presence"
+    ping = "ping"
+    pong = "pong"
     message_history = "message_history"
+    history_request = "history_request"
+    search_request = "search_request"
+    search_results = "search_results"
 
 
 class SystemEvent(StrEnum):
@@ -43,6 +81,8 @@ class SystemEvent(StrEnum):
     ws_closed = "ws_closed"
     ws_error = "ws_error"
     exception = "exception"
+    rejected = "rejected"
+    rate_limited = "rate_limited"
 
 
 # --- Protocol envelope models ---
@@ -51,19 +91,58 @@ class SystemEvent(StrEnum):
 class JSONModel(BaseModel):
     def jsonable_dump(self, *args, **kwargs):
         """Return a JSON-serializable representation of the model."""
-        return jsonable_encoder(self.model_dump(*args, **kwargs))
+        return self.model_dump(*args, mode="json", **kwargs)
 
     def jsonable_dump_json(self, *args, **kwargs) -> str:
         """Return a JSON-serializable string representation of the model."""
         return json.dumps(self.jsonable_dump(*args, **kwargs))
 
+    @cached_property
+    def frame(self) -> str:
+        """Wire-ready JSON text in the compact schema, encoded once and shared
+        by every connection the model is sent to."""
+        return dumps(compact(self))
+
+    def coalesce_key(self) -> str | None:
+        """Frames sharing a key supersede one another in a backed-up send queue.
+
+        Deltas, such as `PresenceMessage`, are merged instead.
+        """
+        return None
+
+
+class SequencedModel(JSONModel):
+    """A frame broadcast to a thread, numbered by the backplane in delivery order.
+
+    The sequence number is only known once the backplane has ordered the
+    frame, so broadcasts are encoded without it and stamped afterwards.
+    """
+
+    seq: int | None = None
+
+    @cached_property
+    def unstamped_frame(self) -> str:
+        return dumps(compact(self, exclude={"seq"}))
+
+    @staticmethod
+    def stamp(unstamped_frame: str, seq: int) -> str:
+        """Insert `seq` into an encoded frame without re-encoding it."""
+        return f'{{"seq":{seq},{unstamped_frame[1:]}'
+
 
 class HandshakeMessage(JSONModel):
     type: MessageType = MessageType.handshake
     username: str
+    # Resume from this broadcast sequence number instead of a history snapshot
+    last_seen_seq: int | None = None
+    # Wire format for the frames this connection receives
+    encoding: Encoding = Encoding.json
+    compress: bool = False
+    # The thread to join; only sent on a multiplexed connection, whose URL has none
+    thread_id: str | None = None
 
 
-class SystemEventMessage(JSONModel):
+class SystemEventMessage(SequencedModel):
     type: MessageType = MessageType.system_event
     event: SystemEvent
     thread_id: str
@@ -75,24 +154,133 @@ class SystemEventMessage(JSONModel):
 
 
 class UserListMessage(JSONModel):
+    """Full presence snapshot, sent to a connection on handshake.
+
+    `version` is that of the latest `PresenceMessage` it includes; later
+    deltas carry higher versions.
+    """
+
     type: MessageType = MessageType.user_list
     thread_id: str
     users: list[str]
+    version: int = 0
     timestamp: datetime.datetime = Field(
         default_factory=lambda: datetime.datetime.now(datetime.UTC)
     )
 
+    def coalesce_key(self) -> str | None:
+        return MessageType.user_list
+
+
+class PresenceMessage(SequencedModel):
+    """Users who arrived in or left a thread during one presence window.
+
+    Versions are consecutive per thread, so a client that holds `version - 1`
+    can apply the delta exactly; one that is further behind can still apply
+    it, but should trust the next snapshot over its own list.
+    """
+
+    type: MessageType = MessageType.presence
+    thread_id: str
+    added: list[str] = []
+    removed: list[str] = []
+    version: int
+    timestamp: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(datetime.UTC)
+    )
+
+    def coalesce_key(self) -> str | None:
+        return MessageType.presence
+
+    def merged(self, later: "PresenceMessage") -> "PresenceMessage":
+        """One delta with the effect of this one followed by `later`.
+
+        It keeps this one's place in the sequence, so frames sent between
+        the two are not taken for replays, and carries `later`'s version.
+        """
+        added = [u for u in self.added if u not in later.removed]
+        added += [u for u in later.added if u not in added]
+        removed = [u for u in self.removed if u not in later.added]
+        removed += [u for u in later.removed if u not in removed]
+        return PresenceMessage(
+            seq=self.seq,
+            thread_id=self.thread_id,
+            added=added,
+            removed=removed,
+            version=later.version,
+            timestamp=later.timestamp,
+        )
+
+
+class PingMessage(JSONModel):
+    """Liveness probe; a connection that stops answering with `PongMessage` is reaped."""
+
+    type: MessageType = MessageType.ping
+
+
+class PongMessage(JSONModel):
+    type: MessageType = MessageType.pong
+
 
 class MessageHistory(JSONModel):
+    """One page of a thread's history, oldest message first.
+
+    `cursor` is the thread index of the first message in the page; send it
+    back as `HistoryRequestMessage.before` to fetch the page preceding it.
+    `before` echoes the request and is None for the handshake page.
+    """
+
     type: MessageType = MessageType.message_history
     thread_id: str
     messages: list[dict[str, Any]]  # serialized LangChain messages
+    cursor: int = 0
+    has_more: bool = False
+    before: int | None = None
+    timestamp: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(datetime.UTC)
+    )
+
+
+class HistoryRequestMessage(JSONModel):
+    type: MessageType = MessageType.history_request
+    before: int
+    limit: int = 50
+
+
+class SearchRequestMessage(JSONModel):
+    type: MessageType = MessageType.search_request
+    query: str
+    offset: int = 0
+    limit: int = 20
+
+
+class SearchHit(BaseModel):
+    message_id: str
+    position: int  # index in the thread's history
+    username: str
+    timestamp: str
+    snippet: str  # matched words in **bold**
+    score: float
+
+
+class SearchResults(JSONModel):
+    """One page of search hits, best match first.
+
+    Open a hit in context with `HistoryRequestMessage(before=position + 1)`.
+    """
+
+    type: MessageType = MessageType.search_results
+    thread_id: str
+    query: str
+    hits: list[SearchHit]
+    offset: int = 0
+    has_more: bool = False
     timestamp: datetime.datetime = Field(
         default_factory=lambda: datetime.datetime.now(datetime.UTC)
     )
 
 
-class ChatMessage(JSONModel):
+class ChatMessage(SequencedModel):
     type: MessageType = MessageType.chat
     thread_id: str
     message: dict[str, Any]  # serialized LangChain message
@@ -112,3 +300,22 @@ class ChatMessage(JSONModel):
 
     def to_lc_message(self) -> BaseMessage:
         return messages_from_dict([self.message])[0]
+
+
+class ChatChunkMessage(JSONModel):
+    """Incremental piece of a bot reply that is still being generated.
+
+    Chunks share `message_id` with the `ChatMessage` that commits the
+    complete reply once generation finishes. They are broadcast without a
+    sequence number and never replayed: a client that misses some only
+    shows part of the draft until that `ChatMessage` replaces it.
+    """
+
+    type: MessageType = MessageType.chat_chunk
+    thread_id: str
+    message_id: str
+    username: str
+    delta: str
+    timestamp: datetime.datetime = Field(
+        default_factory=lambda: datetime.datetime.now(datetime.UTC)
+    )
@@ -1,22 +1,44 @@
 import datetime
+import queue
 from zoneinfo import ZoneInfo, available_timezones
 
 import streamlit as st
 from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
 
-from lg_st_ws.common.config import BOT_NAME
+from lg_st_ws.common.config import BOT_NAME, RENDER_WINDOW
 from lg_st_ws.common.models import (
     ChatMessage,
+    HistoryRequestMessage,
     SystemEvent,
     SystemEventMessage,
 )
 from lg_st_ws.common.util import utc_str_to_local_str, utc_dt_to_local_str
-from lg_st_ws.frontend.ws_impl import start_ws_worker_impl
+from lg_st_ws.frontend.ws_impl import drain_inbox, start_ws_worker_impl
 
+if "inbox" not in st.session_state:
+    st.session_state.inbox = queue.SimpleQueue()
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 if "user_list" not in st.session_state:
     st.session_state.user_list = []
+    st.session_state.presence_version = 0
+if "streaming_messages" not in st.session_state:
+    st.session_state.streaming_messages = {}
+if "history_cursor" not in st.session_state:
+    st.session_state.history_cursor = 0
+if "history_has_more" not in st.session_state:
+    st.session_state.history_has_more = False
+if "last_seen_seq" not in st.session_state:
+    st.session_state.last_seen_seq = None
+if "history_version" not in st.session_state:
+    st.session_state.history_version = 0
+if "render_window" not in st.session_state:
+    st.session_state.render_window = RENDER_WINDOW
+if "render_cache" not in st.session_state:
+    st.session_state.render_cache = {}
+    st.session_state.render_cache_tz = None
+    st.session_state.rendered = []
+    st.session_state.rendered_key = None
 if "ws_app" not in st.session_state:
     st.session_state.ws_app = None
 if "ws_thread" not in st.session_state:
@@ -34,8 +56,16 @@ def reset_session():
         st.session_state.ws_app.close()
     st.session_state.ws_app = None
     st.session_state.ws_thread = None
+    st.session_state.inbox = queue.SimpleQueue()
     st.session_state.chat_history = []
     st.session_state.user_list = []
+    st.session_state.presence_version = 0
+    st.session_state.streaming_messages = {}
+    st.session_state.history_cursor = 0
+    st.session_state.history_has_more = False
+    st.session_state.last_seen_seq = None
+    st.session_state.history_version += 1
+    st.session_state.render_window = RENDER_WINDOW
     st.session_state.thread_id = ""
     st.session_state.username = ""
     st.session_state.chat_active = False
@@ -104,7 +134,11 @@ def display_user_list():
         st.markdown(f"**Connected users:** {users_str}", unsafe_allow_html=True)
 
 
-def display_lc_message(msg: BaseMessage):
+# A rendered entry is (chat role or None, markdown)
+Rendered = tuple[str | None, str]
+
+
+def format_lc_message(msg: BaseMessage) -> Rendered:
     if isinstance(msg, AIMessage):
         md = msg.response_metadata
         role = "ai"
@@ -119,38 +153,82 @@ def display_lc_message(msg: BaseMessage):
     timestamp = md["timestamp"]
 
     time_str = utc_str_to_local_str(timestamp, local_tz)
-    st.chat_message(role).markdown(f"**{username}** [{time_str}]: {content}")
+    return role, f"**{username}** [{time_str}]: {content}"
 
 
-def display_se_message(msg: SystemEventMessage):
+def format_se_message(msg: SystemEventMessage) -> Rendered:
     time_str = utc_dt_to_local_str(msg.timestamp, local_tz)
-    if msg.event == SystemEvent.error:
-        st.markdown(
+    if msg.event in (SystemEvent.error, SystemEvent.rejected, SystemEvent.rate_limited):
+        return (
+            None,
             f"<span style='color:red'>*{msg.content}*</span>  \n<small>{time_str}</small>",
-            unsafe_allow_html=True,
         )
+    return None, f"*{msg.content}*  \n<small>{time_str}</small>"
+
+
+def format_entry(msg) -> Rendered:
+    if isinstance(msg, BaseMessage):
+        return format_lc_message(msg)
+    elif isinstance(msg, SystemEventMessage):
+        return format_se_message(msg)
+    return None, str(msg)
+
+
+def render_window() -> list[Rendered]:
+    """Formatted entries for the visible window of chat history.
+
+    Entries are cached per message object (and content length, so streamed
+    drafts refresh as they grow); the whole window is reused as long as the
+    history version and time zone are unchanged.
+    """
+    state = st.session_state
+    key = (state.history_version, state.render_window, user_timezone)
+    if state.rendered_key == key:
+        return state.rendered
+    if state.render_cache_tz != user_timezone:
+        state.render_cache = {}
+        state.render_cache_tz = user_timezone
+    cache = {}
+    rendered = []
+    for msg in state.chat_history[-state.render_window :]:
+        size = len(msg.content) if isinstance(msg, BaseMessage) else 0
+        hit = state.render_cache.get(id(msg))
+        if hit is None or hit[0] is not msg or hit[1] != size:
+            hit = (msg, size, format_entry(msg))
+        cache[id(msg)] = hit
+        rendered.append(hit[2])
+    state.render_cache = cache
+    state.rendered = rendered
+    state.rendered_key = key
+    return rendered
+
+
+def display_entry(entry: Rendered):
+    role, markdown = entry
+    if role is not None:
+        st.chat_message(role).markdown(markdown)
     else:
-        st.markdown(
-            f"*{msg.content}*  \n<small>{time_str}</small>",
-            unsafe_allow_html=True,
-        )
+        st.markdown(markdown, unsafe_allow_html=True)
 
 
-def display_other(msg: str):
-    st.markdown(msg)
+def display_load_older():
+    hidden = len(st.session_state.chat_history) - st.session_state.render_window
+    can_fetch = st.session_state.history_has_more and st.session_state.ws_app
+    if (hidden > 0 or can_fetch) and st.button("Load older messages"):
+        st.session_state.render_window += RENDER_WINDOW
+        if hidden <= 0:
+            request = HistoryRequestMessage(before=st.session_state.history_cursor)
+            st.session_state.ws_app.send(request.jsonable_dump_json())
 
 
 @st.fragment(run_every=chat_update_interval)
 def display_output():
+    drain_inbox()
     display_user_list()
+    display_load_older()
 
-    for msg in st.session_state.chat_history:
-        if isinstance(msg, BaseMessage):
-            display_lc_message(msg)
-        elif isinstance(msg, SystemEventMessage):
-            display_se_message(msg)
-        else:
-            display_other(msg)
+    for entry in render_window():
+        display_entry(entry)
 
 
 def send_user_input(user_input: str):
@@ -1,68 +1,156 @@
 import datetime
 import json
+import queue
 from typing import Any
 
 import streamlit as st
 import websocket
-
-from lg_st_ws.common.config import WS_URL
+from langchain_core.messages import AIMessage
+
+from lg_st_ws.common.codec import Codec, Encoding
+from lg_st_ws.common.config import (
+    WS_URL,
+    WS_MUX_URL,
+    WS_MULTIPLEX,
+    WS_MUX_POOL_SIZE,
+    WIRE_ENCODING,
+    WIRE_COMPRESS,
+)
 from lg_st_ws.common.models import (
     MessageType,
     ChatMessage,
+    ChatChunkMessage,
     SystemEventMessage,
     SystemEvent,
     UserListMessage,
+    PresenceMessage,
     MessageHistory,
     HandshakeMessage,
+    PongMessage,
 )
 from lg_st_ws.common.util import deserialize_history
+from lg_st_ws.frontend.ws_mux import WebSocketMux
 from lg_st_ws.frontend.ws_protocol import get_config, start_ws_worker
 
 
-def on_message(ws: websocket.WebSocket, message: str):
-    try:
-        data = json.loads(message)
-        msg_type = data.get("type")
-        if msg_type == MessageType.chat:
-            incoming_chat_msg = ChatMessage(**data)
-            lc_msg = incoming_chat_msg.to_lc_message()
-            st.session_state.chat_history.append(lc_msg)
-        elif msg_type == MessageType.system_event:
-            sys_msg = SystemEventMessage(**data)
-            st.session_state.chat_history.append(sys_msg)
-            if sys_msg.event == SystemEvent.user_joined:
-                if sys_msg.username not in st.session_state.user_list:
-                    st.session_state.user_list.append(sys_msg.username)
-            elif sys_msg.event == SystemEvent.user_left:
-                if sys_msg.username in st.session_state.user_list:
-                    st.session_state.user_list.remove(sys_msg.username)
-        elif msg_type == MessageType.user_list:
-            user_list_msg = UserListMessage(**data)
-            st.session_state.user_list = user_list_msg.users
-        elif msg_type == MessageType.message_history:
-            history_msg = MessageHistory(**data)
-            st.session_state.chat_history = deserialize_history(history_msg.messages)
-        elif "error" in data:
-            # Represent errors as a system event for the UI
-            error_event = SystemEventMessage(
-                type=MessageType.system_event,
-                event=SystemEvent.error,
-                thread_id=st.session_state.thread_id,
-                username="system",
-                content=f"Error: {data['error']}",
-                timestamp=datetime.datetime.now(datetime.UTC),
-            )
-            st.session_state.chat_history.append(error_event)
-    except Exception as e:
-        error_event = SystemEventMessage(
+def on_message(ws: websocket.WebSocket, message: str | bytes):
+    # Runs on the websocket thread: hand the raw frame to the script thread
+    st.session_state.inbox.put(message)
+
+
+def drain_inbox() -> int:
+    """Apply every frame queued by the websocket thread to session state.
+
+    Called from the script thread on each tick, so chat history and the user
+    list are only ever mutated by the thread that renders them. Returns the
+    number of frames applied.
+    """
+    inbox: queue.SimpleQueue = st.session_state.inbox
+    applied = 0
+    while True:
+        try:
+            message = inbox.get_nowait()
+        except queue.Empty:
+            break
+        applied += 1
+        if message is None:
+            append_system_event(SystemEvent.ws_closed, "WebSocket closed.")
+            continue
+        try:
+            apply_frame(Codec.decode(message))
+        except Exception as e:
+            append_system_event(SystemEvent.error, f"Error parsing message: {e}")
+    if applied:
+        st.session_state.history_version += 1
+    return applied
+
+
+def append_system_event(event: SystemEvent, content: str):
+    st.session_state.chat_history.append(
+        SystemEventMessage(
             type=MessageType.system_event,
-            event=SystemEvent.error,
+            event=event,
             thread_id=st.session_state.thread_id,
             username="system",
-            content=f"Error parsing message: {e}",
+            content=content,
             timestamp=datetime.datetime.now(datetime.UTC),
         )
-        st.session_state.chat_history.append(error_event)
+    )
+
+
+def apply_frame(data: dict):
+    seq = data.get("seq")
+    if seq is not None:
+        if (
+            st.session_state.last_seen_seq is not None
+            and seq <= st.session_state.last_seen_seq
+        ):
+            return  # already seen, e.g. replayed after a reconnect
+        st.session_state.last_seen_seq = seq
+    msg_type = data.get("type")
+    if msg_type == MessageType.ping:
+        # Answered from the script thread, so a session that stops rendering is reaped
+        if st.session_state.ws_app is not None:
+            st.session_state.ws_app.send(json.dumps(PongMessage().jsonable_dump()))
+    elif msg_type == MessageType.chat_chunk:
+        # Hot path while a reply streams: only the first chunk is validated
+        partial = st.session_state.streaming_messages.get(data["message_id"])
+        if partial is None:
+            chunk_msg = ChatChunkMessage(**data)
+            partial = AIMessage(
+                content=chunk_msg.delta,
+                id=chunk_msg.message_id,
+                response_metadata={
+                    "username": chunk_msg.username,
+                    "timestamp": chunk_msg.timestamp.isoformat(),
+                },
+            )
+            st.session_state.streaming_messages[chunk_msg.message_id] = partial
+            st.session_state.chat_history.append(partial)
+        else:
+            partial.content += data["delta"]
+    elif msg_type == MessageType.chat:
+        incoming_chat_msg = ChatMessage(**data)
+        lc_msg = incoming_chat_msg.to_lc_message()
+        partial = st.session_state.streaming_messages.pop(lc_msg.id, None)
+        if partial is not None:
+            # Commit the finished reply in place of its streamed draft
+            idx = next(
+                i for i, m in enumerate(st.session_state.chat_history) if m is partial
+            )
+            st.session_state.chat_history[idx] = lc_msg
+        else:
+            st.session_state.chat_history.append(lc_msg)
+    elif msg_type == MessageType.system_event:
+        st.session_state.chat_history.append(SystemEventMessage(**data))
+    elif msg_type == MessageType.presence:
+        presence_msg = PresenceMessage(**data)
+        if presence_msg.version <= st.session_state.presence_version:
+            return  # already covered by the snapshot
+        st.session_state.presence_version = presence_msg.version
+        removed = set(presence_msg.removed)
+        users = [u for u in st.session_state.user_list if u not in removed]
+        users += [u for u in presence_msg.added if u not in users]
+        st.session_state.user_list = users
+    elif msg_type == MessageType.user_list:
+        user_list_msg = UserListMessage(**data)
+        st.session_state.user_list = user_list_msg.users
+        st.session_state.presence_version = user_list_msg.version
+    elif msg_type == MessageType.message_history:
+        history_msg = MessageHistory(**data)
+        page = deserialize_history(history_msg.messages)
+        if history_msg.before is None:
+            st.session_state.chat_history = page
+            st.session_state.streaming_messages = {}
+        elif history_msg.before == st.session_state.history_cursor:
+            st.session_state.chat_history = page + st.session_state.chat_history
+        else:
+            return  # stale page for a cursor we have already moved past
+        st.session_state.history_cursor = history_msg.cursor
+        st.session_state.history_has_more = history_msg.has_more
+    elif "error" in data:
+        # Represent errors as a system event for the UI
+        append_system_event(SystemEvent.error, f"Error: {data['error']}")
 
 
 def on_error(ws: websocket.WebSocket, error: Any):
@@ -81,22 +169,22 @@ def on_error(ws: websocket.WebSocket, error: Any):
 
 
 def on_close(ws: websocket.WebSocket, close_status_code, close_msg):
-    close_event = SystemEventMessage(
-        type=MessageType.system_event,
-        event=SystemEvent.ws_closed,
-        thread_id=st.session_state.thread_id,
-        username="system",
-        content="WebSocket closed.",
-        timestamp=datetime.datetime.now(datetime.UTC),
-    )
-    st.session_state.chat_history.append(close_event)
+    st.session_state.inbox.put(None)
 
 
-def on_open(ws: websocket.WebSocket):
+def handshake_frame(thread_id: str | None = None) -> str:
     handshake = HandshakeMessage(
         username=st.session_state.username,
+        last_seen_seq=st.session_state.last_seen_seq,
+        encoding=Encoding(WIRE_ENCODING),
+        compress=WIRE_COMPRESS,
+        thread_id=thread_id,
     )
-    ws.send(json.dumps(handshake.jsonable_dump()))
+    return json.dumps(handshake.jsonable_dump())
+
+
+def on_open(ws: websocket.WebSocket):
+    ws.send(handshake_frame())
 
 
 def get_ws_url() -> str:
@@ -113,5 +201,25 @@ cfg = get_config(
 )
 
 
+@st.cache_resource
+def get_ws_mux() -> WebSocketMux:
+    return WebSocketMux(WS_MUX_URL, WS_MUX_POOL_SIZE)
+
+
+def open_ws_channel():
+    """Open this session's channel on the process's shared connections, unless it has one."""
+    state = st.session_state
+    if not all(state.get(key) for key in cfg["state_requirements"]):
+        return
+    if state.get("ws_app") is not None and not state.ws_app.closed:
+        return
+    state.ws_app = get_ws_mux().open(
+        state.thread_id, handshake_frame(state.thread_id), state.inbox
+    )
+
+
 def start_ws_worker_impl():
-    start_ws_worker(cfg)
+    if WS_MULTIPLEX:
+        open_ws_channel()
+    else:
+        start_ws_worker(cfg)
@@ -0,0 +1,156 @@
+"""Process-wide websocket multiplexer for the Streamlit frontend.
+
+Instead of a websocket and a thread per session, every session in the
+Streamlit process shares a small pool of connections to the backend's
+`/mux/ws` endpoint, run by one asyncio event loop on one thread. Each
+session opens a `Channel` on the connection its thread is pinned to, and
+gets its frames in its inbox, just as from its own `websocket.WebSocketApp`.
+"""
+
+import asyncio
+import itertools
+import queue
+import threading
+
+from websockets.asyncio.client import ClientConnection, connect
+
+from lg_st_ws.common.codec import route, unroute
+from lg_st_ws.common.models import SystemEvent, SystemEventMessage
+
+
+class Channel:
+    """One session's view of a pooled connection.
+
+    It has the `send` and `close` of the `websocket.WebSocketApp` it
+    replaces, and may be used from any thread. Once closed, by either side
+    or because the connection dropped, None is put in the inbox and sends
+    are dropped; open a new channel to reconnect. If the connection failed,
+    a `SystemEventMessage` saying why comes just before the None.
+    """
+
+    def __init__(
+        self,
+        connection: "PooledConnection",
+        channel_id: int,
+        thread_id: str,
+        inbox: queue.SimpleQueue,
+    ):
+        self.connection = connection
+        self.id = channel_id
+        self.thread_id = thread_id
+        self.inbox = inbox
+        self.closed = False
+
+    def send(self, data: str):
+        if not self.closed:
+            self.connection.post(self, data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.connection.post(self, "")
+
+
+class PooledConnection:
+    """A websocket carrying many channels, opened when first needed.
+
+    Everything but `post` runs on the multiplexer's event loop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, url: str):
+        self.loop = loop
+        self.url = url
+        self.channels: dict[int, Channel] = {}
+        self._outbox: asyncio.Queue[str] | None = None
+
+    def post(self, channel: Channel, data: str):
+        self.loop.call_soon_threadsafe(self._send, channel, data)
+
+    def _send(self, channel: Channel, data: str):
+        if self._outbox is None:
+            self._outbox = asyncio.Queue()
+            self.loop.create_task(self._run(self._outbox))
+        if data:
+            if channel.closed and channel.id not in self.channels:
+                return  # closed by the server or a dropped connection
+            self.channels[channel.id] = channel
+        elif self.channels.pop(channel.id, None) is None:
+            return
+        self._outbox.put_nowait(route([channel.id], data))
+
+    async def _run(self, outbox: asyncio.Queue[str]):
+        error = None
+        try:
+            async with connect(self.url, max_size=None) as ws:
+                sender = asyncio.create_task(self._write(ws, outbox))
+                try:
+                    async for data in ws:
+                        channel_ids, frame = unroute(data)
+                        for channel_id in channel_ids:
+                            self._deliver(channel_id, frame)
+                finally:
+                    sender.cancel()
+        except Exception as e:
+            error = e
+            self.loop.call_exception_handler(
+                {
+                    "message": f"Multiplexed connection to {self.url} failed",
+                    "exception": e,
+                }
+            )
+        finally:
+            if self._outbox is outbox:
+                self._outbox = None
+            for channel in self.channels.values():
+                channel.closed = True
+                if error is not None:
+                    channel.inbox.put(self._error_frame(channel, error))
+                channel.inbox.put(None)
+            self.channels.clear()
+
+    async def _write(self, ws: ClientConnection, outbox: asyncio.Queue[str]):
+        while True:
+            await ws.send(await outbox.get())
+
+    def _error_frame(self, channel: Channel, error: Exception) -> str:
+        return SystemEventMessage(
+            event=SystemEvent.ws_error,
+            thread_id=channel.thread_id,
+            username="system",
+            content=f"Lost the connection to the server: {error!r}",
+        ).frame
+
+    def _deliver(self, channel_id: int, frame: str | bytes):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            return
+        if frame:
+            channel.inbox.put(frame)
+        else:
+            del self.channels[channel_id]
+            channel.closed = True
+            channel.inbox.put(None)
+
+
+class WebSocketMux:
+    """The frontend process's pool of multiplexed backend connections.
+
+    Every session in a thread shares one connection, so the backend can
+    send a broadcast to all of them at once.
+    """
+
+    def __init__(self, url: str, pool_size: int = 4):
+        self.loop = asyncio.new_event_loop()
+        self.pool = [PooledConnection(self.loop, url) for _ in range(max(pool_size, 1))]
+        self._ids = itertools.count(1)
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="ws-mux", daemon=True
+        )
+        self._thread.start()
+
+    def open(self, thread_id: str, handshake: str, inbox: queue.SimpleQueue) -> Channel:
+        """Open a channel to a thread; `handshake` is the `HandshakeMessage` naming it."""
+        connection = self.pool[hash(thread_id) % len(self.pool)]
+        channel = Channel(connection, next(self._ids), thread_id, inbox)
+        channel.send(handshake)
+        return channel
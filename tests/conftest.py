@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+
+class FakeWebSocket:
+    """Stands in for a starlette `WebSocket`: records what is sent to it, and
+    `receive` returns the messages put in `incoming`."""
+
+    def __init__(self):
+        self.sent: list[str | bytes] = []
+        self.close_code: int | None = None
+        self.incoming: asyncio.Queue[dict] = asyncio.Queue()
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    async def send_text(self, data: str):
+        self.sent.append(data)
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        self.close_code = code
+
+
+@pytest.fixture
+def make_ws():
+    return FakeWebSocket
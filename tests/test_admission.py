@@ -0,0 +1,67 @@
+import pytest
+
+from lg_st_ws.backend import admission
+from lg_st_ws.backend.admission import AdmissionController, Rejection
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_user_bucket_refuses_a_burst_then_refills(clock):
+    controller = AdmissionController(user_rate=2, user_burst=3)
+    assert [controller.admit_message("t", "alice") for _ in range(4)] == [
+        None,
+        None,
+        None,
+        Rejection.user_rate,
+    ]
+    # Other users have buckets of their own
+    assert controller.admit_message("t", "bob") is None
+
+    clock[0] += 0.5  # one token back at 2 per second
+    assert controller.admit_message("t", "alice") is None
+    assert controller.admit_message("t", "alice") == Rejection.user_rate
+    assert controller.rejections[Rejection.user_rate] == 2
+
+
+def test_thread_bucket_refusal_takes_no_user_token(clock):
+    controller = AdmissionController(
+        user_rate=1, user_burst=2, thread_rate=1, thread_burst=1
+    )
+    assert controller.admit_message("t", "alice") is None
+    assert controller.admit_message("t", "bob") == Rejection.thread_rate
+    # Messages that aren't thread-wide only spend the user's tokens
+    assert controller.admit_message("t", "bob", thread_wide=False) is None
+    assert controller.admit_message("t", "bob", thread_wide=False) is None
+    assert controller.admit_message("t", "bob", thread_wide=False) == (
+        Rejection.user_rate
+    )
+
+    clock[0] += 1
+    assert controller.admit_message("t", "alice") is None
+
+
+def test_handshakes_are_limited_by_rate_and_concurrency(clock):
+    controller = AdmissionController(
+        max_handshakes=2, handshake_rate=10, handshake_burst=2
+    )
+    assert controller.begin_handshake() is None
+    assert controller.begin_handshake() is None
+    assert controller.begin_handshake() == Rejection.handshake_busy
+    controller.end_handshake()
+    assert controller.begin_handshake() == Rejection.handshake_rate
+    clock[0] += 0.1
+    assert controller.begin_handshake() is None
+
+
+def test_full_buckets_are_swept(clock):
+    buckets = admission.KeyedBuckets(rate=1, burst=1, sweep_every=3)
+    buckets.bucket("a", clock[0]).tokens -= 1
+    buckets.bucket("b", clock[0]).tokens -= 1
+    clock[0] += 1
+    buckets.bucket("c", clock[0])  # third call sweeps the refilled buckets
+    assert set(buckets.buckets) == {"c"}
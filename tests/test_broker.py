@@ -0,0 +1,94 @@
+import asyncio
+import os
+
+import pytest
+
+from lg_st_ws.backend.backplane import UnixSocketBackplane, decode_line, encode_line
+from lg_st_ws.backend.broker import Broker
+from lg_st_ws.backend.fanout import SlowConsumerPolicy
+
+
+def test_stalled_worker_does_not_hold_up_the_others(tmp_path):
+    async def scenario():
+        broker = Broker(max_queue=64, policy=SlowConsumerPolicy.drop_oldest)
+        path = str(tmp_path / "broker.sock")
+        server = await asyncio.start_unix_server(broker.handle, path, limit=2**24)
+        # The stalled worker subscribes and then never reads
+        _, stalled = await asyncio.open_unix_connection(path)
+        reader, healthy = await asyncio.open_unix_connection(path, limit=2**24)
+        for writer in (stalled, healthy):
+            writer.write(encode_line(["sub", "t"]))
+            await writer.drain()
+        await asyncio.sleep(0.05)
+
+        count, frame = 5000, "x" * 1000
+        seqs = []
+
+        async def read():
+            while len(seqs) < count:
+                header, _ = decode_line(await reader.readline())
+                seqs.append(header[2])
+
+        reading = asyncio.create_task(read())
+        for _ in range(count):
+            broker.publish("t", frame)
+            await asyncio.sleep(0)
+        async with asyncio.timeout(10):
+            await reading
+        assert seqs == sorted(seqs)
+
+        slow = next(w for w in broker.subscribers["t"] if w.dropped)
+        assert len(slow._queue) <= 64
+        for writer in (stalled, healthy):
+            writer.close()
+        server.close()
+
+    asyncio.run(scenario())
+
+
+def test_backplane_fails_requests_and_reconnects_when_the_broker_goes(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "broker.sock")
+        connections: list[asyncio.StreamWriter] = []
+
+        async def silent(reader, writer):
+            # Reads requests and never answers them
+            connections.append(writer)
+            while await reader.readline():
+                pass
+
+        server = await asyncio.start_unix_server(silent, path)
+        delivered = []
+        backplane = UnixSocketBackplane(path, reconnect_delay=0.01)
+        await backplane.start(lambda *args: delivered.append(args))
+        await backplane.subscribe("t")
+        await backplane.join("t", "alice")
+        pending = asyncio.create_task(backplane.presence("t"))
+        await asyncio.sleep(0.05)
+
+        server.close()
+        os.remove(path)
+        for writer in connections:
+            writer.close()
+        with pytest.raises(ConnectionError):
+            async with asyncio.timeout(1):
+                await pending
+
+        broker = Broker(presence_window=0)
+        server = await asyncio.start_unix_server(broker.handle, path, limit=2**24)
+        async with asyncio.timeout(1):
+            while "t" not in broker.subscribers:
+                await asyncio.sleep(0.01)
+            assert (await backplane.presence("t"))[0] == ["alice"]
+        broker.publish("t", "hello")
+        async with asyncio.timeout(1):
+            while not any(frame == "hello" for _, _, frame, _ in delivered):
+                await asyncio.sleep(0.01)
+        await backplane.close()
+        server.close()
+
+    loop_errors = []
+    with asyncio.Runner() as runner:
+        runner.get_loop().set_exception_handler(lambda _, ctx: loop_errors.append(ctx))
+        runner.run(scenario())
+    assert any(isinstance(ctx.get("exception"), ConnectionError) for ctx in loop_errors)
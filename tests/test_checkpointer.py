@@ -0,0 +1,127 @@
+import asyncio
+import os
+import sqlite3
+
+from langchain_core.messages import HumanMessage
+from langgraph.graph import START, StateGraph
+
+from lg_st_ws.backend.checkpointer import SpillingSaver, SQLiteSaver
+from lg_st_ws.common.models import GraphState
+
+
+def build_graph(saver):
+    builder = StateGraph(GraphState)
+    builder.add_node("noop", lambda state: {})
+    builder.add_edge(START, "noop")
+    return builder.compile(checkpointer=saver)
+
+
+def say(text: str) -> HumanMessage:
+    return HumanMessage(
+        content=text,
+        metadata={"username": "alice", "timestamp": "2026-01-01T00:00:00Z"},
+    )
+
+
+CONFIG = {"configurable": {"thread_id": "t"}}
+
+
+def test_sqlite_saver_round_trips_across_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteSaver(path, flush_interval=60)
+    graph = build_graph(saver)
+    for i in range(5):
+        graph.invoke({"messages": [say(f"message {i}")]}, CONFIG)
+    # Reads flush; the last write is still buffered and only close commits it
+    graph.get_state(CONFIG)
+    graph.invoke({"messages": [say("message 5")]}, CONFIG)
+    saver.close()
+
+    # Appends were stored as deltas on earlier versions
+    with sqlite3.connect(path) as conn:
+        depths = [
+            d
+            for (d,) in conn.execute(
+                "SELECT depth FROM blobs WHERE channel = 'messages'"
+            )
+        ]
+    assert max(depths) > 0
+
+    reopened = SQLiteSaver(path)
+    try:
+        state = build_graph(reopened).get_state(CONFIG)
+        contents = [m.content for m in state.values["messages"]]
+        assert contents == [f"message {i}" for i in range(6)]
+    finally:
+        reopened.close()
+
+
+def test_sqlite_saver_close_is_idempotent(tmp_path):
+    saver = SQLiteSaver(str(tmp_path / "checkpoints.sqlite"))
+    saver.close()
+    saver.close()
+
+
+def contents(state) -> list[str]:
+    return [m.content for m in state.values["messages"]]
+
+
+def test_spilled_thread_reloads_on_next_use(tmp_path):
+    async def scenario():
+        saver = SpillingSaver(str(tmp_path / "spill"))
+        graph = build_graph(saver)
+        for i in range(3):
+            await graph.ainvoke({"messages": [say(f"message {i}")]}, CONFIG)
+        resident = saver.resident_bytes()
+
+        assert await saver.aevict("t") == resident > 0
+        assert saver.spilled == {"t"} and saver.resident_bytes() == 0
+        assert os.path.exists(saver._path("t"))
+
+        # Concurrent readers share one load
+        states = await asyncio.gather(*(graph.aget_state(CONFIG) for _ in range(3)))
+        assert all(contents(s) == [f"message {i}" for i in range(3)] for s in states)
+        assert saver.reloads == 1 and not saver.spilled
+        assert not os.path.exists(saver._path("t"))
+        assert saver.resident_bytes() == resident
+
+        await graph.ainvoke({"messages": [say("message 3")]}, CONFIG)
+        state = await graph.aget_state(CONFIG)
+        assert contents(state) == [f"message {i}" for i in range(4)]
+
+    asyncio.run(scenario())
+
+
+def test_thread_used_during_eviction_stays_in_memory(tmp_path):
+    async def scenario():
+        saver = SpillingSaver(str(tmp_path / "spill"))
+        graph = build_graph(saver)
+        await graph.ainvoke({"messages": [say("message 0")]}, CONFIG)
+
+        evicting = asyncio.create_task(saver.aevict("t"))
+        await asyncio.sleep(0)  # taken out of memory, file not written yet
+        state = await graph.aget_state(CONFIG)
+        assert contents(state) == ["message 0"]
+
+        assert await evicting == 0
+        assert not saver.spilled and saver.evictions == 0
+        assert not os.path.exists(saver._path("t"))
+
+    asyncio.run(scenario())
+
+
+def test_spill_dirs_are_per_process(tmp_path):
+    root = tmp_path / "spill"
+    saver = SpillingSaver(str(root))
+    assert not root.exists()
+    saver.clear_spill_dir()
+    assert saver.spill_dir == str(root / str(os.getpid()))
+
+    (root / str(os.getppid())).mkdir()  # another worker, still running
+    (root / str(os.getppid()) / "t.spill").write_bytes(b"")
+    (root / "999999999").mkdir()  # a worker that has exited
+    (root / str(os.getpid()) / "stale.spill").write_bytes(b"")
+    saver.clear_spill_dir()
+    assert sorted(os.listdir(root)) == sorted([str(os.getpid()), str(os.getppid())])
+    assert os.listdir(saver.spill_dir) == []
+    assert os.listdir(root / str(os.getppid())) == ["t.spill"]
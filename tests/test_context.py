@@ -0,0 +1,42 @@
+from langchain_core.messages import HumanMessage
+
+from lg_st_ws.backend.context import ContextBuilder
+
+
+def messages(count: int) -> list[HumanMessage]:
+    return [
+        HumanMessage(
+            content=f"message number {i} " + "word " * 20,
+            id=str(i),
+            metadata={"username": "alice", "timestamp": "2026-01-01T00:00:00Z"},
+        )
+        for i in range(count)
+    ]
+
+
+def test_backlog_is_folded_in_chunks_across_runs():
+    builder = ContextBuilder(max_tokens=200, keep_tokens=100)
+    history = messages(100)
+    summarized, chunks = 0, []
+    while True:
+        start = summarized
+        summarized, folded = builder.fold(history, start)
+        if not folded:
+            break
+        chunks.append(folded)
+        assert len(folded) == summarized - start
+        tokens = sum(builder.formatted(m)[1] for m in history[start:summarized])
+        assert tokens <= builder.max_tokens
+
+    assert len(chunks) > 1
+    # Everything up to the live window, which now fits, was summarized in order
+    assert builder._cut(history, summarized, builder.max_tokens) == summarized
+    folded_text = [m.content for chunk in chunks for m in chunk]
+    assert folded_text == [
+        builder.formatted(m)[0].content for m in history[:summarized]
+    ]
+
+
+def test_nothing_is_folded_while_the_window_fits():
+    builder = ContextBuilder(max_tokens=10_000, keep_tokens=100)
+    assert builder.fold(messages(10), 0) == (0, [])
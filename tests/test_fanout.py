@@ -0,0 +1,34 @@
+import asyncio
+
+from lg_st_ws.backend.fanout import ConnectionWriter, Frame, SlowConsumerPolicy
+from lg_st_ws.common.models import PresenceMessage, SequencedModel
+
+
+def presence(seq: int, version: int, added=(), removed=()) -> Frame:
+    msg = PresenceMessage(
+        thread_id="t", added=list(added), removed=list(removed), version=version
+    )
+    return Frame(
+        SequencedModel.stamp(msg.unstamped_frame, seq), seq, msg.coalesce_key()
+    )
+
+
+def test_backed_up_presence_deltas_are_merged(make_ws):
+    async def scenario():
+        writer = ConnectionWriter(
+            make_ws(), max_queue=2, policy=SlowConsumerPolicy.coalesce
+        )
+        writer.enqueue(presence(10, 1, added=["alice", "bob"], removed=["carol"]))
+        writer.enqueue(Frame('{"seq":11,"type":"chat"}', 11))
+        writer.enqueue(presence(12, 2, added=["carol"], removed=["alice"]))
+        writer.enqueue(presence(13, 3, added=["dave"]))
+
+        assert len(writer._queue) == 2 and writer.dropped == 2
+        merged = PresenceMessage.model_validate_json(writer._queue[0].text)
+        # In the first delta's place, so the chat frame after it is still new
+        assert merged.seq == writer._queue[0].seq == 10
+        assert merged.version == 3
+        assert merged.added == ["bob", "carol", "dave"]
+        assert merged.removed == ["alice"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from lg_st_ws.backend.llm_scheduler import LLMScheduler
+
+
+def rate_limit_error(retry_after: float) -> openai.RateLimitError:
+    response = httpx.Response(
+        429,
+        headers={"retry-after": str(retry_after)},
+        request=httpx.Request("POST", "http://llm.test/v1/chat/completions"),
+    )
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_waiting_threads_take_turns():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1)
+        release = asyncio.Event()
+        order = []
+
+        async def request(name: str):
+            order.append(name)
+            if name == "a1":
+                await release.wait()
+
+        calls = [asyncio.create_task(scheduler.call("a", lambda: request("a1")))]
+        await asyncio.sleep(0)
+        # A busy thread queues three calls before a quiet one queues two
+        for thread_id, name in [("a", "a2"), ("a", "a3"), ("a", "a4")]:
+            calls.append(
+                asyncio.create_task(
+                    scheduler.call(thread_id, lambda n=name: request(n))
+                )
+            )
+        for name in ("b1", "b2"):
+            calls.append(
+                asyncio.create_task(scheduler.call("b", lambda n=name: request(n)))
+            )
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth() == 5
+        release.set()
+        await asyncio.gather(*calls)
+        assert order == ["a1", "a2", "b1", "a3", "b2", "a4"]
+        assert scheduler.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_pauses_dispatch_for_every_thread():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        scheduler = LLMScheduler(max_concurrency=4, backoff=0.001)
+        started: dict[str, float] = {}
+        attempts = 0
+
+        async def limited():
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise rate_limit_error(0.2)
+            started["a"] = loop.time()
+            return "a"
+
+        async def other():
+            started["b"] = loop.time()
+            return "b"
+
+        limited_at = loop.time()
+        first = asyncio.create_task(scheduler.call("a", limited))
+        await asyncio.sleep(0.01)
+        # Free slots, but nothing is sent until the server's retry-after passes
+        second = asyncio.create_task(scheduler.call("b", other))
+        assert await asyncio.gather(first, second) == ["a", "b"]
+        assert started["b"] - limited_at >= 0.19
+        assert started["a"] - limited_at >= 0.19
+        assert scheduler.rate_limited == 1
+        assert scheduler.retries == 1
+
+    asyncio.run(scenario())
+
+
+def test_errors_that_are_not_retryable_are_raised_at_once():
+    async def scenario():
+        scheduler = LLMScheduler(backoff=0.001)
+        attempts = 0
+
+        async def broken():
+            nonlocal attempts
+            attempts += 1
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            await scheduler.call("a", broken)
+        assert attempts == 1
+        assert scheduler.retries == 0
+        assert scheduler.in_flight == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,26 @@
+from lg_st_ws.backend.metrics import Registry
+
+
+def test_counter_metadata_uses_the_sample_name():
+    registry = Registry()
+    registry.counter("requests", "Requests served.", lambda: 3)
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests served.",
+        "# TYPE requests_total counter",
+        "requests_total 3",
+    ]
+
+
+def test_label_values_and_help_are_escaped():
+    registry = Registry()
+    registry.counter(
+        "rejections",
+        "Back\\slash\nand newline.",
+        lambda: {'say "hi"\\\n': 1},
+        label="reason",
+    )
+    assert registry.render().splitlines() == [
+        "# HELP rejections_total Back\\\\slash\\nand newline.",
+        "# TYPE rejections_total counter",
+        'rejections_total{reason="say \\"hi\\"\\\\\\n"} 1',
+    ]
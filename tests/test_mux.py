@@ -0,0 +1,84 @@
+import asyncio
+import json
+import queue
+
+from starlette.websockets import WebSocketDisconnect
+
+from lg_st_ws.backend.fanout import SlowConsumerPolicy
+from lg_st_ws.backend.mux import MuxConnection
+from lg_st_ws.common.codec import Codec
+from lg_st_ws.common.models import MessageType, SystemEvent
+from lg_st_ws.frontend.ws_mux import WebSocketMux
+
+
+async def echo(socket, thread_id: str):
+    """Echo each frame's text back on its channel; fail on "boom"."""
+    await socket.receive_json()  # the handshake
+    while True:
+        try:
+            data = await socket.receive_json()
+        except WebSocketDisconnect:
+            return
+        if data["text"] == "boom":
+            raise RuntimeError("boom")
+        await socket.send_text(
+            json.dumps({"thread_id": thread_id, "text": data["text"]})
+        )
+
+
+def frame(channel: int, data) -> dict:
+    text = data if isinstance(data, str) else json.dumps(data)
+    return {"type": "websocket.receive", "text": f"{channel}\n{text}"}
+
+
+def test_failing_channel_leaves_the_others_open(make_ws):
+    async def scenario():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, ctx: errors.append(ctx)
+        )
+        ws = make_ws()
+        mux = MuxConnection(
+            ws, echo, max_queue=64, policy=SlowConsumerPolicy.drop_oldest
+        )
+        running = asyncio.create_task(mux.run())
+        for channel in (1, 2, 3):
+            handshake = {
+                "type": "handshake",
+                "username": "alice",
+                "thread_id": f"t{channel}",
+            }
+            ws.incoming.put_nowait(frame(channel, handshake))
+        ws.incoming.put_nowait(frame(1, {"text": "boom"}))  # the session raises
+        ws.incoming.put_nowait(frame(2, "{not json"))  # the frame can't be read
+        # No channel header to route by
+        ws.incoming.put_nowait({"type": "websocket.receive", "text": "x\n{}"})
+        await asyncio.sleep(0.05)
+        ws.incoming.put_nowait(frame(3, {"text": "still here"}))
+        await asyncio.sleep(0.05)
+
+        assert not running.done() and not mux.writer.closed
+        assert set(mux.channels) == {3}
+        assert "1\n" in ws.sent and "2\n" in ws.sent  # each closed on its own
+        assert '3\n{"thread_id": "t3", "text": "still here"}' in ws.sent
+        assert [type(e["exception"]) for e in errors] == [RuntimeError]
+
+        ws.incoming.put_nowait({"type": "websocket.disconnect"})
+        async with asyncio.timeout(1):
+            await running
+
+    asyncio.run(scenario())
+
+
+def test_failed_connection_tells_its_channels_why():
+    # Nothing listens on port 1, so the pooled connection fails to open
+    mux = WebSocketMux("ws://127.0.0.1:1/mux/ws", pool_size=1)
+    mux.loop.call_soon_threadsafe(mux.loop.set_exception_handler, lambda *_: None)
+    inbox = queue.SimpleQueue()
+    mux.open("t", json.dumps({"type": "handshake", "username": "alice"}), inbox)
+    event = Codec.decode(inbox.get(timeout=5))
+    assert event["type"] == MessageType.system_event
+    assert event["event"] == SystemEvent.ws_error
+    assert event["thread_id"] == "t"
+    assert inbox.get(timeout=5) is None
+    mux.loop.call_soon_threadsafe(mux.loop.stop)
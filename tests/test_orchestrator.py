@@ -0,0 +1,181 @@
+import asyncio
+
+import httpx
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+from lg_st_ws.backend.backplane import InProcessBackplane
+from lg_st_ws.backend.langgraph_orchestrator import LangGraphOrchestrator
+from lg_st_ws.backend.thread_manager import ThreadManager
+
+
+def say(text: str) -> HumanMessage:
+    return HumanMessage(
+        content=text,
+        metadata={"username": "alice", "timestamp": "2026-01-01T00:00:00Z"},
+    )
+
+
+def build_orchestrator(**kwargs) -> LangGraphOrchestrator:
+    return LangGraphOrchestrator(
+        "bot",
+        "",
+        "fake",
+        stream_tokens=False,
+        write_behind_delay=0.01,
+        http_client=httpx.AsyncClient(),
+        llm_factory=lambda: FakeListChatModel(responses=["hello"]),
+        **kwargs,
+    )
+
+
+def test_write_behind_batches_stay_in_order_around_a_mention():
+    async def scenario():
+        orchestrator = build_orchestrator()
+        thread_manager = ThreadManager(
+            backplane=InProcessBackplane(presence_window=0.01), heartbeat_interval=0
+        )
+        await thread_manager.start()
+        config = orchestrator.get_graph_config("t")
+
+        def submit(text: str):
+            orchestrator.submit("t", {"messages": [say(text)]}, config, thread_manager)
+
+        submit("one")
+        submit("two")
+        submit("@bot three")  # claims the open batch
+        submit("four")  # joins the run's input before it starts
+        assert orchestrator.is_busy("t")
+        history = await orchestrator.get_message_history("t")
+        assert [m["data"]["content"] for m in history.messages] == [
+            "one",
+            "two",
+            "@bot three",
+            "four",
+        ]
+        while "t" in orchestrator._next_run:
+            await asyncio.sleep(0.005)
+        submit("five")  # written behind the reply
+        await orchestrator.aclose()
+        await thread_manager.close()
+
+        state = await orchestrator.graph.aget_state(config)
+        contents = [m.content for m in state.values["messages"]]
+        assert contents == ["one", "two", "@bot three", "four", "hello", "five"]
+        assert not orchestrator.is_busy("t")
+
+    asyncio.run(scenario())
+
+
+def test_mention_on_an_idle_thread_starts_at_once():
+    async def scenario():
+        orchestrator = build_orchestrator()
+        thread_manager = ThreadManager(
+            backplane=InProcessBackplane(presence_window=0.01), heartbeat_interval=0
+        )
+        await thread_manager.start()
+        config = orchestrator.get_graph_config("t")
+
+        def submit(text: str):
+            orchestrator.submit("t", {"messages": [say(text)]}, config, thread_manager)
+
+        submit("@bot one")
+        await asyncio.sleep(0)
+        assert "t" not in orchestrator._next_run  # already running
+
+        # Mentions made while it runs share the one run queued behind it
+        submit("@bot two")
+        submit("@bot three")
+        assert orchestrator._next_run["t"] == [say("@bot two"), say("@bot three")]
+        await orchestrator.aclose()
+        await thread_manager.close()
+
+        state = await orchestrator.graph.aget_state(config)
+        contents = [m.content for m in state.values["messages"]]
+        assert contents == ["@bot one", "hello", "@bot two", "@bot three", "hello"]
+
+    asyncio.run(scenario())
+
+
+def test_handshake_leaves_search_catch_up_to_the_background():
+    async def scenario():
+        orchestrator = build_orchestrator()
+        await orchestrator.append("t", [say(f"message {i}") for i in range(300)])
+
+        page = await orchestrator.get_message_history("t")
+        assert page.cursor == 300 - orchestrator.history_page_size
+        assert not orchestrator.search_index.synced("t")
+
+        # A search waits for the catch-up the handshake started
+        results = await orchestrator.search("t", "message 299")
+        assert results.hits[0].position == 299
+        await orchestrator.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_history_pages_come_from_recent_messages(monkeypatch):
+    async def scenario():
+        orchestrator = build_orchestrator(
+            history_page_size=10, history_cache_messages=30
+        )
+        await orchestrator.append("t", [say(f"message {i}") for i in range(100)])
+        reads = 0
+        aget_state = orchestrator.graph.aget_state
+
+        async def counted(config):
+            nonlocal reads
+            reads += 1
+            return await aget_state(config)
+
+        monkeypatch.setattr(orchestrator.graph, "aget_state", counted)
+
+        def contents(page):
+            return [m["data"]["content"] for m in page.messages]
+
+        page = await orchestrator.get_message_history("t")
+        assert contents(page) == [f"message {i}" for i in range(90, 100)]
+        assert reads == 1  # the first read fills the cache
+
+        await orchestrator.append("t", [say("message 100")])
+        page = await orchestrator.get_message_history("t")
+        assert contents(page)[-1] == "message 100" and page.cursor == 91
+        page = await orchestrator.get_message_history("t", before=95)
+        assert contents(page) == [f"message {i}" for i in range(85, 95)]
+        assert reads == 1
+
+        # Older than the cached tail: read from the state
+        page = await orchestrator.get_message_history("t", before=20)
+        assert contents(page) == [f"message {i}" for i in range(10, 20)]
+        assert reads == 2
+        await orchestrator.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_fill_overtaken_by_a_write_is_not_kept(monkeypatch):
+    async def scenario():
+        orchestrator = build_orchestrator()
+        await orchestrator.append("t", [say("one")])
+        aget_state = orchestrator.graph.aget_state
+        read, resume = asyncio.Event(), asyncio.Event()
+
+        async def paused(config):
+            state = await aget_state(config)
+            read.set()
+            await resume.wait()
+            return state
+
+        monkeypatch.setattr(orchestrator.graph, "aget_state", paused)
+        reading = asyncio.create_task(orchestrator.get_message_history("t"))
+        await read.wait()
+        await orchestrator.append("t", [say("two")])  # missing from what was read
+        resume.set()
+        await reading
+
+        monkeypatch.setattr(orchestrator.graph, "aget_state", aget_state)
+        page = await orchestrator.get_message_history("t")
+        assert [m["data"]["content"] for m in page.messages] == ["one", "two"]
+        await orchestrator.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,28 @@
+import asyncio
+
+from lg_st_ws.backend.run_queue import ThreadRunQueue
+
+
+def test_failing_job_does_not_stall_the_thread():
+    async def scenario():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context["exception"])
+        )
+        ran = []
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def record():
+            ran.append("after")
+
+        queue = ThreadRunQueue()
+        queue.submit("t", fail)
+        queue.submit("t", record)
+        await queue.join()
+        assert ran == ["after"]
+        assert [str(e) for e in errors] == ["boom"]
+        assert not queue.busy("t")
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain_core.messages import HumanMessage
+
+from lg_st_ws.backend.search import SearchIndex
+
+
+def say(i: int, text: str) -> HumanMessage:
+    return HumanMessage(
+        id=f"m{i}",
+        content=text,
+        metadata={"username": "alice", "timestamp": "2026-01-01T00:00:00Z"},
+    )
+
+
+async def positions(index: SearchIndex, query: str) -> list[int]:
+    hits, _ = await index.search("t", query)
+    return sorted(hit.position for hit in hits)
+
+
+def test_messages_appended_after_catch_up_are_searchable():
+    async def scenario():
+        index = SearchIndex(chunk_size=2)
+        history = [say(i, f"history {i}") for i in range(5)]
+        # Written while the history was being read: held until it is indexed
+        await index.add("t", [say(5, "early pineapple")])
+        await index.catch_up("t", history)
+        assert await positions(index, "history") == [0, 1, 2, 3, 4]
+
+        await index.add("t", [say(6, "late pineapple"), say(7, "late banana")])
+        assert await positions(index, "pineapple") == [5, 6]
+        assert await positions(index, "banana") == [7]
+        hits, more = await index.search("t", "pineap")  # as typed
+        assert [h.message_id for h in hits] == ["m6", "m5"] and not more
+
+        # Already indexed messages are skipped, by id
+        await index.add("t", [say(7, "late banana")])
+        assert await positions(index, "banana") == [7]
+        index.close()
+
+    asyncio.run(scenario())
+
+
+def test_messages_added_during_catch_up_follow_the_history():
+    async def scenario():
+        index = SearchIndex(chunk_size=2)
+        history = [say(i, f"history {i}") for i in range(6)]
+        catching_up = asyncio.create_task(index.catch_up("t", history))
+        await asyncio.sleep(0)  # indexing its first chunk in a worker thread
+        await index.add("t", [say(6, "late pineapple")])
+        await catching_up
+        assert index.synced("t")
+        assert await positions(index, "pineapple") == [6]
+        index.close()
+
+    asyncio.run(scenario())
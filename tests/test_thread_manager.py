@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+from langchain_core.messages import AIMessage
+
+from lg_st_ws.backend.backplane import InProcessBackplane
+from lg_st_ws.backend.thread_manager import ThreadManager
+from lg_st_ws.common.models import ChatChunkMessage, ChatMessage
+
+
+def manager(**kwargs) -> ThreadManager:
+    return ThreadManager(
+        backplane=InProcessBackplane(presence_window=0.01),
+        heartbeat_interval=0,
+        **kwargs,
+    )
+
+
+def test_sole_user_reconnects_over_open_connection(make_ws):
+    async def scenario():
+        tm = manager()
+        await tm.start()
+        old, new = make_ws(), make_ws()
+        await tm.add_user("t", "alice", old)
+        await tm.add_user("t", "alice", new)
+        assert tm.get_connections("t") == [new]
+        assert "t" in tm.backplane.subscribed
+
+        # The old connection's handler cleans up after itself
+        await tm.remove_user("t", "alice", old)
+        assert tm.get_connections("t") == [new]
+        await asyncio.sleep(0.05)
+        assert (await tm.presence("t"))[0] == ["alice"]
+
+        await tm.remove_user("t", "alice", new)
+        await asyncio.sleep(0.05)
+        assert (await tm.presence("t"))[0] == []
+        await tm.close()
+
+    asyncio.run(scenario())
+
+
+def test_sole_user_resumes_after_disconnecting(make_ws):
+    async def scenario():
+        tm = manager(replay_grace=1.0)
+        await tm.start()
+        first = make_ws()
+        await tm.add_user("t", "alice", first)
+        tm._deliver("t", 1, '{"type":"chat"}', None)
+        await tm.remove_user("t", "alice", first)
+
+        # Broadcasts while nobody is connected are kept for the reconnect
+        tm._deliver("t", 2, '{"type":"chat"}', None)
+        second = make_ws()
+        assert await tm.add_user("t", "alice", second, last_seen_seq=1)
+        await asyncio.sleep(0)
+        assert second.sent == ['{"seq":2,"type":"chat"}']
+        await tm.remove_user("t", "alice", second)
+        await tm.close()
+
+    asyncio.run(scenario())
+
+
+def test_emptied_thread_is_released_after_grace(make_ws):
+    async def scenario():
+        tm = manager(replay_grace=0.01)
+        await tm.start()
+        ws = make_ws()
+        await tm.add_user("t", "alice", ws)
+        tm._deliver("t", 1, '{"type":"chat"}', None)
+        await tm.remove_user("t", "alice", ws)
+        assert "t" in tm.backplane.subscribed
+        await asyncio.sleep(0.05)
+        assert "t" not in tm.backplane.subscribed
+        assert "t" not in tm.replay
+        assert not await tm.add_user("t", "alice", make_ws(), last_seen_seq=1)
+        await tm.close()
+
+    asyncio.run(scenario())
+
+
+def test_reply_chunks_are_not_sequenced_or_replayed(make_ws):
+    async def scenario():
+        tm = manager()
+        await tm.start()
+        ws = make_ws()
+        await tm.add_user("t", "alice", ws)
+        chunk = ChatChunkMessage(
+            thread_id="t", message_id="m", username="bot", delta="hi"
+        )
+        for _ in range(3):
+            await tm.broadcast("t", chunk)
+        await tm.broadcast("t", ChatMessage.from_lc_message("t", AIMessage("hi")))
+        await asyncio.sleep(0)
+        assert [json.loads(text).get("seq") is None for text in ws.sent] == [
+            True,
+            True,
+            True,
+            False,
+        ]
+        assert len(tm.replay["t"].frames) == 1
+        await tm.remove_user("t", "alice", ws)
+        await tm.close()
+
+    asyncio.run(scenario())